@@ -18,8 +18,14 @@ setup(
         "Topic :: Scientific/Engineering :: Bio-Informatics",
         "License :: OSI Approved :: MIT License",
         "Intended Audience :: Science/Research",
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.7",
     ],
-    install_requires=["NumPy<=1.14.5", "SciPy", "pysam>=0.8.1", "BioPython", "scikit-learn", "click", "pandas"],
+    python_requires=">=3.6",
+    install_requires=["NumPy>=1.14", "SciPy", "pysam>=0.8.1", "scikit-learn", "click", "pandas"],
+    extras_require={"parquet": ["pyarrow"], "zstd": ["zstandard"]},
     long_description=open("README.rst").read(),
     entry_points={
         'console_scripts': [
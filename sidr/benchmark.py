@@ -0,0 +1,176 @@
+import click
+import json
+import multiprocessing
+import numpy
+import os
+import shutil
+import tempfile
+import time
+
+from sklearn.model_selection import StratifiedKFold
+
+from sidr import common
+from sidr import default
+from sidr import metrics
+from sidr import runfile
+from sidr import taxonomy
+
+_corpus = None  # (X, Y) of the corpus being benchmarked, set in each worker by initBenchmark()
+
+
+def initBenchmark(X, Y):
+    """
+    Stores the corpus in a benchmark worker so it is sent once per process
+    rather than once per classifier.
+
+    Args:
+        X: The corpus variables.
+        Y: The corpus class ids.
+    """
+    global _corpus
+    _corpus = (X, Y)
+
+
+def benchmarkWorker(args):
+    """
+    Cross-validates one classifier on the corpus set by initBenchmark().
+
+    The classifier is trained with a single job, as candidates already run in
+    parallel with each other. Peak memory is the worker's peak RSS while the
+    folds run, so it includes what the native tree builders allocate. It is reset
+    per classifier on Linux; elsewhere each classifier runs in a fresh worker
+    process, but in a serial run it is the peak since the run started.
+
+    Args:
+        args: A tuple of (estimator, nEstimators, maxDepth, folds, seed).
+    Returns:
+        result: A dictionary of the classifier's mean accuracy and its standard
+            deviation, mean fit and predict times in seconds per fold, predictions
+            per second and peak RSS in bytes.
+    """
+    estimator, nEstimators, maxDepth, folds, seed = args
+    X, Y = _corpus
+    accuracy = []
+    fitTime = 0.0
+    predictTime = 0.0
+    metrics.resetPeak()
+    for train, test in StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(X, Y):
+        classifier = common.buildClassifier(estimator, nEstimators, maxDepth, jobs=1)
+        start = time.perf_counter()
+        classifier.fit(X[train], Y[train])
+        fitTime += time.perf_counter() - start
+        start = time.perf_counter()
+        predicted = classifier.predict(X[test])
+        predictTime += time.perf_counter() - start
+        accuracy.append(float(numpy.mean(predicted == Y[test])))
+    return {
+        "classifier": estimator,
+        "name": common.CLASSIFIERS[estimator],
+        "accuracy": float(numpy.mean(accuracy)),
+        "accuracyStd": float(numpy.std(accuracy)),
+        "fitTime": fitTime / folds,
+        "predictTime": predictTime / folds,
+        "predictRate": len(Y) / predictTime if predictTime else 0.0,
+        "peakRSS": metrics.peakRSS(),
+    }
+
+
+def benchmarkClassifiers(corpus, estimators, folds=5, threads=1, nEstimators=None, maxDepth=None, seed=0):
+    """
+    Runs stratified cross-validation of each candidate classifier on the corpus,
+    one candidate per worker process.
+
+    Args:
+        corpus: A sidr.common.Corpus to cross-validate on.
+        estimators: A list of keys of sidr.common.CLASSIFIERS.
+        folds: Number of cross-validation folds.
+        threads: Number of worker processes to use.
+        nEstimators, maxDepth: Classifier options, see sidr.common.buildClassifier().
+        seed: Random seed for splitting the folds, shared by every candidate.
+    Returns:
+        results: A list of result dictionaries from benchmarkWorker(), in the order
+            of estimators.
+    """
+    tasks = [(estimator, nEstimators, maxDepth, folds, seed) for estimator in estimators]
+    if threads <= 1 or len(tasks) <= 1:
+        initBenchmark(corpus.X, corpus.Y)
+        with click.progressbar(tasks) as bar:
+            return [benchmarkWorker(task) for task in bar]
+    pool = multiprocessing.Pool(min(threads, len(tasks)), initBenchmark, (corpus.X, corpus.Y), maxtasksperchild=1)  # a fresh process per classifier, for its own peak RSS
+    try:
+        return pool.map(benchmarkWorker, tasks)
+    finally:
+        pool.terminate()
+
+
+def formatResults(results):
+    """
+    Lays out benchmark results as a plain text table, most accurate first.
+
+    Args:
+        results: A list of result dictionaries from benchmarkWorker().
+    Returns:
+        table: The table as a string.
+    """
+    rows = []
+    for result in sorted(results, key=lambda r: r["accuracy"], reverse=True):
+        rows.append([result["name"],
+                     "%.4f +/- %.4f" % (result["accuracy"], result["accuracyStd"]),
+                     "%.3f" % result["fitTime"],
+                     "%.3f" % result["predictTime"],
+                     "%.0f" % result["predictRate"],
+                     "%.1f" % (result["peakRSS"] / 1048576.0)])
+    return metrics.formatTable(rows, ["Classifier", "Accuracy", "Fit (s)", "Predict (s)", "Contigs/s", "Peak RSS (MB)"])
+
+
+def runBenchmark(contigs, binary, target, estimators, folds, threads, nEstimators, maxDepth, output, asJSON):
+    corpus, testdata, features = common.constructCorpus(contigs, binary, target)
+    click.echo("Corpus constucted, %d contigs in corpus" % len(corpus.Y), err=True)
+    results = benchmarkClassifiers(corpus, estimators, folds, threads, nEstimators, maxDepth)
+    report = json.dumps(results, indent=2) if asJSON else formatResults(results)
+    if output:
+        with open(output, "w") as out:
+            out.write(report + "\n")
+    else:
+        click.echo(report)
+
+
+def benchmarkStages(dataset, threads=1, kmer=None, estimator="bagging", level="phylum", output=None):
+    """
+    Times each stage of default mode, then runfile loading, on a dataset from
+    sidr.synthetic. Caches are cleared first so every stage does its full work.
+
+    Args:
+        dataset: A sidr.synthetic.Dataset.
+        threads: Number of worker processes to use.
+        kmer: Length of k-mers to add frequencies for, or None.
+        estimator: The classifier to train, see sidr.common.buildClassifier().
+        level: The classification level.
+        output: File to write the classifications to, or None to write them to a
+            temporary directory, leaving the dataset untouched.
+    Returns:
+        recorder: A sidr.metrics.Recorder holding the time and peak RSS of each stage.
+    """
+    shutil.rmtree(os.path.join(dataset.taxdump, taxonomy.INDEX_NAME), ignore_errors=True)
+    recorder = metrics.Recorder()
+    with recorder.stage("taxdump") as record:
+        taxdump = common.parseTaxdump(dataset.taxdump)
+        record["items"] = len(taxdump)
+    with recorder.stage("fasta") as record:
+        contigs = default.readFasta(dataset.fasta, threads, kmer)
+        record["items"] = len(contigs)
+    with recorder.stage("bam", len(contigs)):
+        default.readBAM(dataset.bam, contigs, threads, useCache=False)
+    with recorder.stage("blast", len(contigs)):
+        default.readBLAST(dataset.blast, taxdump, level, contigs, threads=threads)
+    with recorder.stage("corpus", len(contigs)):
+        corpus, testdata, features = common.constructCorpus(contigs, False, dataset.target)
+    with recorder.stage("train", len(corpus.Y)):
+        classifier = common.constructModel(corpus, features, False, estimator, jobs=threads)
+    with tempfile.TemporaryDirectory() as scratch, recorder.stage("output", len(contigs)):
+        result = recorder.timed("predict", common.classifyData(classifier, testdata, corpus.classNames, threads=threads), lambda batch: len(batch[0]))
+        common.generateOutput("", "", result, contigs, dataset.target.lower(), output or os.path.join(scratch, "classifications.txt"), corpus.classNames)
+    del contigs, corpus, testdata
+    with recorder.stage("runfile") as record:
+        record["items"] = len(runfile.readRunfile(dataset.runfile, lambda origins: taxdump, level))
+    return recorder
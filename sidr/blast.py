@@ -0,0 +1,142 @@
+import click
+import multiprocessing
+import os
+
+from collections import OrderedDict
+
+_shardContigs = None  # contigIDs known to a shard worker, set by initShard()
+
+
+def firstHits(lines, contigs=None, idColumn=0, taxidColumn=1):
+    """
+    Picks the first hit for each contig out of BLAST tabular output, assuming
+    that the first hit reported is the best. Later hits for a contig are skipped
+    without being split past the query ID.
+
+    Args:
+        lines: An iterable of lines of tabular BLAST output.
+        contigs: A dictionary (or set) of the contigIDs in the input FASTA, or
+            None to keep the first hit of every query.
+        idColumn: Zero-based column holding the query (contig) ID.
+        taxidColumn: Zero-based column holding the subject taxids.
+    Returns:
+        hits: An OrderedDict mapping contigIDs to the taxid string of their
+            first hit, in the order the contigs first appear.
+        unmatched: A dictionary mapping query IDs that are not in the FASTA to
+            the number of hits reported for them.
+    """
+    hits = OrderedDict()
+    unmatched = {}
+    maxsplit = max(idColumn, taxidColumn) + 1
+    for line in lines:
+        if not line.strip() or line.startswith("#"):
+            continue
+        if idColumn == 0:  # the common case, avoid splitting lines that will be thrown away
+            contig = line[:line.find("\t")]
+            if contig in hits:
+                continue
+        record = line.rstrip("\r\n").split("\t", maxsplit)
+        contig = record[idColumn]
+        if contig in hits:
+            continue
+        if contigs is not None and contig not in contigs:  # a contig is in BLAST but not FASTA (should be impossible but)
+            unmatched[contig] = unmatched.get(contig, 0) + 1
+            continue
+        hits[contig] = record[taxidColumn].strip()
+    return hits, unmatched
+
+
+def shardOffsets(blastFile, shards):
+    """
+    Splits a file into byte ranges that start and end on line boundaries.
+
+    Args:
+        blastFile: The path to an uncompressed BLAST result file.
+        shards: The number of ranges to aim for.
+    Returns:
+        ranges: A list of (start, end) byte offsets in file order, covering the whole file.
+    """
+    size = os.path.getsize(blastFile)
+    starts = [0]
+    with open(blastFile, "rb") as f:
+        for idx in range(1, shards):
+            f.seek(max(size * idx // shards - 1, starts[-1]))
+            f.readline()  # move to the start of the next line
+            if f.tell() >= size:
+                break
+            if f.tell() > starts[-1]:
+                starts.append(f.tell())
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def readRange(blastFile, start, end):
+    """
+    Reads the lines of a byte range of a file.
+
+    Args:
+        blastFile: The path to the file.
+        start: Offset of the first line.
+        end: Offset just past the last line.
+    Yields:
+        line: Each line in the range, decoded as text.
+    """
+    with open(blastFile, "rb") as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode("utf-8")
+
+
+def initShard(contigIDs):  # runs once per worker so the contig set is only sent once
+    global _shardContigs
+    _shardContigs = contigIDs
+
+
+def shardWorker(args):
+    """
+    Picks the first hit for each contig within one byte range of a BLAST file.
+
+    Args:
+        args: A tuple of (blastFile, start, end, idColumn, taxidColumn).
+    Returns:
+        hits: As firstHits(), for this range only.
+    """
+    blastFile, start, end, idColumn, taxidColumn = args
+    return firstHits(readRange(blastFile, start, end), _shardContigs, idColumn, taxidColumn)
+
+
+def shardedFirstHits(blastFile, contigs, threads, idColumn=0, taxidColumn=1):
+    """
+    Picks the first hit for each contig by parsing line-aligned byte ranges of
+    the BLAST file in worker processes. Ranges are merged in file order, so each
+    contig keeps the hit with the lowest file offset, as in a serial read.
+
+    Args:
+        blastFile: The path to an uncompressed BLAST result file.
+        contigs: A dictionary (or set) of the contigIDs in the input FASTA, or None.
+        threads: Number of worker processes to use.
+        idColumn: Zero-based column holding the query (contig) ID.
+        taxidColumn: Zero-based column holding the subject taxids.
+    Returns:
+        hits, unmatched: As firstHits().
+    """
+    ranges = shardOffsets(blastFile, threads * 4)
+    hits = OrderedDict()
+    unmatched = {}
+    pool = multiprocessing.Pool(threads, initShard, (None if contigs is None else frozenset(contigs),))
+    try:
+        with click.progressbar(length=len(ranges)) as bar:
+            for shardHits, shardUnmatched in pool.imap(shardWorker, [(blastFile, start, end, idColumn, taxidColumn) for start, end in ranges]):
+                for contig, taxid in shardHits.items():
+                    if contig not in hits:
+                        hits[contig] = taxid
+                for contig, count in shardUnmatched.items():
+                    unmatched[contig] = unmatched.get(contig, 0) + count
+                bar.update(1)
+    finally:
+        pool.terminate()
+    return hits, unmatched
@@ -0,0 +1,96 @@
+import click
+import glob
+import hashlib
+import json
+import os
+
+from sidr import common
+from sidr import files
+
+CHECKPOINT_VERSION = 1  # bump when a stage's output changes
+
+
+def stageKey(*parts):
+    """
+    Combines a stage's inputs and parameters into its checkpoint key.
+
+    Args:
+        parts: JSON-serializable inputs and parameters, usually including the key
+            of the stage before.
+    Returns:
+        key: A hex digest.
+    """
+    return hashlib.sha1(json.dumps([CHECKPOINT_VERSION] + list(parts), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Checkpoints(object):  # stage outputs saved in a work directory, keyed by their inputs
+    def __init__(self, workdir, resume=True):
+        """
+        Args:
+            workdir: Directory to keep checkpoints in, or None to disable checkpointing.
+            resume: Set False to recompute every stage, still saving checkpoints.
+        """
+        self.workdir = workdir
+        self.resume = resume
+        if workdir and not os.path.isdir(workdir):
+            os.makedirs(workdir)
+
+    def path(self, stage, key, extension):
+        return os.path.join(self.workdir, "%s-%s%s" % (stage, key, extension))
+
+    def load(self, stage, key, extension, loader):
+        """
+        Loads a stage's checkpoint if one exists for this key.
+
+        Args:
+            stage: The stage name.
+            key: The stage's key, from stageKey().
+            extension: The checkpoint file extension.
+            loader: Function reading the checkpoint from its path.
+        Returns:
+            output: The stage's output, or None if it has to be recomputed.
+        """
+        if not self.workdir or not self.resume:
+            return None
+        path = self.path(stage, key, extension)
+        if not os.path.isfile(path):
+            return None
+        try:
+            output = loader(path)
+        except Exception as e:  # a damaged checkpoint just means recomputing the stage
+            click.echo("Ignoring unreadable checkpoint %s: %s" % (path, e))
+            return None
+        click.echo("Resumed %s from %s" % (stage, path))
+        return output
+
+    def save(self, stage, key, extension, saver, output):
+        """
+        Saves a stage's checkpoint atomically, removing checkpoints of the same
+        stage with other keys.
+
+        Args:
+            stage: The stage name.
+            key: The stage's key, from stageKey().
+            extension: The checkpoint file extension.
+            saver: Function writing output to a path.
+            output: The stage's output.
+        """
+        if not self.workdir:
+            return
+        path = self.path(stage, key, extension)
+        files.atomicWrite(path, lambda tmpPath: saver(tmpPath, output))
+        for stale in glob.glob(self.path(stage, "*", extension)):
+            if stale != path:
+                os.remove(stale)
+
+    def loadContigs(self, stage, key):
+        return self.load(stage, key, ".npz", common.ContigStore.load)
+
+    def saveContigs(self, stage, key, contigs):
+        self.save(stage, key, ".npz", lambda path, store: store.save(path), contigs)
+
+    def loadModel(self, key):
+        return self.load("model", key, ".pkl", common.loadModel)
+
+    def saveModel(self, key, model):
+        self.save("model", key, ".pkl", common.saveModel, model)
@@ -1,14 +1,24 @@
 #!/usr/bin/python
 import click
 import os
+import tarfile
 
+from sidr import benchmark
+from sidr import common
 from sidr import default
+from sidr import filterReads
+from sidr import metrics
+from sidr import predict
 from sidr import runfile
+from sidr import synthetic
+from sidr import taxonomy
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
 
 def validate_taxdump(value, method):
+    if value and os.path.isfile(value) and tarfile.is_tarfile(value):  # taxdump.tar.gz, read without extracting
+        return value
     if (os.path.isfile("%s/%s" % (value, "names.dmp")) and
         os.path.isfile("%s/%s" % (value, "nodes.dmp")) and
         os.path.isfile("%s/%s" % (value, "merged.dmp")) and
@@ -17,7 +27,39 @@ def validate_taxdump(value, method):
     else:
         with click.Context(method) as ctx:
             click.echo(ctx.get_help())
-            raise click.BadParameter("Could not find names.dmp in taxdump, specify a value or make sure the files are present")
+            raise click.BadParameter("Could not find names.dmp in taxdump, specify a value or make sure the files are present, or give the path to taxdump.tar.gz")
+
+
+def validate_jobs(ctx, param, value):
+    if value == -1 or value >= 1:
+        return value
+    raise click.BadParameter("must be -1, for every core, or at least 1")
+
+
+def model_options(command):
+    """
+    Adds the classifier options shared by every command that trains a model.
+    """
+    command = click.option('--classifier', 'estimator', type=click.Choice(sorted(common.CLASSIFIERS)), default="bagging", help="Classifier to train: bagging (the default), random forest, gradient boosting or histogram gradient boosting, which is best suited to corpora of millions of contigs.")(command)
+    command = click.option('--n-estimators', 'nEstimators', type=click.IntRange(min=1), default=None, help="Number of trees, or boosting iterations, in the classifier.")(command)
+    command = click.option('--max-depth', 'maxDepth', type=click.IntRange(min=1), default=None, help="Maximum depth of each tree in the classifier.")(command)
+    command = click.option('--jobs', '-j', type=int, default=-1, callback=validate_jobs, help="Number of parallel jobs used to train the classifier. Default is -1, every core.")(command)
+    command = click.option('--save-model', 'modelFile', type=click.Path(dir_okay=False), default=None, help="Location to save the trained model, for use with 'sidr predict' (optional).")(command)
+    return command
+
+
+def schema_options(command):
+    """
+    Adds the options describing the columns of a runfile.
+    """
+    command = click.option('--id-col', 'idColumn', default="ID", help="Runfile column holding the contigID. Default is 'ID'.")(command)
+    command = click.option('--origin-col', 'originColumn', default="Origin", help="Runfile column holding the organism identified by BLAST. Default is 'Origin'.")(command)
+    command = click.option('--features', 'featureColumns', default=None, help="Comma-separated runfile columns to use as variables. Default is every other column except Covered_bases, Plus_reads and Minus_reads.")(command)
+    return command
+
+
+def runfile_schema(idColumn, originColumn, featureColumns):
+    return runfile.Schema(idColumn, originColumn, [column.strip() for column in featureColumns.split(",")] if featureColumns else None)
 
 
 @click.group()
@@ -36,7 +78,7 @@ def cli():
 @click.option('--bam', '-b', type=click.Path(exists=True), help="Alignment of reads to preliminary assembly, in BAM format.")
 @click.option('--fasta', '-f', type=click.Path(exists=True), help="Preliminary assembly, in FASTA format.")
 @click.option('--blastresults', '-r', type=click.Path(exists=True), help="Classification of preliminary assembly from BLAST (or similar tools).")
-@click.option('--taxdump', '-d', type=click.Path(), default=os.environ.get('BLASTDB'), help="Location of the NCBI Taxonomy dump. Default is $BLASTDB.")
+@click.option('--taxdump', '-d', type=click.Path(), default=os.environ.get('BLASTDB'), help="Location of the NCBI Taxonomy dump, extracted or as taxdump.tar.gz. Default is $BLASTDB.")
 #@click.option('--model', '-m', 'modelOutput', type=click.Path(), default="", help="Location to save a graphical representation of the trained decision tree (optional). Output is in the form of a DOT file.")
 @click.option('--output', '-o', type=click.Path(), default="%s/classifications.txt" % os.getcwd())
 @click.option('--tokeep', '-k', type=click.Path(), default="", help="Location to save the contigs identified as the target organism(optional).")
@@ -44,19 +86,40 @@ def cli():
 @click.option('--binary', is_flag=True, help="Use binary target/nontarget classification.")
 @click.option('--target', '-t', help="The identity of the target organism at the chosen classification level. It is recommended to use the organism's phylum.")
 @click.option('--level', '-l', default="phylum", help="The classification level to use when constructing the model. Default is 'phylum'.")
+@click.option('--threads', '-p', type=click.IntRange(min=1), default=1, help="Number of worker processes to use. Default is 1.")
+@click.option('--cache-dir', 'cacheDir', type=click.Path(file_okay=False), default=None, help="Directory to cache coverage and the taxdump index in. Default is beside the BAM file and taxdump.")
+@click.option('--no-cache', 'noCache', is_flag=True, help="Recompute coverage even if a cached copy exists, and ignore --workdir checkpoints.")
+@click.option('--kmer', type=click.IntRange(1, 6), default=None, help="Add canonical k-mer frequencies of this length (e.g. 4 for tetranucleotide frequency) to the model's variables.")
+@click.option('--qseqid-col', 'qseqidCol', type=click.IntRange(min=1), default=1, help="Column of the BLAST results holding the contigID. Default is 1.")
+@click.option('--staxids-col', 'staxidsCol', type=click.IntRange(min=1), default=2, help="Column of the BLAST results holding the NCBI taxid. Default is 2.")
+@click.option('--workdir', '-w', type=click.Path(file_okay=False), default=None, help="Directory to checkpoint each stage in, so a rerun resumes from the last completed stage (optional).")
+@click.option('--lazy-taxonomy', 'lazyTaxonomy', is_flag=True, help="Load only the lineages of the taxa seen in the BLAST results, rather than the whole taxdump. No index is compiled if there isn't one already.")
+@click.option('--sequential', is_flag=True, help="Read the taxdump, FASTA, BAM and BLAST files one after another in a single process, rather than side by side. Always the case with -p 1.")
+@click.option('--profile', is_flag=True, help="Report the time, CPU time, peak memory and throughput of each stage at the end of the run.")
+@click.option('--metrics-json', 'metricsJSON', type=click.Path(dir_okay=False), default=None, help="Location to save the metrics of each stage as JSON (optional).")
+@click.option('--profile-stage', 'profileStage', type=click.Choice(metrics.STAGES), default=None, help="Run one stage under cProfile and tracemalloc, writing sidr-[stage].prof and sidr-[stage].tracemalloc.txt.")
+@click.option('--profile-dir', 'profileDir', type=click.Path(file_okay=False), default=".", help="Directory for the --profile-stage dumps. Default is the current directory.")
+@click.option('--save-features', 'featureOutput', type=click.Path(dir_okay=False), default=None, help="Location to save the contigs' variables and BLAST classifications, for use with benchmark-models (optional).")
+@model_options
 # @click.option('--verbose', '-v', count=True, help="Output more debugging options, repeat to increase verbosity (unimplemented).")
-def default_runner(bam, fasta, blastresults, taxdump, output, tokeep, toremove, binary, target, level):
+def default_runner(bam, fasta, blastresults, taxdump, output, tokeep, toremove, binary, target, level, threads, cacheDir, noCache, kmer, qseqidCol, staxidsCol, workdir, lazyTaxonomy, sequential, profile, metricsJSON, profileStage, profileDir, featureOutput, estimator, nEstimators, maxDepth, jobs, modelFile):
     """
     Runs the default analysis using raw preassembly data.
     """
     modelOutput = False
     validate_taxdump(taxdump, default_runner)
-    default.runAnalysis(bam, fasta, blastresults, taxdump, modelOutput, output, tokeep, toremove, binary, target, level)
+    recorder = metrics.Recorder(profileStage, profileDir)
+    default.runAnalysis(bam, fasta, blastresults, taxdump, modelOutput, output, tokeep, toremove, binary, target, level, threads, cacheDir, not noCache, kmer, qseqidCol - 1, staxidsCol - 1,
+                        dict(estimator=estimator, nEstimators=nEstimators, maxDepth=maxDepth, jobs=jobs), featureOutput, modelFile, recorder, workdir, not sequential, lazyTaxonomy)
+    if metricsJSON:
+        recorder.writeJSON(metricsJSON)
+    if profile:
+        click.echo(recorder.table())
 
 
 @cli.command(name="runfile", context_settings=CONTEXT_SETTINGS)
 @click.option('--infile', '-i', type=click.Path(exists=True), help="Comma-delimited input file.")
-@click.option('--taxdump', '-d', type=click.Path(), default=os.environ.get('BLASTDB'), help="Location of the NCBI Taxonomy dump. Default is $BLASTDB.")
+@click.option('--taxdump', '-d', type=click.Path(), default=os.environ.get('BLASTDB'), help="Location of the NCBI Taxonomy dump, extracted or as taxdump.tar.gz. Default is $BLASTDB.")
 @click.option('--output', '-o', type=click.Path(), default="%s/classifications.txt" % os.getcwd())
 #@click.option('--model', '-m', 'modelOutput', type=click.Path(), default="", help="Location to save a graphical representation of the trained decision tree (optional). Output is in the form of a DOT file.")
 @click.option('--tokeep', '-k', type=click.Path(), default="", help="Location to save the contigs identified as the target organism(optional).")
@@ -64,7 +127,10 @@ def default_runner(bam, fasta, blastresults, taxdump, output, tokeep, toremove,
 @click.option('--target', '-t', help="The identity of the target organism at the chosen classification level. It is recommended to use the organism's phylum.")
 @click.option('--binary', is_flag=True, help="Use binary target/nontarget classification.")
 @click.option('--level', '-l', default="phylum", help="The classification level to use when constructing the model. Default is 'phylum'.")
-def runfile_runner(infile, taxdump, output, tokeep, toremove, binary, target, level):
+@click.option('--lazy-taxonomy', 'lazyTaxonomy', is_flag=True, help="Load only the lineages of the taxa named in the Origin column, rather than the whole taxdump. No index is compiled if there isn't one already.")
+@schema_options
+@model_options
+def runfile_runner(infile, taxdump, output, tokeep, toremove, binary, target, level, lazyTaxonomy, idColumn, originColumn, featureColumns, estimator, nEstimators, maxDepth, jobs, modelFile):
     """
     Runs a custom analysis using pre-computed data from BBMap or other sources.
 
@@ -72,22 +138,130 @@ def runfile_runner(infile, taxdump, output, tokeep, toremove, binary, target, le
     """
     modelOutput = False
     validate_taxdump(taxdump, runfile_runner)
-    runfile.runAnalysis(taxdump, infile, level, modelOutput, output, tokeep, toremove, binary, target)
+    runfile.runAnalysis(taxdump, infile, level, modelOutput, output, tokeep, toremove, binary, target,
+                        dict(estimator=estimator, nEstimators=nEstimators, maxDepth=maxDepth, jobs=jobs), modelFile,
+                        runfile_schema(idColumn, originColumn, featureColumns), lazyTaxonomy)
+
+
+@cli.command(name="index", context_settings=CONTEXT_SETTINGS)
+@click.option('--taxdump', '-d', type=click.Path(), default=os.environ.get('BLASTDB'), help="Location of the NCBI Taxonomy dump, extracted or as taxdump.tar.gz. Default is $BLASTDB.")
+def index_runner(taxdump):
+    """
+    Compiles the NCBI Taxonomy dump into SIDR's binary index ahead of time.
+
+    The index is otherwise built on the first run against a taxdump and rebuilt whenever the taxdump changes.
+    """
+    validate_taxdump(taxdump, index_runner)
+    indexDir = taxonomy.indexPath(taxdump)
+    taxonomy.compileTaxdump(taxdump, indexDir)
+    click.echo("Taxdump index written to %s" % indexDir)
+
+
+@cli.command(name="predict", context_settings=CONTEXT_SETTINGS)
+@click.option('--model', '-m', 'modelFile', type=click.Path(exists=True, dir_okay=False), required=True, help="Model saved by 'sidr default' or 'sidr runfile' with --save-model.")
+@click.option('--fasta', '-f', type=click.Path(exists=True), help="Assembly to classify, for models trained in default mode.")
+@click.option('--bam', '-b', type=click.Path(exists=True), help="Alignment of reads to the assembly, in BAM format, if the model uses coverage.")
+@click.option('--infile', '-i', type=click.Path(exists=True), help="Comma-delimited file of variables to classify, for models trained in runfile mode.")
+@click.option('--output', '-o', type=click.Path(), default="%s/classifications.txt" % os.getcwd())
+@click.option('--tokeep', '-k', type=click.Path(), default="", help="Location to save the contigs identified as the target organism(optional).")
+@click.option('--toremove', '-x', type=click.Path(), default="", help="Location to save the contigs identified as not belonging to the target organism (optional).")
+@click.option('--target', '-t', default=None, help="The identity of the target organism. Default is the target the model was trained with.")
+@click.option('--threads', '-p', type=click.IntRange(min=1), default=1, help="Number of worker processes to use. Default is 1.")
+@click.option('--cache-dir', 'cacheDir', type=click.Path(file_okay=False), default=None, help="Directory to cache coverage in. Default is beside the BAM file.")
+@click.option('--no-cache', 'noCache', is_flag=True, help="Recompute coverage even if a cached copy exists.")
+@click.option('--id-col', 'idColumn', default="ID", help="Runfile column holding the contigID. Default is 'ID'.")
+def predict_runner(modelFile, fasta, bam, infile, output, tokeep, toremove, target, threads, cacheDir, noCache, idColumn):
+    """
+    Classifies a new assembly with a saved model, without retraining.
+
+    Only the variables the model uses are computed, and no taxdump or BLAST results are needed.
+    """
+    if bool(fasta) == bool(infile):
+        raise click.UsageError("Give exactly one of --fasta or --infile.")
+    predict.runAnalysis(modelFile, output, tokeep, toremove, fasta, bam, infile, target, threads, cacheDir, not noCache, idColumn)
+
+
+@cli.command(name="benchmark-models", context_settings=CONTEXT_SETTINGS)
+@click.option('--infile', '-i', type=click.Path(exists=True), help="Comma-delimited runfile to benchmark on.")
+@click.option('--features', '-f', type=click.Path(exists=True, dir_okay=False), help="Features saved by 'sidr default --save-features' to benchmark on.")
+@click.option('--taxdump', '-d', type=click.Path(), default=os.environ.get('BLASTDB'), help="Location of the NCBI Taxonomy dump, extracted or as taxdump.tar.gz, needed with --infile. Default is $BLASTDB.")
+@click.option('--level', '-l', default="phylum", help="The classification level to use with --infile. Default is 'phylum'.")
+@click.option('--binary', is_flag=True, help="Use binary target/nontarget classification.")
+@click.option('--target', '-t', help="The identity of the target organism at the chosen classification level, needed with --binary.")
+@click.option('--classifier', 'estimators', type=click.Choice(sorted(common.CLASSIFIERS)), multiple=True, help="Classifier to benchmark, may be repeated. Default is every classifier.")
+@click.option('--n-estimators', 'nEstimators', type=click.IntRange(min=1), default=None, help="Number of trees, or boosting iterations, in each classifier.")
+@click.option('--max-depth', 'maxDepth', type=click.IntRange(min=1), default=None, help="Maximum depth of each tree in each classifier.")
+@click.option('--folds', type=click.IntRange(min=2), default=5, help="Number of stratified cross-validation folds. Default is 5.")
+@click.option('--threads', '-p', type=click.IntRange(min=1), default=1, help="Number of classifiers to benchmark in parallel. Default is 1.")
+@click.option('--json', 'asJSON', is_flag=True, help="Report results as JSON instead of a table.")
+@click.option('--output', '-o', type=click.Path(), default=None, help="Location to save the report. Default is standard output.")
+@schema_options
+def benchmark_runner(infile, features, taxdump, level, binary, target, estimators, nEstimators, maxDepth, folds, threads, asJSON, output, idColumn, originColumn, featureColumns):
+    """
+    Compares the accuracy, speed and memory use of each classifier by cross-validation.
+    """
+    if bool(infile) == bool(features):
+        raise click.UsageError("Give exactly one of --infile or --features.")
+    if binary and not target:
+        raise click.UsageError("--binary needs a --target.")
+    if infile:
+        validate_taxdump(taxdump, benchmark_runner)
+        contigs = runfile.readRunfile(infile, lambda origins: common.parseTaxdump(taxdump), level.lower(), schema=runfile_schema(idColumn, originColumn, featureColumns))
+    else:
+        contigs = common.ContigStore.load(features)
+    benchmark.runBenchmark(contigs, binary, target, list(estimators) or sorted(common.CLASSIFIERS), folds, threads, nEstimators, maxDepth, output, asJSON)
+
+
+@cli.command(name="synthesize", context_settings=CONTEXT_SETTINGS)
+@click.option('--outdir', '-o', type=click.Path(file_okay=False), required=True, help="Directory to write the dataset to.")
+@click.option('--contigs', '-n', type=click.IntRange(min=1), default=1000, help="Number of contigs. Default is 1000.")
+@click.option('--phyla', type=click.IntRange(min=1), default=4, help="Number of phyla. Default is 4.")
+@click.option('--mean-length', 'meanLength', type=click.IntRange(min=1), default=5000, help="Mean contig length. Default is 5000.")
+@click.option('--coverage', type=click.FloatRange(min=0), default=10, help="Mean read depth. Default is 10.")
+@click.option('--classified', type=click.FloatRange(0, 1), default=0.7, help="Fraction of contigs with BLAST hits. Default is 0.7.")
+@click.option('--seed', type=int, default=0, help="Random seed. Default is 0.")
+def synthesize_runner(outdir, contigs, phyla, meanLength, coverage, classified, seed):
+    """
+    Generates a synthetic taxdump, assembly, BAM, BLAST results and runfile for testing and benchmarking.
+    """
+    dataset = synthetic.generate(outdir, contigs, phyla, meanLength=meanLength, coverage=coverage, classified=classified, seed=seed)
+    click.echo("Dataset written to %s, the target is %s" % (outdir, dataset.target))
+
+
+@cli.command(name="benchmark-stages", context_settings=CONTEXT_SETTINGS)
+@click.option('--outdir', '-o', type=click.Path(file_okay=False), required=True, help="Directory of a dataset from 'sidr synthesize', generated there if missing.")
+@click.option('--contigs', '-n', type=click.IntRange(min=1), default=1000, help="Number of contigs if generating the dataset. Default is 1000.")
+@click.option('--threads', '-p', type=click.IntRange(min=1), default=1, help="Number of worker processes to use. Default is 1.")
+@click.option('--kmer', type=click.IntRange(1, 6), default=None, help="Add canonical k-mer frequencies of this length to the variables.")
+@click.option('--classifier', 'estimator', type=click.Choice(sorted(common.CLASSIFIERS)), default="bagging", help="Classifier to train. Default is bagging.")
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help="File to keep the classifications in. By default they are written to a temporary directory and discarded.")
+@click.option('--json', 'asJSON', is_flag=True, help="Report results as JSON instead of a table.")
+def benchmark_stages_runner(outdir, contigs, threads, kmer, estimator, output, asJSON):
+    """
+    Measures the wall time, CPU time and peak memory of every stage on a synthetic dataset.
+    """
+    dataset = synthetic.datasetPaths(outdir)
+    if not all(os.path.exists(path) for path in synthetic.datasetFiles(dataset)):
+        dataset = synthetic.generate(outdir, contigs)
+    recorder = benchmark.benchmarkStages(dataset, threads, kmer, estimator, output=output)
+    click.echo(recorder.toJSON() if asJSON else recorder.table())
+
 
-""" WIP
 @cli.command(name="filter", context_settings=CONTEXT_SETTINGS)
-@click.option('--tokeep', '-k', type=click.Path(), default="", help="File containing list of contigs from the alignment to keep.")
-@click.option('--bam', '-b', type=click.Path(exists=True), help="Alignment of reads to preliminary assembly, in BAM format.")
-@click.option('-i1', type=click.Path(exists=True), help="Right read fastq to extract reads from.")
-@click.option('-i2', type=click.Path(exists=True), help="Left read fastq to extract reads from.")
-@click.option('-o1', type=click.Path(), help="Right read fastq to extract reads to.")
-@click.option('-o2', type=click.Path(), help="Left read fastq to extract reads to.")
-def filter_runner(tokeep, bam, i1, i2, o1, o2):
-"""
-#Filters reads aligning to the given contigs.
-"""
-    filterReads.runFilter(tokeep, bam, i1, i2, o1, o2)
+@click.option('--tokeep', '-k', type=click.Path(exists=True), required=True, help="File containing list of contigs from the alignment to keep.")
+@click.option('--bam', '-b', type=click.Path(exists=True), required=True, help="Alignment of reads to preliminary assembly, in BAM format.")
+@click.option('-o1', 'output1', type=click.Path(), required=True, help="Fastq to extract the first read of each pair to. Gzipped if it ends in .gz.")
+@click.option('-o2', 'output2', type=click.Path(), required=True, help="Fastq to extract the second read of each pair to. Gzipped if it ends in .gz.")
+@click.option('-o0', 'singletons', type=click.Path(), default=None, help="Fastq to extract kept reads without a mate to (optional).")
+@click.option('--threads', '-p', type=click.IntRange(min=1), default=1, help="Number of compression and decompression threads to use. Default is 1.")
+def filter_runner(tokeep, bam, output1, output2, singletons, threads):
+    """
+    Filters reads aligning to the given contigs.
+
+    Pairs where either mate aligns to a kept contig are written to paired fastq files. A coordinate-sorted BAM is collated on disk first so mates can be paired.
+    """
+    filterReads.runFilter(tokeep, bam, output1, output2, singletons, threads)
+
 
 if __name__ == "__main__":  # TODO Setuptools
     cli(prog_name="sidr")
-""" 
@@ -1,239 +1,505 @@
 import click
-import csv
+import multiprocessing
+import numpy
+import pickle
+import sklearn
 
+from collections import deque
+from collections import namedtuple
+from contextlib import ExitStack
 from sklearn import tree
 from sklearn import ensemble
 
-try: # later versions of sklearn move the scoring tools
-    from sklearn import model_selection as mscv
-except ImportError:
-    from sklearn import cross_validation as mscv
+from sidr import taxonomy
+from sidr import writers
 
+Corpus = namedtuple("Corpus", ["X", "Y", "classNames"])  # training data, with Y as indices into classNames
+TestData = namedtuple("TestData", ["contigids", "X"])  # data left for the model to classify
+Model = namedtuple("Model", ["classifier", "features", "classNames", "level", "target", "binary", "kmer"])  # a trained classifier and how to use it
+MODEL_VERSION = 1  # bump when the saved model layout changes
+BATCH_SIZE = 100000  # contigs classified at a time
+_classifier = None  # classifier used by predictBatch(), set in each worker by initClassifier()
+CLASSIFIERS = {  # {option name: name shown to the user}
+    "tree": "Decision tree",
+    "bagging": "Bagging",
+    "adaboost": "AdaBoost",
+    "forest": "Random forest",
+    "boosting": "Gradient tree boosting",
+    "hist": "Histogram gradient boosting",
+}
 
-class Contig(object): # to store contigs for analysis
-    def __init__(self, contigid, variables={}, classification=False):
-        self.contigid = contigid
-        self.variables = variables
-        self.classification = classification
 
+class ContigStore(object):  # columnar storage for contigs, their variables and their classifications
+    def __init__(self, contigids, features, X=None):
+        """
+        Creates a store holding one row per contig and one float32 column per variable.
 
-def parseTaxdump(blastdb, createDict):
+        Args:
+            contigids: A list of contigIDs, one per row.
+            features: A list of variable names, one per column.
+            X: An existing float32 matrix to hold the variables, or None to allocate
+                one filled with zeros.
+        """
+        self.contigids = numpy.array(contigids, dtype=object)
+        self.index = dict((contigid, row) for row, contigid in enumerate(self.contigids))
+        self.features = list(features)
+        if X is None:
+            X = numpy.zeros((len(self.contigids), len(self.features)), dtype=numpy.float32)
+        self.X = X
+        self.labels = numpy.full(len(self.contigids), -1, dtype=numpy.int32)  # index into classList, -1 if unclassified
+        self.classList = []
+        self.labeled = None  # number of classified rows, once partition() has moved them to the front
+        self.order = numpy.arange(len(self.contigids))  # original row of each row, to undo partition()
+
+    def __len__(self):
+        return len(self.contigids)
+
+    def column(self, feature):
+        """
+        Returns a writable view of one variable's column.
+
+        Args:
+            feature: The variable name.
+        Returns:
+            column: A view of that column of X.
+        """
+        return self.X[:, self.features.index(feature)]
+
+    @property
+    def classMap(self):  # {class name: class id}
+        return dict((className, idx) for idx, className in enumerate(self.classList))
+
+    def classify(self, contigids, classifications):
+        """
+        Records the classification of some contigs, adding new classes to classList
+        in the order they are first seen.
+
+        Args:
+            contigids: A list of contigIDs.
+            classifications: A list of class names, one per contigID.
+        """
+        classMap = self.classMap
+        labels = numpy.empty(len(contigids), dtype=numpy.int32)
+        for idx, className in enumerate(classifications):
+            if className not in classMap:
+                classMap[className] = len(self.classList)
+                self.classList.append(className)
+            labels[idx] = classMap[className]
+        rows = numpy.fromiter((self.index[contigid] for contigid in contigids), dtype=numpy.int64, count=len(contigids))
+        self.labels[rows] = labels
+
+    def classification(self, contigid):
+        """
+        Looks up the classification of a contig.
+
+        Args:
+            contigid: The contigID.
+        Returns:
+            classification: The class name, or False if the contig is unclassified.
+        """
+        label = self.labels[self.index[contigid]]
+        return self.classList[label] if label >= 0 else False
+
+    def partition(self, seed=0):
+        """
+        Reorders the rows so classified contigs come first, in a reproducibly
+        shuffled order, followed by unclassified contigs sorted by contigID. After
+        this the training, validation and test sets are all contiguous slices, so
+        they can be handed around as views of X rather than copies.
+
+        Args:
+            seed: Random seed for shuffling the classified contigs.
+        Returns:
+            labeled: The number of classified contigs.
+        """
+        labeled = numpy.flatnonzero(self.labels >= 0)
+        unlabeled = numpy.flatnonzero(self.labels < 0)
+        labeled = labeled[numpy.random.RandomState(seed).permutation(len(labeled))]
+        unlabeled = unlabeled[numpy.argsort(self.contigids[unlabeled].astype(str), kind="mergesort")]
+        order = numpy.concatenate((labeled, unlabeled))
+        self.contigids = self.contigids[order]
+        self.index = dict((contigid, row) for row, contigid in enumerate(self.contigids))
+        self.X = self.X[order]
+        self.labels = self.labels[order]
+        self.order = self.order[order]
+        self.labeled = len(labeled)
+        return self.labeled
+
+    def save(self, path):
+        """
+        Saves the contigIDs, variables and classifications to a NumPy .npz file.
+
+        Args:
+            path: Location to save the store.
+        """
+        with open(path, "wb") as out:
+            numpy.savez(out, contigids=self.contigids.astype(str), features=numpy.array(self.features, dtype=str),
+                        X=self.X, labels=self.labels, classList=numpy.array(self.classList, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a store saved by save().
+
+        Args:
+            path: Location of the saved store.
+        Returns:
+            store: A sidr.common.ContigStore.
+        """
+        with numpy.load(path) as saved:
+            store = cls(saved["contigids"].tolist(), saved["features"].tolist(), saved["X"])
+            store.labels = saved["labels"]
+            store.classList = saved["classList"].tolist()
+        return store
+
+
+def parseTaxdump(blastdb, cacheDir=None, taxids=None, names=None):
     """
     Parses a local copy of the NCBI Taxonomy dump for use by later functions.
 
+    The taxdump is read through a compiled index (see sidr.taxonomy), which is
+    built on first use and reused until the .dmp files change. If the taxa seen
+    in the input are given, it is loaded lazily instead, see sidr.taxonomy.loadLazy().
+
     Args:
-        blastdb: A string containing the root directory for the NCBI taxdump.
-        createDict: True to create taxon dictionary for runfile mode
+        blastdb: A string containing the root directory for the NCBI taxdump, or
+            the path to a taxdump archive such as taxdump.tar.gz.
+        cacheDir: Directory for the compiled index if the taxdump directory is read-only.
+        taxids: Integer taxids seen in the input, to load only their lineages.
+        names: Names seen in the input, such as a runfile's Origins, to load only
+            their lineages.
     Returns:
-        taxdump: A dictionary mapping NCBI taxon ids to a tuple containing the
-            taxid of the parent taxon and the name of the current taxon.
-        taxdict: A dictionary mapping human readable names to taxids
-    """
-    taxdump = {}
-    taxidDict = {}
-    with open(blastdb + "/names.dmp") as names:
-        click.echo("Reading names.dmp")
-        namesReader = list(csv.reader(names, delimiter="|"))
-        with click.progressbar(namesReader) as nr: # human readable names
-            for line in nr:
-                if "scientific name" in line[3].strip():
-                    taxdump[line[0].strip()] = line[1].strip() # {taxid: Name}
-                if createDict:
-                    taxidDict[line[1].strip()] = line[0].strip() # {Name: taxid}
-    with open(blastdb + "/nodes.dmp") as nodes:
-        click.echo("Reading nodes.dmp")
-        nodesReader = list(csv.reader(nodes, delimiter="|"))
-        with click.progressbar(nodesReader) as nr: # connection between taxids
-            for line in nr:
-                taxdump[line[0].strip()] = [taxdump[line[0].strip()], line[1].strip(), line[2].strip()]  # {taxid: [Name, Parent, Rank]}
-    with open(blastdb + "/merged.dmp") as merged: # merged taxids are the same organism, effectively
-        click.echo("Reading merged.dmp")
-        mergedReader = list(csv.reader(merged, delimiter="|"))
-        with click.progressbar(mergedReader) as mr:
-            for line in mr:
-                taxdump[line[0].strip()] = ["merged", line[1].strip()]
-    with open(blastdb + "/delnodes.dmp") as delnodes: # if a taxid is deleted than the BLAST DB and taxdump are too far out of sync
-        click.echo("Reading delnodes.dmp")
-        delReader = list(csv.reader(delnodes, delimiter="|"))
-        with click.progressbar(delReader) as dr:
-            for line in dr:
-                taxdump[line[0].strip()] = ["deleted"]
-    return taxdump, taxidDict
+        taxdump: A sidr.taxonomy.Taxonomy object holding parent taxids, rank codes
+            and names in flat arrays indexed by taxid.
+    """
+    if taxids is not None or names is not None:
+        return taxonomy.loadLazy(blastdb, taxids or (), names or (), cacheDir)
+    return taxonomy.load(blastdb, cacheDir)
 
 
 def taxidToLineage(taxid, taxdump, classificationLevel):
     """
-    Recursively converts an NCBI taxid to a full phylogenetic lineage.
+    Converts an NCBI taxid to its name at the chosen classification level.
 
     Args:
-        taxid: The taxid to look up.
+        taxid: The taxid to look up, as a string. Only the first of several
+            semicolon-separated taxids is used.
         taxdump: The NCBI taxonomy dump as parsed by parseTaxDump
         classificationLevel: The level of classification to save into the corpus.
     Returns:
         classification: A string containing the lineage at the chosen classification level.
     """
-    try:
+    return taxidsToLineages([taxid], taxdump, classificationLevel)[0]
+
+
+def parseTaxids(taxids):
+    """
+    Parses taxids as written in BLAST results.
+
+    Args:
+        taxids: An iterable of taxids as strings, as in taxidToLineage().
+    Returns:
+        taxids: A list of integer taxids.
+    """
+    parsed = []
+    for taxid in taxids:
         taxid = taxid.split(";")[0]
-        tax = taxdump[taxid]
-        if "deleted" in tax: # taxid has been removed from NCBI db, indicates that taxdump and blastdb are out of sync
-            raise Exception("ERROR: Taxon id %s has been deleted from the NCBI DB.\nPlease update your databases and re-run BLAST." % taxid)
-        if "merged" in tax:
-            merge = tax[1]
-            return taxidToLineage(merge, taxdump, classificationLevel)
-        if tax[2].lower() == classificationLevel.lower(): # final answer
-            return tax[0]
-        elif taxid != '1': # recursive call
-            return taxidToLineage(tax[1], taxdump, classificationLevel)
-        elif taxid == '1': # nohit
-            return("nohit")
-        else: # edge case
-            raise Exception("Taxid %s has failed to resolve." % taxid)
-    except KeyError:
-        raise Exception("Taxon id %s was not found in the NCBI DB.\nPlease update your DB and try again." % taxid)
-
-
-def constructCorpus(contigs, classMap, binary, target):
+        try:
+            parsed.append(int(taxid))
+        except ValueError:
+            raise Exception("Taxon id %s was not found in the NCBI DB.\nPlease update your DB and try again." % taxid)
+    return parsed
+
+
+def taxidsToLineages(taxids, taxdump, classificationLevel):
+    """
+    Converts a batch of NCBI taxids to their names at the chosen classification level.
+
+    Args:
+        taxids: An iterable of taxids as strings, as in taxidToLineage().
+        taxdump: The NCBI taxonomy dump as parsed by parseTaxDump
+        classificationLevel: The level of classification to save into the corpus.
+    Returns:
+        classifications: An object array of names, one per input taxid.
+    """
+    return taxdump.lineages(parseTaxids(taxids), classificationLevel)
+
+
+def constructCorpus(store, binary, target):
     """
     Construct a corpus, or body of training data for the decision tree, as well as the data under test.
 
     Args:
-        contigs: A list of sidr.common.Contig objects with test variables.
-        classMap: A dictionary mapping class names to their class id used by scikit-learn.
+        store: A sidr.common.ContigStore with variables and classifications filled in.
         binary: Set True to use "binary" (target/nontarget) classification for the model.
         target: The name of the target classification.
     Returns:
-        corpus: A list of lists, containing the GC content, coverage, and class number.
-        testdata: Data that was not classified by BLAST and will later be classified by the
-            trained model.
+        corpus: A sidr.common.Corpus of the classified contigs' variables, their class
+            ids and the class names, with the variables as a view of the store.
+        testdata: A sidr.common.TestData of contigs that were not classified by BLAST and
+            will later be classified by the trained model, again as a view of the store.
         features: List of variables used by each contig.
     """
-    corpus = []
-    testdata = []
-    features = []
-    for contig in contigs:
-        variableBuf = list(contig.variables.values())
-        features = list(contig.variables.keys())
-        if contig.classification:
-            if binary:
-                if contig.classification.lower() == target.lower():
-                    variableBuf.append("target")
-                    corpus.append(variableBuf)
-                else:
-                    variableBuf.append("nontarget")
-                    corpus.append(variableBuf)
-            else:
-                variableBuf.append(contig.classification)
-                corpus.append(variableBuf)
-        else:
-            variableBuf.insert(0, contig.contigid)
-            testdata.append(variableBuf)
-    return corpus, testdata, features
-
-
-def constructModel(corpus, classList, features, modelOutput):
+    labeled = store.partition()
+    Y = store.labels[:labeled]
+    classNames = list(store.classList)
+    if binary:
+        isTarget = numpy.array([className.lower() == target.lower() for className in store.classList], dtype=numpy.int32)
+        Y = isTarget[Y] if len(isTarget) else Y
+        classNames = ["nontarget", "target"]
+    corpus = Corpus(store.X[:labeled], Y, classNames)
+    testdata = TestData(store.contigids[labeled:], store.X[labeled:])
+    return corpus, testdata, store.features
+
+
+def treeEnsemble(ensembleClass, maxDepth, **options):
+    """
+    Creates an ensemble of decision trees, limiting their depth if asked.
+
+    Args:
+        ensembleClass: A scikit-learn meta-estimator taking a base estimator.
+        maxDepth: Maximum depth of each tree, or None for no limit.
+        options: Further arguments to the ensemble.
+    Returns:
+        classifier: An unfitted instance of ensembleClass.
+    """
+    if not maxDepth:
+        return ensembleClass(**options)
+    try:
+        return ensembleClass(estimator=tree.DecisionTreeClassifier(max_depth=maxDepth), **options)
+    except TypeError:  # scikit-learn before 1.2 calls it base_estimator
+        return ensembleClass(base_estimator=tree.DecisionTreeClassifier(max_depth=maxDepth), **options)
+
+
+def buildClassifier(estimator="bagging", nEstimators=None, maxDepth=None, jobs=1):
+    """
+    Creates an untrained classifier.
+
+    Args:
+        estimator: One of the keys of CLASSIFIERS.
+        nEstimators: Number of trees (or boosting iterations), or None for the
+            scikit-learn default. Ignored by a single decision tree.
+        maxDepth: Maximum depth of each tree, or None for the scikit-learn default.
+        jobs: Number of parallel jobs for estimators that support them, -1 for all cores.
+            Histogram gradient boosting is multi-threaded through OpenMP instead.
+    Returns:
+        classifier: An unfitted scikit-learn classifier.
+    """
+    options = {}
+    if nEstimators:
+        options["max_iter" if estimator == "hist" else "n_estimators"] = nEstimators
+    if estimator == "tree":
+        return tree.DecisionTreeClassifier(max_depth=maxDepth)
+    if estimator == "bagging":
+        return treeEnsemble(ensemble.BaggingClassifier, maxDepth, n_jobs=jobs, **options)
+    if estimator == "adaboost":
+        return treeEnsemble(ensemble.AdaBoostClassifier, maxDepth, **options)
+    if maxDepth:
+        options["max_depth"] = maxDepth
+    if estimator == "forest":
+        return ensemble.RandomForestClassifier(n_jobs=jobs, **options)
+    if estimator == "boosting":
+        return ensemble.GradientBoostingClassifier(**options)
+    if estimator == "hist":
+        try:
+            return ensemble.HistGradientBoostingClassifier(**options)
+        except AttributeError:  # experimental before scikit-learn 1.0
+            from sklearn.experimental import enable_hist_gradient_boosting
+            return ensemble.HistGradientBoostingClassifier(**options)
+    raise ValueError("Unknown classifier %s, expected one of %s" % (estimator, ", ".join(sorted(CLASSIFIERS))))
+
+
+def constructModel(corpus, features, modelOutput, estimator="bagging", nEstimators=None, maxDepth=None, jobs=1):
     """
     Trains a Decision Tree model on the test corpus.
 
+    The corpus is expected to be shuffled already (see ContigStore.partition), so
+    the training and validation sets are taken as slices without copying.
+
     Args:
-        corpus: A list of lists, containing the GC content, coverage, and class number.
-        classList: A list of class names.
+        corpus: A sidr.common.Corpus of training data.
         features: List of variables used by each contig.
         modelOutput: Location to save model as GraphViz DOT, or False to save no model.
+        estimator, nEstimators, maxDepth, jobs: Classifier options, see buildClassifier().
     Returns:
-        classifier: A DecisionTreeClassifier object that has been trained on the test corpus.
-    """
-    corpus.sort()  # just in case
-    X = []
-    Y = []
-    for item in corpus:
-        X.append(item[:-1]) # all but the last item
-        Y.append(item[-1]) # only the last item
-    X_train, X_test, Y_train, Y_test = mscv.train_test_split(X, Y, test_size=0.3, random_state=0)
-    # TODO: implement classifier testing and comparison, now only baggingClassifier is used as per paper
-    #treeClassifier = tree.DecisionTreeClassifier()
-    #treeClassifier = treeClassifier.fit(X_train, Y_train)
-    #click.echo("Decision tree classifier built, score is %s out of 1.00" % treeClassifier.score(X_test, Y_test))
-    baggingClassifier = ensemble.BaggingClassifier()
-    baggingClassifier = baggingClassifier.fit(X_train, Y_train)
-    click.echo("Bagging classifier built, score is %s out of 1.00" % baggingClassifier.score(X_test, Y_test))
-    #forestClassifier = ensemble.RandomForestClassifier(n_estimators=10)
-    #forestClassifier = forestClassifier.fit(X_train, Y_train)
-    #click.echo("Random forest classifier built, score is %s out of 1.00" % forestClassifier.score(X_test, Y_test))
-    #adaClassifier = ensemble.AdaBoostClassifier(n_estimators=100)
-    #adaClassifier = adaClassifier.fit(X_train, Y_train)
-    #click.echo("AdaBoost classifier built, score is %s out of 1.00" % adaClassifier.score(X_test, Y_test))
-    #gradientClassifier = ensemble.GradientBoostingClassifier(n_estimators=100)
-    #gradientClassifier = gradientClassifier.fit(X_train, Y_train)
-    #click.echo("Gradient tree boosting classifier built, score is %s out of 1.00" % gradientClassifier.score(X_test, Y_test))
+        classifier: A classifier object that has been trained on the test corpus.
+    """
+    trainSize = len(corpus.Y) - int(numpy.ceil(len(corpus.Y) * 0.3))
+    X_train, X_test = corpus.X[:trainSize], corpus.X[trainSize:]
+    Y_train, Y_test = corpus.Y[:trainSize], corpus.Y[trainSize:]
+    classifier = buildClassifier(estimator, nEstimators, maxDepth, jobs)
+    classifier = classifier.fit(X_train, Y_train)
+    click.echo("%s classifier built, score is %s out of 1.00" % (CLASSIFIERS[estimator], classifier.score(X_test, Y_test)))
     if modelOutput:
         with open(modelOutput, 'w') as dotfile:
-            tree.export_graphviz(baggingClassifier, out_file=dotfile, feature_names=features,
-                                 class_names=classList, filled=True, rounded=True, special_characters=True)
-    return baggingClassifier
+            tree.export_graphviz(classifier, out_file=dotfile, feature_names=features,
+                                 class_names=corpus.classNames, filled=True, rounded=True, special_characters=True)
+    return classifier
+
+
+def saveModel(path, model):
+    """
+    Saves a trained model to disk with everything needed to classify new contigs.
+
+    Args:
+        path: Location to save the model.
+        model: A sidr.common.Model.
+    """
+    saved = dict(model._asdict(), version=MODEL_VERSION, sklearn=sklearn.__version__)
+    with open(path, "wb") as out:
+        pickle.dump(saved, out, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loadModel(path):
+    """
+    Loads a model saved by saveModel(). Only load models from trusted sources, as
+    they are pickled.
+
+    Args:
+        path: Location of the saved model.
+    Returns:
+        model: A sidr.common.Model.
+    """
+    with open(path, "rb") as saved:
+        saved = pickle.load(saved)
+    if not isinstance(saved, dict) or saved.get("version") != MODEL_VERSION:
+        raise ValueError("%s is not a model saved by this version of SIDR" % path)
+    if saved["sklearn"] != sklearn.__version__:
+        click.echo("Model was trained with scikit-learn %s but %s is installed, predictions may differ" % (saved["sklearn"], sklearn.__version__))
+    return Model(*[saved[field] for field in Model._fields])
 
 
-def classifyData(classifier, testdata, classMap):
+def initClassifier(classifier, width, probabilities):
     """
-    Classifies data based on the previously trained model.
+    Stores the classifier in a prediction worker so it is sent once per process
+    rather than once per batch. The worker predicts on a single core, since the
+    pool already runs one worker per thread.
+
+    Args:
+        classifier, width, probabilities: As for predictBatch().
+    """
+    global _classifier
+    if "n_jobs" in classifier.get_params():
+        classifier.set_params(n_jobs=1)
+    _classifier = (classifier, width, probabilities)
+
+
+def predictBatch(X, classifier=None, width=0, probabilities=False):
+    """
+    Classifies one batch of contigs, with the classifier set by initClassifier()
+    unless one is given.
+
+    Args:
+        X: The variables of the batch.
+        classifier: A trained classifier.
+        width: The number of classes, so probabilities have a column for every
+            class even if some were missing from the training set.
+        probabilities: Set True to also return class probabilities.
+    Returns:
+        Y: The predicted class ids.
+        probabilities: A float32 matrix of class probabilities, or None.
+    """
+    if classifier is None:
+        classifier, width, probabilities = _classifier
+    if not probabilities:
+        return classifier.predict(X), None
+    known = classifier.predict_proba(X)
+    Y = classifier.classes_[known.argmax(axis=1)]
+    proba = numpy.zeros((len(X), width), dtype=numpy.float32)
+    proba[:, classifier.classes_] = known
+    return Y, proba
+
+
+def classifyData(classifier, testdata, classNames, batchSize=BATCH_SIZE, threads=1, probabilities=False):
+    """
+    Classifies data based on the previously trained model, in fixed-size batches
+    so memory use does not grow with the number of contigs.
+
+    Batches are taken as views of testdata, and with several worker processes
+    only a few batches are in flight at once.
 
     Args:
         classifier: A classifier object that has been trained on the test corpus.
-        testdata: A dataset to classify based on reads.
-        classMap: A dictionary mapping class names to their class id used by scikit-learn.
+        testdata: A sidr.common.TestData to classify.
+        classNames: The class names the classifier's class ids refer to.
+        batchSize: Number of contigs classified at a time.
+        threads: Number of worker processes to classify batches with.
+        probabilities: Set True to also compute the probability of each class.
+    Yields:
+        result: A tuple of (contigIDs, class ids, probabilities) for each batch, in
+            order, with probabilities None unless asked for.
+    """
+    starts = range(0, len(testdata.contigids), batchSize)
+    if threads <= 1:
+        for start in starts:
+            Y, proba = predictBatch(testdata.X[start:start + batchSize], classifier, len(classNames), probabilities)
+            yield testdata.contigids[start:start + batchSize], Y, proba
+        return
+    pool = multiprocessing.Pool(threads, initClassifier, (classifier, len(classNames), probabilities))
+    try:
+        pending = deque()
+        for start in starts:
+            pending.append((start, pool.apply_async(predictBatch, (testdata.X[start:start + batchSize],))))
+            if len(pending) >= threads * 2:  # bound the batches waiting to be written
+                start, batch = pending.popleft()
+                yield (testdata.contigids[start:start + batchSize],) + batch.get()
+        while pending:
+            start, batch = pending.popleft()
+            yield (testdata.contigids[start:start + batchSize],) + batch.get()
+    finally:
+        pool.terminate()
+
+
+def isTarget(classNames, target):
+    """
+    Finds which classes are the target.
+
+    Args:
+        classNames: A list of class names.
+        target: Target classification, matched case-insensitively. "target" always
+            matches, as used by binary classification.
     Returns:
-        result: Test data as classified by the model.
+        isTarget: A boolean array, True for each target class, with an extra False
+            entry at the end for unclassified (-1) labels.
     """
-    testdata.sort()
-    X = []
-    # testdata = [[contigID, variable1, variable2, ...], ...]
-    for item in testdata:
-        X.append(item[1::]) # all but the first item
-    Y = classifier.predict(X)
-    # Step one: transpose the testdata matrix and extract all contigIDs
-    contigIDs = list(zip(*testdata))[0]  # https://stackoverflow.com/questions/4937491/matrix-transpose-in-python
-    # Step two: combine the contigIDs with the results from the classifier
-    result = list(zip(contigIDs, Y))
-    return result
+    return numpy.array([className == "target" or className.lower() == target.lower() for className in classNames] + [False])
+
 
-def generateOutput(tokeep, toremove, result, contigs, target, output):
+def generateOutput(tokeep, toremove, result, store, target, output, classNames):
     """
-    Generates output files for completed runs.
+    Generates output files for completed runs, writing each batch of classified
+    contigs as it arrives. The output format follows the extension of output,
+    see sidr.writers.
 
     Args:
         tokeep: File-like object to output target contigs to.
         toremove: File-like object to output non-target contigs to.
-        result: Classified data from sidr.common.classifyData().
-        contigs: List of sidr.common.Contig objects from input.
+        result: Batches of classified data from sidr.common.classifyData().
+        store: The sidr.common.ContigStore the corpus was constructed from.
         target: Target classification.
         output: File-like object to save complete results to.
+        classNames: The class names the model's class ids refer to.
     """
-    targetContigIDs = []
-    nontargetContigIDs = []
-    outputLines = []
-    for contig in contigs:
-        if contig.classification:
-            if target.lower() == contig.classification.lower():
-                targetContigIDs.append(contig.contigid)
-            else:
-                nontargetContigIDs.append(contig.contigid)
-            outputLines.append([contig.contigid, contig.classification, "input"])
-    for contig in result:
-        if target == contig[1]:
-            targetContigIDs.append(contig[0])
-        elif "target" == contig[1]:
-            targetContigIDs.append(contig[0])
-        else:
-            nontargetContigIDs.append(contig[0])
-        outputLines.append([contig[0], contig[1], "dt"])
-    with open(output, "w+") as f:
-        f.write("contigid, classification, source\n")
-        for ln in outputLines:
-            f.write("%s, %s, %s\n" % (ln[0], ln[1], ln[2]))  # https://stackoverflow.com/questions/899103/writing-a-list-to-a-file-with-python for %s\n suggestion
-    if tokeep:
-        with open(tokeep, "w+") as f:
-            for i in targetContigIDs:
-                f.write("%s\n" % i )
-    if toremove:
-        with open(toremove, "w+") as f:
-            for i in nontargetContigIDs:
-                f.write("%s\n" % i)
+    inputRows = numpy.argsort(store.order[:store.labeled])  # classified contigs in input order
+    inputIDs = store.contigids[inputRows]
+    inputLabels = store.labels[inputRows]
+    inputNames = numpy.array(store.classList + [""], dtype=object)
+    resultNames = numpy.array(classNames, dtype=object)
+    inputTarget = isTarget(store.classList, target)
+    resultTarget = isTarget(classNames, target)
+    with ExitStack() as files:
+        writer = writers.openWriter(output, classNames)
+        files.callback(writer.close)
+        keep = files.enter_context(writers.openText(tokeep)) if tokeep else None
+        remove = files.enter_context(writers.openText(toremove)) if toremove else None
+
+        def writeBatch(contigids, names, source, targets, proba):
+            writer.write(contigids, names, source, proba)
+            if keep:
+                keep.write("".join("%s\n" % i for i in contigids[targets]))
+            if remove:
+                remove.write("".join("%s\n" % i for i in contigids[~targets]))
+
+        writeBatch(inputIDs, inputNames[inputLabels], "input", inputTarget[inputLabels], None)
+        for resultIDs, Y, proba in result:
+            writeBatch(resultIDs, resultNames[Y], "dt", resultTarget[Y], proba)
@@ -0,0 +1,239 @@
+import click
+import heapq
+import json
+import multiprocessing
+import numpy
+import os
+import pysam
+
+from array import array
+from sidr import files
+
+CACHE_VERSION = 2  # bump when the coverage calculation changes
+SKIP_FLAGS = 0x4 | 0x100 | 0x200 | 0x400  # unmapped, secondary, QC fail and duplicate reads, as skipped by pileup()
+PAIRED = 0x1
+PROPER_PAIR = 0x2  # paired reads without this flag are orphans, which pileup() ignores by default
+CHUNK_SIZE = 1000000  # reads buffered per contig before their intervals are folded in
+
+
+def foldIntervals(starts, ends, lastEnd):
+    """
+    Folds a batch of read intervals into running coverage totals.
+
+    Reads arrive sorted by start position, so a read adds to the covered length
+    only the part of it that extends past the furthest end seen so far.
+
+    Args:
+        starts: NumPy array of read start positions, sorted ascending.
+        ends: NumPy array of read end positions (exclusive).
+        lastEnd: The furthest end position seen before this batch.
+    Returns:
+        depth: Sum of per-base depth contributed by the batch.
+        covered: Number of newly covered bases.
+        lastEnd: The furthest end position seen including this batch.
+    """
+    previousEnds = numpy.maximum.accumulate(numpy.concatenate(([lastEnd], ends[:-1])))
+    covered = numpy.maximum(ends - numpy.maximum(starts, previousEnds), 0).sum()
+    return int((ends - starts).sum()), int(covered), max(lastEnd, int(ends.max()))
+
+
+def contigCoverage(alignment, contig, chunkSize=CHUNK_SIZE):
+    """
+    Computes the mean depth of a contig over its covered bases from read intervals.
+
+    This gives the same answer as averaging pile.nsegments over every column of
+    alignment.pileup(), without visiting each base: each read covers every
+    reference position from its start to its end, deletions and skips included.
+    Like pileup(), it skips unmapped, secondary, QC fail and duplicate reads, and
+    orphans: paired reads that aren't in a proper pair.
+    Memory is bounded by chunkSize reads regardless of contig length or depth.
+
+    Args:
+        alignment: An open, indexed pysam.AlignmentFile.
+        contig: The contigID to compute coverage for.
+        chunkSize: Number of reads to buffer before folding them into the totals.
+    Returns:
+        coverage: Sum of per-base depth divided by the number of covered bases,
+            or 0 if no reads align to the contig.
+    """
+    depth = 0
+    covered = 0
+    lastEnd = 0
+    starts = array("l")
+    ends = array("l")
+    for read in alignment.fetch(contig=contig):
+        if read.flag & SKIP_FLAGS or read.flag & PAIRED and not read.flag & PROPER_PAIR or read.reference_end is None:
+            continue
+        starts.append(read.reference_start)
+        ends.append(read.reference_end)
+        if len(starts) >= chunkSize:
+            d, c, lastEnd = foldIntervals(numpy.frombuffer(starts, dtype="l"), numpy.frombuffer(ends, dtype="l"), lastEnd)
+            depth, covered = depth + d, covered + c
+            starts, ends = array("l"), array("l")
+    if len(starts):
+        d, c, lastEnd = foldIntervals(numpy.frombuffer(starts, dtype="l"), numpy.frombuffer(ends, dtype="l"), lastEnd)
+        depth, covered = depth + d, covered + c
+    if not covered:  # should only occur if 0 coverage recorded
+        return 0
+    return depth / covered
+
+
+def balanceContigs(lengths, shards):
+    """
+    Splits contigs into shards of roughly equal total length, longest first.
+
+    Args:
+        lengths: A dictionary mapping contigIDs to contig lengths.
+        shards: The number of shards to split the contigs into.
+    Returns:
+        shards: A list of non-empty lists of contigIDs.
+    """
+    heap = [(0, idx, []) for idx in range(max(1, shards))]
+    for contig in sorted(lengths, key=lambda c: lengths[c], reverse=True):
+        total, idx, shard = heapq.heappop(heap)  # always fill the lightest shard
+        shard.append(contig)
+        heapq.heappush(heap, (total + lengths[contig], idx, shard))
+    return [shard for total, idx, shard in sorted(heap, key=lambda h: h[1]) if shard]
+
+
+def coverageWorker(args):
+    """
+    Computes coverage for one shard of contigs through its own BAM handle.
+
+    Args:
+        args: A tuple of (BAMFile, contigIDs).
+    Returns:
+        coverage: A list of (contigID, coverage) tuples.
+    """
+    BAMFile, contigIDs = args
+    with pysam.AlignmentFile(BAMFile, "rb") as alignment:
+        return [(contig, contigCoverage(alignment, contig)) for contig in contigIDs]
+
+
+def bamCoverage(BAMFile, contigIDs, threads=1):
+    """
+    Computes coverage for every contig, splitting the contigs across a pool of
+    worker processes by length. Each worker opens its own handle and seeks to
+    its contigs through the BAM index.
+
+    Args:
+        BAMFile: The BAM file to parse.
+        contigIDs: A list of contigIDs to compute coverage for.
+        threads: Number of worker processes to use.
+    Returns:
+        coverage: A dictionary mapping contigIDs to coverage.
+    """
+    with pysam.AlignmentFile(BAMFile, "rb") as alignment:
+        if threads <= 1:
+            with click.progressbar(contigIDs) as ci:
+                return dict((contig, contigCoverage(alignment, contig)) for contig in ci)
+        lengths = dict((contig, alignment.get_reference_length(contig)) for contig in contigIDs)
+    shards = balanceContigs(lengths, threads * 4)  # more shards than workers keeps the tail short
+    result = {}
+    pool = multiprocessing.Pool(threads)
+    try:
+        with click.progressbar(length=len(contigIDs)) as bar:
+            for shard in pool.imap_unordered(coverageWorker, [(BAMFile, shard) for shard in shards]):
+                result.update(shard)
+                bar.update(len(shard))
+    finally:
+        pool.terminate()
+    return result
+
+
+def bamIdentity(BAMFile):
+    """
+    Describes a BAM file and its index well enough to tell when either changes.
+
+    Args:
+        BAMFile: The BAM file to describe.
+    Returns:
+        identity: A dictionary of the BAM path and its sidr.files.fileIdentity(),
+            and those of its index.
+    """
+    identity = {"version": CACHE_VERSION, "path": os.path.abspath(BAMFile), "bam": files.fileIdentity(BAMFile), "index": None}
+    for index in [BAMFile + ".bai", os.path.splitext(BAMFile)[0] + ".bai", BAMFile + ".csi"]:
+        if os.path.isfile(index):
+            identity["index"] = [os.path.abspath(index)] + files.fileIdentity(index)
+            break
+    return identity
+
+
+def cachePath(BAMFile, cacheDir=None):
+    """
+    Chooses where the coverage cache for a BAM file lives: beside the BAM when
+    its directory is writable, otherwise in the cache directory.
+
+    Args:
+        BAMFile: The BAM file being cached.
+        cacheDir: Directory to keep the cache in instead of beside the BAM.
+    Returns:
+        path: Path of the cache file, which may not exist yet.
+    """
+    if not cacheDir and os.access(os.path.dirname(os.path.abspath(BAMFile)), os.W_OK):
+        return BAMFile + ".sidr-coverage.json"
+    return files.userCachePath(BAMFile, "coverage", cacheDir) + ".json"
+
+
+def readCache(path, identity):
+    """
+    Reads cached coverage if it was computed from the same BAM file.
+
+    Args:
+        path: Path of the cache file.
+        identity: The current identity of the BAM file, from bamIdentity().
+    Returns:
+        coverage: A dictionary mapping contigIDs to coverage, empty if the cache
+            is missing, unreadable or stale.
+    """
+    try:
+        with open(path) as c:
+            cache = json.load(c)
+    except (IOError, OSError, ValueError):
+        return {}
+    if cache.get("identity") != identity:
+        return {}
+    return cache.get("coverage", {})
+
+
+def writeCache(path, identity, covDict):
+    """
+    Writes coverage to the cache, replacing the old file atomically.
+
+    Args:
+        path: Path of the cache file.
+        identity: The identity of the BAM file, from bamIdentity().
+        covDict: A dictionary mapping contigIDs to coverage.
+    """
+    def dump(tmpPath):
+        with open(tmpPath, "w") as c:
+            json.dump({"identity": identity, "coverage": covDict}, c)
+    files.atomicWrite(path, dump)
+
+
+def cachedCoverage(BAMFile, contigIDs, threads=1, cacheDir=None):
+    """
+    Computes coverage through the cache, only reading the BAM for contigs
+    that have not been seen with this exact BAM file before.
+
+    Args:
+        BAMFile: The BAM file to parse.
+        contigIDs: A list of contigIDs to compute coverage for.
+        threads: Number of worker processes to use.
+        cacheDir: Directory to keep the cache in instead of beside the BAM.
+    Returns:
+        coverage: A dictionary mapping contigIDs to coverage.
+    """
+    path = cachePath(BAMFile, cacheDir)
+    identity = bamIdentity(BAMFile)
+    cached = readCache(path, identity)
+    missing = [contig for contig in contigIDs if contig not in cached]
+    if not missing:
+        click.echo("Coverage loaded from %s" % path)
+        return dict((contig, cached[contig]) for contig in contigIDs)
+    cached.update(bamCoverage(BAMFile, missing, threads))
+    try:
+        writeCache(path, identity, cached)
+    except (IOError, OSError) as e:  # an unwritable cache shouldn't fail the run
+        click.echo("Could not write coverage cache %s: %s" % (path, e))
+    return dict((contig, cached[contig]) for contig in contigIDs)
@@ -1,118 +1,282 @@
-import pysam
 import click
 import gc
-import gzip
+import numpy
+import pysam
 
+from array import array
+from sidr import blast
+from sidr import checkpoint
 from sidr import common
-from Bio.SeqUtils import GC  # for GC content
-from Bio.SeqIO.FastaIO import FastaIterator
+from sidr import coverage
+from sidr import fasta
+from sidr import files
+from sidr import metrics
+from sidr import scheduler
+from sidr import taxonomy
+from sidr import writers
 
 
-def readFasta(fastaFile):
+def readFasta(fastaFile, threads=1, kmer=None, reserve=("Coverage",)):
     """
     Reads a FASTA file and parses contigs for GC content.
 
     Args:
-        fastaFile: The path to the FASTA file.
+        fastaFile: The path to the FASTA file, optionally gzip or bgzip compressed.
+        threads: Number of worker processes to use if the FASTA has a .fai index.
+        kmer: Length of k-mers to add canonical k-mer frequencies for, or None.
+        reserve: Names of variables that later stages will fill in. Their columns
+            are allocated now so the variable matrix never has to be copied to grow.
     Returns:
-        contigs A dictionary mapping contigIDs to sidr.common.Contig objects with GC content as a variable.
+        contigs: A sidr.common.ContigStore with GC content (and k-mer frequencies)
+            filled in as variables.
     """
-    contigs = []
-    if ".gz" in fastaFile: # should support .fa.gz files in a seamless (if slow) way
-        openFunc = gzip.open
-    else:
-        openFunc = open
-    with openFunc(fastaFile) as data:
-        click.echo("Reading %s" % fastaFile)
-        with click.progressbar(FastaIterator(data)) as fi:
-            for record in fi:  # TODO: conditional formatting
-                contigs.append(common.Contig(record.id.split(' ')[0], variables={"GC": GC(record.seq)}))
-    if len(contigs) != len(set([x.contigid for x in contigs])): # exit if duplicate contigs, https://stackoverflow.com/questions/5278122/checking-if-all-elements-in-a-list-are-unique
+    features = fasta.featureNames(kmer)
+    contigids = []
+    values = array("f")
+    click.echo("Reading %s" % fastaFile)
+    with click.progressbar(fasta.fastaFeatures(fastaFile, threads, kmer)) as fi:
+        for contigid, variables in fi:
+            contigids.append(contigid)
+            values.extend(variables)
+    if len(contigids) != len(set(contigids)): # exit if duplicate contigs, https://stackoverflow.com/questions/5278122/checking-if-all-elements-in-a-list-are-unique
         raise ValueError("Input FASTA contains duplicate contigIDs, exiting")
-    return dict((x.contigid, x) for x in contigs)  # https://stackoverflow.com/questions/3070242/reduce-python-list-of-objects-to-dict-object-id-object
+    contigs = common.ContigStore(contigids, features + list(reserve))
+    contigs.X[:, :len(features)] = numpy.frombuffer(values, dtype=numpy.float32).reshape(-1, len(features))
+    return contigs
 
 
-def readBAM(BAMFile, contigs):
+def readCoverage(BAMFile, contigIDs=None, threads=1, cacheDir=None, useCache=True):
     """
     Parses an aligned BAM file for coverage.
 
     Args:
         BAMFile: The BAM file to parse.
-        contigs: List of sidr.common.Contigs taken from input FASTA.
+        contigIDs: A list of contigIDs to compute coverage for, by default every
+            reference in the BAM header, so the FASTA needn't be read first.
+        threads: Number of worker processes to split the contigs across.
+        cacheDir: Directory for the coverage cache, defaults to beside the BAM.
+        useCache: Set False to ignore and leave alone any cached coverage.
+    Returns:
+        coverage: A dictionary mapping contigIDs to coverage, measured as an
+            average over the whole contig.
+    """
+    click.echo("Reading BAM file")
+    if contigIDs is None:
+        with pysam.AlignmentFile(BAMFile, "rb") as alignment:
+            contigIDs = list(alignment.references)
+    if useCache:
+        return coverage.cachedCoverage(BAMFile, contigIDs, threads, cacheDir)
+    return coverage.bamCoverage(BAMFile, contigIDs, threads)  # coverage over contig = sum(coverage per base)/number of covered bases
+
+
+def addCoverage(contigs, covDict):
+    """
+    Fills in the coverage of each contig.
+
+    Args:
+        contigs: A sidr.common.ContigStore taken from input FASTA.
+        covDict: A dictionary mapping contigIDs to coverage, from readCoverage().
+    Returns:
+        contigs: Input contigs updated with coverage.
+    """
+    missing = [contig for contig in contigs.contigids if contig not in covDict]
+    if missing:
+        raise ValueError("%d contigs, including %s, are not in the BAM file, exiting" % (len(missing), missing[0]))
+    contigs.column("Coverage")[:] = [covDict[contig] for contig in contigs.contigids]
+    return contigs
+
+
+def readBAM(BAMFile, contigs, threads=1, cacheDir=None, useCache=True):
+    """
+    Parses an aligned BAM file for coverage.
+
+    Args:
+        BAMFile: The BAM file to parse.
+        contigs: A sidr.common.ContigStore taken from input FASTA.
+        threads: Number of worker processes to split the contigs across.
+        cacheDir: Directory for the coverage cache, defaults to beside the BAM.
+        useCache: Set False to ignore and leave alone any cached coverage.
     Returns:
         contigs: Input contigs updated with coverage, measured as an
                  average over the whole contig.
     """
-    alignment = pysam.AlignmentFile(BAMFile, "rb")
-    click.echo("Reading BAM file")
-    with click.progressbar(contigs) as ci:
-        for contig in ci:
-            covArray = [] # coverage over contig = sum(coverage per base)/number of bases
-            for pile in alignment.pileup(region=str(contig)):
-                covArray.append(pile.nsegments)
-            try:
-                contigs[contig].variables["Coverage"] = (sum(covArray) / len(covArray))
-            except ZeroDivisionError: # should only occur if 0 coverage recorded
-                contigs[contig].variables["Coverage"] = 0
+    return addCoverage(contigs, readCoverage(BAMFile, list(contigs.contigids), threads, cacheDir, useCache))
+
+
+def readHits(classification, contigs=None, idColumn=0, taxidColumn=1, threads=1):
+    """
+    Reads the first hit for each contig from a BLAST result file.
+
+    Args:
+        classification: A string containing the filename of the BLAST results, optionally
+            gzipped. The BLAST results must be tabular, by default in the format
+            -outfmt '6 qseqid staxids'; additional information can be added.
+        contigs: A sidr.common.ContigStore taken from input FASTA, or None to read
+            the BLAST results without it and match them up later with matchHits().
+        idColumn: Zero-based column of the BLAST results holding the qseqid.
+        taxidColumn: Zero-based column of the BLAST results holding the staxids.
+        threads: Number of worker processes to parse an uncompressed BLAST file with.
+    Returns:
+        hits: A dictionary mapping contigIDs to the taxid of their first hit.
+    """
+    click.echo("Reading %s" % classification)
+    contigIDs = None if contigs is None else contigs.index
+    if threads > 1 and not files.isGzip(classification):
+        hits, unmatched = blast.shardedFirstHits(classification, contigIDs, threads, idColumn, taxidColumn)
+    else:
+        with files.openText(classification) as data:
+            with click.progressbar(data) as dt:
+                hits, unmatched = blast.firstHits(dt, contigIDs, idColumn, taxidColumn)
+    if unmatched:
+        click.echo("%d BLAST hits for %d query IDs did not match a contig in the FASTA" % (sum(unmatched.values()), len(unmatched)))
+    return hits
+
+
+def matchHits(hits, contigs):
+    """
+    Keeps the hits of contigs in the FASTA, for BLAST results read without it.
+
+    Args:
+        hits: A dictionary mapping query IDs to taxids, from readHits().
+        contigs: A sidr.common.ContigStore taken from input FASTA.
+    Returns:
+        hits: The hits whose query ID is a contigID.
+    """
+    matched = dict((contig, taxid) for contig, taxid in hits.items() if contig in contigs.index)
+    if len(matched) < len(hits):
+        click.echo("%d BLAST query IDs did not match a contig in the FASTA" % (len(hits) - len(matched)))
+    return matched
+
+
+def classifyHits(hits, taxdump, classificationLevel, contigs):
+    """
+    Classifies contigs by the lineage of their first BLAST hit.
+
+    Args:
+        hits: A dictionary mapping contigIDs to taxids, from readHits().
+        taxdump: The NCBI taxdump as processed by parseTaxdump()
+        classificationLevel: The level of classification to save into the corpus.
+        contigs: A sidr.common.ContigStore taken from input FASTA
+    Returns:
+        contigs: Input contigs updated with classification form BLAST, with the class
+            names in contigs.classList.
+    """
+    hits = [(contig, taxid) for contig, taxid in hits.items() if not contigs.classification(contig)]
+    taxids = list(set(taxid for contig, taxid in hits))  # each distinct taxid is only resolved once
+    resolved = dict(zip(taxids, common.taxidsToLineages(taxids, taxdump, classificationLevel)))
+    contigs.classify([contig for contig, taxid in hits], [resolved[taxid].lower() for contig, taxid in hits])
     return contigs
 
 
-def readBLAST(classification, taxdump, classificationLevel, contigs):
+def readBLAST(classification, taxdump, classificationLevel, contigs, idColumn=0, taxidColumn=1, threads=1):
     """
     Reads a BLAST result file and combines it with other known information about the contigs.
 
     Args:
-        classification: A string containing the filename of the BLAST results. The BLAST
-            results must be in the format -outfmt '6 qseqid staxids', additional information
-            can be added but the first two fields must be qseqid and staxids.
+        classification: A string containing the filename of the BLAST results, optionally
+            gzipped. The BLAST results must be tabular, by default in the format
+            -outfmt '6 qseqid staxids'; additional information can be added.
         taxdump: The NCBI taxdump as processed by parseTaxdump()
         classificationLevel: The level of classification to save into the corpus. Defaults to phylum.
-        contigs: List of sidr.common.Contigs taken from input FASTA
+        contigs: A sidr.common.ContigStore taken from input FASTA
+        idColumn: Zero-based column of the BLAST results holding the qseqid.
+        taxidColumn: Zero-based column of the BLAST results holding the staxids.
+        threads: Number of worker processes to parse an uncompressed BLAST file with.
     Returns:
-        contigs: Input list of contigs updated with classification form BLAST
-        classMap: A dictionary mapping class names to their class id used by scikit-learn.
-        classList: A list of class names.
-    """
-    classList = []
-    classMap = {}
-    with open(classification) as data:
-        click.echo("Reading %s" % classification)
-        with click.progressbar(data) as dt:
-            for line in dt:
-                record = line.split("\t")
-                contig = record[0]
-                taxid = record[1].strip()
-                taxonomy = common.taxidToLineage(taxid, taxdump, classificationLevel)
-                taxonomy = taxonomy.lower()
-                try:
-                    if not contigs[contig].classification: # assume that the first hit in blast output is best
-                        contigs[contig].classification = taxonomy
-                        if taxonomy not in classList:
-                            classList.append(taxonomy)
-                except IndexError:  # if a contig is in BLAST but not FASTA (should be impossible but)
-                    continue
-    for idx, className in enumerate(classList):
-        classMap[className] = idx
-    return contigs, classMap, classList
-
-
-def runAnalysis(bam, fasta, blastresults, taxdump, modelOutput, output, tokeep, toremove, binary, target, level):
-    taxdump, taxidDict = common.parseTaxdump(taxdump, False)
-    gc.collect()
-    click.echo("Taxdump parsed, %d taxIDs loaded" % len(taxdump))
-    contigs = readFasta(fasta)
-    gc.collect()
-    click.echo("FASTA loaded, %d contigs returned" % len(contigs))
-    contigs = readBAM(bam, contigs)
-    gc.collect()
-    click.echo("BAM loaded")
-    contigs, classMap, classList = readBLAST(blastresults,
-                                             taxdump, level.lower(), contigs)
-    gc.collect()
-    click.echo("BLAST results loaded")
-    corpus, testdata, features = common.constructCorpus(list(contigs.values()), classMap, binary, target)
+        contigs: Input contigs updated with classification form BLAST, with the class
+            names in contigs.classList.
+    """
+    hits = readHits(classification, contigs, idColumn, taxidColumn, threads)
+    return classifyHits(hits, taxdump, classificationLevel, contigs)
+
+
+def indexTaxdump(blastdb, cacheDir=None):
+    """
+    Compiles the taxdump index if it is missing or out of date. The index is
+    memory-mapped, so once compiled it loads in any process almost for free.
+
+    Args:
+        blastdb: A string containing the root directory for the NCBI taxdump.
+        cacheDir: Directory for the compiled index if the taxdump directory is read-only.
+    Returns:
+        taxids: The number of taxids in the taxdump.
+    """
+    return len(common.parseTaxdump(blastdb, cacheDir))
+
+
+def runAnalysis(bam, fastaFile, blastresults, taxdump, modelOutput, output, tokeep, toremove, binary, target, level, threads=1, cacheDir=None, useCache=True, kmer=None, idColumn=0, taxidColumn=1, modelOptions=None, featureOutput=None, modelFile=None, recorder=None, workdir=None, concurrent=True, lazyTaxonomy=False):
+    recorder = recorder or metrics.Recorder()
+    checkpoints = checkpoint.Checkpoints(workdir, useCache)
+    if workdir:  # each key covers the stage's own inputs and parameters and those of every stage before it
+        fastaKey = checkpoint.stageKey("fasta", files.fileIdentity(fastaFile, sample=True), kmer)
+        bamKey = checkpoint.stageKey("bam", fastaKey, files.fileIdentity(bam, sample=True))
+        blastKey = checkpoint.stageKey("blast", bamKey, files.fileIdentity(blastresults, sample=True), taxonomy.fingerprint(taxdump), level.lower(), idColumn, taxidColumn)
+        fitOptions = {option: value for option, value in (modelOptions or {}).items() if option != "jobs"}  # jobs only changes how fast the model is fitted
+        modelKey = checkpoint.stageKey("model", blastKey, binary, target, fitOptions)
+    else:
+        fastaKey = bamKey = blastKey = modelKey = None
+    resumed = None
+    for stage, key in [("blast", blastKey), ("bam", bamKey), ("fasta", fastaKey)]:  # resume from the last valid stage
+        contigs = checkpoints.loadContigs(stage, key)
+        if contigs is not None:
+            resumed = stage
+            break
+    if resumed != "blast":  # the taxdump, FASTA, BLAST and BAM don't depend on each other, so they are read side by side
+        pooled = {None: 3, "fasta": 2, "bam": 1}[resumed]  # FASTA, BLAST and BAM stages left to run, which share the threads when run side by side
+        concurrent = concurrent and threads > 1
+        stageThreads = max(1, threads // pooled) if concurrent else threads
+        stages = [scheduler.Stage("fasta", readFasta, dict(fastaFile=fastaFile, threads=stageThreads, kmer=kmer)),
+                  scheduler.Stage("blast", readHits, dict(classification=blastresults, idColumn=idColumn, taxidColumn=taxidColumn, threads=stageThreads))]
+        if not lazyTaxonomy:  # in lazy mode the taxdump is read once the BLAST taxids are known
+            stages.insert(0, scheduler.Stage("taxdump", indexTaxdump, dict(blastdb=taxdump, cacheDir=cacheDir), items=int))
+        if resumed != "bam":
+            stages.append(scheduler.Stage("bam", readCoverage, dict(BAMFile=bam, threads=stageThreads, cacheDir=cacheDir, useCache=useCache)))
+
+        def finished(stage, result):
+            if stage == "fasta":
+                checkpoints.saveContigs("fasta", fastaKey, result)
+                click.echo("FASTA loaded, %d contigs returned" % len(result))
+            elif stage == "taxdump":
+                click.echo("Taxdump indexed, %d taxIDs loaded" % result)
+            else:
+                click.echo("%s loaded" % stage.upper())
+        results = scheduler.runStages(stages, recorder, dict(fasta=contigs) if resumed else None, concurrent, finished)
+        contigs = results["fasta"]
+        if resumed != "bam":
+            contigs = addCoverage(contigs, results["bam"])
+            checkpoints.saveContigs("bam", bamKey, contigs)
+        with recorder.stage("classify", len(contigs)):
+            hits = matchHits(results["blast"], contigs)
+            observed = common.parseTaxids(set(hits.values())) if lazyTaxonomy else None
+            taxdump = common.parseTaxdump(taxdump, cacheDir, observed)
+            if lazyTaxonomy and taxdump.taxids is not None:
+                click.echo("Taxdump loaded lazily, %d taxIDs on the lineages of %d BLAST taxIDs" % (len(taxdump), len(set(observed))))
+            elif lazyTaxonomy:  # a compiled index is only read where these lineages are
+                click.echo("Taxdump index mapped, resolving the lineages of %d BLAST taxIDs" % len(set(observed)))
+            contigs = classifyHits(hits, taxdump, level.lower(), contigs)
+            del taxdump, hits
+        checkpoints.saveContigs("blast", blastKey, contigs)
+        del results
+        gc.collect()
+        click.echo("BLAST results classified")
+    if featureOutput:
+        contigs.save(featureOutput)
+        click.echo("Features saved to %s" % featureOutput)
+    with recorder.stage("corpus", len(contigs)):
+        corpus, testdata, features = common.constructCorpus(contigs, binary, target)
     gc.collect()
-    click.echo("Corpus constucted, %d contigs in corpus and %d contigs in test data" % (len(corpus), len(testdata)))
-    classifier = common.constructModel(corpus, classList, features, modelOutput)
-    result = common.classifyData(classifier, testdata, classMap)
-    common.generateOutput(tokeep, toremove, result, contigs.values(), target, output)
+    click.echo("Corpus constucted, %d contigs in corpus and %d contigs in test data" % (len(corpus.Y), len(testdata.contigids)))
+    model = checkpoints.loadModel(modelKey)
+    if model is None:
+        with recorder.stage("train", len(corpus.Y)):
+            classifier = common.constructModel(corpus, features, modelOutput, **(modelOptions or {}))
+        model = common.Model(classifier, features, corpus.classNames, level.lower(), target, binary, kmer)
+        checkpoints.saveModel(modelKey, model)
+    if modelFile:
+        common.saveModel(modelFile, model)
+        click.echo("Model saved to %s" % modelFile)
+    with recorder.stage("output", len(contigs)):
+        result = common.classifyData(model.classifier, testdata, corpus.classNames, threads=threads, probabilities=writers.outputFormat(output) != "text")
+        result = recorder.timed("predict", result, lambda batch: len(batch[0]))
+        common.generateOutput(tokeep, toremove, result, contigs, target, output, corpus.classNames)
+    return recorder
@@ -0,0 +1,394 @@
+import io
+import itertools
+import multiprocessing
+import numpy
+import os
+import pysam
+
+from collections import deque
+from sidr import files
+from sidr import coverage
+
+BLOCK_SIZE = 8 * 1024 * 1024  # bytes read at a time when streaming
+WINDOW_SIZE = 8 * 1024 * 1024  # bases fetched at a time through a .fai index
+GC_BASES = b"GCgcSs"  # counted the same way as Bio.SeqUtils.GC
+IGNORED = b" \r\n"  # stripped from sequence lines, as by Bio.SeqIO
+SEQUENCE_BATCH = 16  # contigs handed to a worker at a time when streaming k-mer profiles
+
+BASE_CODES = numpy.full(256, -1, dtype=numpy.int8)  # byte value to k-mer base code, -1 for anything but ACGT
+for code, base in enumerate("ACGT"):
+    BASE_CODES[ord(base)] = BASE_CODES[ord(base.lower())] = code
+_canonical = {}  # memoized canonicalKmers() results, {k: (canonical, names)}
+
+
+def countGC(sequence):
+    """
+    Counts the bases and the G/C/S bases in a chunk of raw sequence.
+
+    Args:
+        sequence: Bytes of sequence, possibly containing line breaks.
+    Returns:
+        length: Number of bases, ignoring whitespace.
+        gc: Number of G, C or S bases in either case.
+    """
+    sequence = sequence.translate(None, IGNORED)
+    return len(sequence), len(sequence) - len(sequence.translate(None, GC_BASES))
+
+
+def percentGC(length, gc):
+    """
+    Converts base counts to GC content, as a percentage.
+
+    Args:
+        length: Number of bases.
+        gc: Number of G, C or S bases.
+    Returns:
+        gc: GC content as a percentage, or 0 for an empty sequence.
+    """
+    if not length:
+        return 0
+    return gc * 100.0 / length
+
+
+def kmerNames(k):
+    """
+    Lists the canonical k-mers, each standing for itself and its reverse complement.
+
+    Args:
+        k: The k-mer length.
+    Returns:
+        names: A list of canonical k-mers, in feature order.
+    """
+    return canonicalKmers(k)[1]
+
+
+def canonicalKmers(k):
+    """
+    Builds, or returns the memoized copy of, the mapping from every k-mer code
+    to its canonical k-mer. A k-mer's code is its sequence read as a base 4
+    number with A=0, C=1, G=2 and T=3.
+
+    Args:
+        k: The k-mer length.
+    Returns:
+        canonical: An array mapping each of the 4^k codes to a canonical index.
+        names: A list of canonical k-mers, in canonical index order.
+    """
+    if k not in _canonical:
+        codes = numpy.arange(4 ** k)
+        reverse = numpy.zeros(4 ** k, dtype=numpy.int64)
+        remaining = codes.copy()
+        for _ in range(k):  # read the bases off the end, complemented, onto the front
+            reverse = reverse * 4 + (3 - remaining % 4)
+            remaining //= 4
+        unique, canonical = numpy.unique(numpy.minimum(codes, reverse), return_inverse=True)
+        names = ["".join("ACGT"[(code >> (2 * (k - 1 - i))) & 3] for i in range(k)) for code in unique]
+        _canonical[k] = (canonical.reshape(-1), names)
+    return _canonical[k]
+
+
+def kmerCounts(sequence, k):
+    """
+    Counts every k-mer in a chunk of sequence with array operations. K-mers
+    containing anything other than A, C, G or T are skipped.
+
+    Args:
+        sequence: Bytes of sequence without whitespace.
+        k: The k-mer length.
+    Returns:
+        counts: An array of 4^k counts, indexed by k-mer code.
+    """
+    codes = BASE_CODES[numpy.frombuffer(sequence, dtype=numpy.uint8)].astype(numpy.int64)
+    windows = len(codes) - k + 1
+    if windows <= 0:
+        return numpy.zeros(4 ** k, dtype=numpy.int64)
+    invalid = numpy.concatenate(([0], numpy.cumsum(codes < 0)))
+    valid = (invalid[k:] - invalid[:-k]) == 0
+    index = numpy.zeros(windows, dtype=numpy.int64)
+    for offset in range(k):
+        index = index * 4 + codes[offset:offset + windows]
+    return numpy.bincount(index[valid], minlength=4 ** k)
+
+
+def kmerProfile(counts, k):
+    """
+    Folds raw k-mer counts onto canonical k-mers and normalizes them to frequencies.
+
+    Args:
+        counts: An array of 4^k counts from kmerCounts().
+        k: The k-mer length.
+    Returns:
+        profile: An array of canonical k-mer frequencies, in kmerNames() order.
+    """
+    canonical, names = canonicalKmers(k)
+    folded = numpy.bincount(canonical, weights=counts, minlength=len(names))
+    total = folded.sum()
+    if total:
+        folded /= total
+    return folded
+
+
+def featureNames(kmer=None):
+    """
+    Lists the variables computed from a FASTA file.
+
+    Args:
+        kmer: The k-mer length to profile, or None for GC content only.
+    Returns:
+        names: A list of variable names, in the order features() returns them.
+    """
+    names = ["GC"]
+    if kmer:
+        names.extend("kmer_%s" % name for name in kmerNames(kmer))
+    return names
+
+
+def scanFasta(handle):
+    """
+    Splits a FASTA file into records in a single streaming pass over raw byte
+    blocks, without building per-contig sequence objects.
+
+    Args:
+        handle: A binary file-like object positioned at the start of the FASTA.
+    Yields:
+        event: A tuple of (contigID, None) at the start of each record, followed
+            by (contigID, chunk) for each chunk of raw sequence bytes in it.
+    """
+    contigid = None
+    buf = b""
+    atLineStart = True
+    while True:
+        block = handle.read(BLOCK_SIZE)
+        if not block:
+            break
+        buf += block
+        pos = 0
+        while pos < len(buf):
+            if atLineStart and buf[pos:pos + 1] == b">":
+                end = buf.find(b"\n", pos)
+                if end < 0:  # header continues in the next block
+                    break
+                title = buf[pos + 1:end].split(None, 1)
+                contigid = title[0].decode("utf-8") if title else ""
+                yield contigid, None
+                pos = end + 1
+                continue
+            end = buf.find(b"\n>", pos)
+            end = len(buf) if end < 0 else end + 1
+            if contigid is not None:  # text before the first header is ignored
+                yield contigid, buf[pos:end]
+            atLineStart = buf[end - 1:end] == b"\n"
+            pos = end
+        buf = buf[pos:]
+    if buf:  # final header without a trailing newline
+        title = buf[1:].split(None, 1)
+        yield title[0].decode("utf-8") if title else "", None
+
+
+def streamFeatures(handle, kmer=None):
+    """
+    Computes GC content, and optionally a canonical k-mer profile, for each
+    record of a FASTA file. Only k-1 bases are carried between chunks, so memory
+    does not depend on contig length.
+
+    Args:
+        handle: A binary file-like object positioned at the start of the FASTA.
+        kmer: The k-mer length to profile, or None for GC content only.
+    Yields:
+        record: A tuple of (contigID, array of feature values).
+    """
+    contigid = None
+    for nextid, chunk in scanFasta(handle):
+        if chunk is None:
+            if contigid is not None:
+                yield contigid, features(length, gc, counts, kmer)
+            contigid = nextid
+            length = gc = 0
+            counts = numpy.zeros(4 ** kmer, dtype=numpy.int64) if kmer else None
+            carry = b""
+            continue
+        chunk = chunk.translate(None, IGNORED)
+        length, gc = length + len(chunk), gc + len(chunk) - len(chunk.translate(None, GC_BASES))
+        if kmer:
+            chunk = carry + chunk
+            counts += kmerCounts(chunk, kmer)
+            carry = chunk[len(chunk) - kmer + 1:] if len(chunk) >= kmer else chunk
+    if contigid is not None:
+        yield contigid, features(length, gc, counts, kmer)
+
+
+def features(length, gc, counts, kmer):
+    """
+    Assembles the feature values for one contig.
+
+    Args:
+        length: Number of bases.
+        gc: Number of G, C or S bases.
+        counts: Raw k-mer counts from kmerCounts(), or None.
+        kmer: The k-mer length, or None.
+    Returns:
+        variables: A float32 array of values, in featureNames() order.
+    """
+    variables = numpy.empty(len(featureNames(kmer)), dtype=numpy.float32)
+    variables[0] = percentGC(length, gc)
+    if kmer:
+        variables[1:] = kmerProfile(counts, kmer)
+    return variables
+
+
+def streamSequences(handle):
+    """
+    Reads each record of a FASTA file into a single bytes object, for handing
+    whole contigs to worker processes.
+
+    Args:
+        handle: A binary file-like object positioned at the start of the FASTA.
+    Yields:
+        record: A tuple of (contigID, sequence bytes including line breaks).
+    """
+    contigid = None
+    for nextid, chunk in scanFasta(handle):
+        if chunk is None:
+            if contigid is not None:
+                yield contigid, b"".join(chunks)
+            contigid = nextid
+            chunks = []
+        else:
+            chunks.append(chunk)
+    if contigid is not None:
+        yield contigid, b"".join(chunks)
+
+
+def sequenceWorker(args):
+    """
+    Computes the features of a single contig sequence.
+
+    Args:
+        args: A tuple of ((contigID, sequence), kmer).
+    Returns:
+        record: A tuple of (contigID, array of feature values).
+    """
+    (contigid, sequence), kmer = args
+    return next(streamFeatures(io.BytesIO(b">" + contigid.encode("utf-8") + b"\n" + sequence), kmer))
+
+
+def sequenceBatchWorker(args):
+    """
+    Computes the features of a batch of contig sequences.
+
+    Args:
+        args: A tuple of ([(contigID, sequence), ...], kmer).
+    Returns:
+        records: A list of (contigID, array of feature values) tuples.
+    """
+    records, kmer = args
+    return [sequenceWorker((record, kmer)) for record in records]
+
+
+def faidxWorker(args):
+    """
+    Computes the features of one shard of contigs through a .fai index.
+
+    Args:
+        args: A tuple of (fastaFile, contigIDs, kmer).
+    Returns:
+        records: A list of (contigID, array of feature values) tuples.
+    """
+    fastaFile, contigIDs, kmer = args
+    result = []
+    with pysam.FastaFile(fastaFile) as fa:
+        for contig in contigIDs:
+            length = gc = 0
+            counts = numpy.zeros(4 ** kmer, dtype=numpy.int64) if kmer else None
+            contigLength = fa.get_reference_length(contig)
+            overlap = kmer - 1 if kmer else 0  # windows overlap so no k-mer is lost at the seams
+            for start in range(0, contigLength, WINDOW_SIZE):
+                chunk = fa.fetch(contig, start, min(start + WINDOW_SIZE + overlap, contigLength)).encode("ascii")
+                l, g = countGC(chunk[:WINDOW_SIZE])
+                length, gc = length + l, gc + g
+                if kmer:
+                    counts += kmerCounts(chunk, kmer)
+            result.append((contig, features(length, gc, counts, kmer)))
+    return result
+
+
+def faidxFeatures(fastaFile, threads, kmer=None):
+    """
+    Computes contig features by splitting contigs across worker processes, each
+    of which seeks to its own contigs through the .fai index. Works with plain
+    and bgzipped FASTA files.
+
+    Args:
+        fastaFile: The path to the indexed FASTA file.
+        threads: Number of worker processes to use.
+        kmer: The k-mer length to profile, or None for GC content only.
+    Returns:
+        records: A list of (contigID, array of feature values) tuples in FASTA order.
+    """
+    with pysam.FastaFile(fastaFile) as fa:
+        references = list(fa.references)
+        lengths = dict(zip(references, fa.lengths))
+    shards = coverage.balanceContigs(lengths, threads * 4)
+    result = {}
+    pool = multiprocessing.Pool(threads)
+    try:
+        for shard in pool.imap_unordered(faidxWorker, [(fastaFile, shard, kmer) for shard in shards]):
+            result.update(shard)
+    finally:
+        pool.terminate()
+    return [(contig, result[contig]) for contig in references]
+
+
+def streamFeaturesFile(fastaFile, threads=1, kmer=None):
+    """
+    Opens a FASTA file and computes the features of each record. When k-mer
+    profiles are requested with more than one thread, batches of whole contigs
+    are handed to a pool of worker processes, at most threads * 2 batches at a
+    time so the assembly is never buffered in full; otherwise records are
+    processed in a single streaming pass.
+
+    Args:
+        fastaFile: The path to the FASTA file, optionally gzip or bgzip compressed.
+        threads: Number of worker processes or decompression threads to use.
+        kmer: The k-mer length to profile, or None for GC content only.
+    Yields:
+        record: A tuple of (contigID, array of feature values).
+    """
+    with files.openInput(fastaFile, threads) as data:
+        if kmer and threads > 1:
+            pool = multiprocessing.Pool(threads)
+            try:
+                sequences = streamSequences(data)
+                pending = deque()
+                while True:
+                    batch = list(itertools.islice(sequences, SEQUENCE_BATCH))
+                    if batch:
+                        pending.append(pool.apply_async(sequenceBatchWorker, ((batch, kmer),)))
+                    if pending and (not batch or len(pending) >= threads * 2):  # bound the contigs held in memory
+                        for record in pending.popleft().get():
+                            yield record
+                    elif not batch:
+                        break
+            finally:
+                pool.terminate()
+        else:
+            for record in streamFeatures(data, kmer):
+                yield record
+
+
+def fastaFeatures(fastaFile, threads=1, kmer=None):
+    """
+    Computes GC content, and optionally canonical k-mer profiles, for every
+    contig in a FASTA file, in parallel through the .fai index when one exists
+    and more than one thread is allowed, otherwise by streaming the file.
+
+    Args:
+        fastaFile: The path to the FASTA file, optionally gzip or bgzip compressed.
+        threads: Number of worker processes or decompression threads to use.
+        kmer: The k-mer length to profile, or None for GC content only.
+    Returns:
+        records: An iterable of (contigID, array of feature values) tuples in FASTA order.
+    """
+    if threads > 1 and os.path.isfile(fastaFile + ".fai") and (not files.isGzip(fastaFile) or files.isBGZF(fastaFile)):
+        return faidxFeatures(fastaFile, threads, kmer)
+    return streamFeaturesFile(fastaFile, threads, kmer)
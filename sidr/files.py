@@ -0,0 +1,165 @@
+import contextlib
+import gzip
+import hashlib
+import os
+import subprocess
+import tempfile
+
+PIPE_SIZE = 8 * 1024 * 1024  # bytes buffered from a decompressing bgzip
+SAMPLE_SIZE = 1024 * 1024  # bytes hashed from the start, middle and end of a file by fileIdentity()
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "sidr")
+
+
+def which(program):
+    """
+    Finds an executable on $PATH.
+
+    Args:
+        program: Name of the executable.
+    Returns:
+        path: Full path to the executable, or None if it is not on $PATH.
+    """
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        path = os.path.join(directory, program)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def isBGZF(path):
+    """
+    Checks whether a file is BGZF compressed (as written by bgzip), rather than
+    plain gzip or uncompressed.
+
+    Args:
+        path: The path to the file.
+    Returns:
+        bgzf: True if the file starts with a BGZF block header.
+    """
+    with open(path, "rb") as f:
+        header = bytearray(f.read(18))
+    return len(header) == 18 and header[:4] == bytearray(b"\x1f\x8b\x08\x04") and header[12:14] == bytearray(b"BC")
+
+
+def isGzip(path):
+    """
+    Checks whether a file is gzip compressed, BGZF included.
+
+    Args:
+        path: The path to the file.
+    Returns:
+        gzip: True if the file starts with the gzip magic number.
+    """
+    with open(path, "rb") as f:
+        return bytearray(f.read(2)) == bytearray(b"\x1f\x8b")
+
+
+@contextlib.contextmanager
+def openInput(path, threads=1):
+    """
+    Opens an input file, such as a FASTA file, for streaming as bytes,
+    decompressing it if needed. BGZF files are decompressed by a multi-threaded
+    bgzip when one is installed.
+
+    Args:
+        path: The path to the file.
+        threads: Number of decompression threads to allow.
+    Yields:
+        handle: A binary file-like object.
+    """
+    if not isGzip(path):
+        with open(path, "rb") as data:
+            yield data
+    elif threads > 1 and isBGZF(path) and which("bgzip"):
+        proc = subprocess.Popen([which("bgzip"), "-d", "-c", "-@", str(threads), path], stdout=subprocess.PIPE, bufsize=PIPE_SIZE)
+        try:
+            yield proc.stdout
+        finally:
+            proc.stdout.close()
+            if proc.wait() not in (0, -13):  # SIGPIPE when we stop reading early
+                raise IOError("bgzip failed to decompress %s" % path)
+    else:
+        with gzip.open(path, "rb") as data:
+            yield data
+
+
+def openText(path):
+    """
+    Opens a text file, such as BLAST results or a contig list, decompressing it
+    if it is gzipped.
+
+    Args:
+        path: The path to the file.
+    Returns:
+        handle: A text file-like object.
+    """
+    if isGzip(path):
+        return gzip.open(path, "rt")
+    return open(path)
+
+
+def fileIdentity(path, sample=False):
+    """
+    Describes a file cheaply enough to tell when it changes: its size and
+    modification time, and optionally a hash of its start, middle and end.
+    Hashing whole inputs would cost as much as reading them, so these stand in
+    for a content hash.
+
+    Args:
+        path: The file to describe.
+        sample: Set True to also hash SAMPLE_SIZE bytes from the start, middle
+            and end of the file, to notice changes that keep its size and mtime.
+    Returns:
+        identity: A list of [size, mtime], plus the hex digest of the samples if
+            sample is set, or None if path is empty.
+    """
+    if not path:
+        return None
+    stat = os.stat(path)
+    identity = [stat.st_size, stat.st_mtime]
+    if sample:
+        digest = hashlib.sha1()
+        with open(path, "rb") as data:
+            for offset in sorted(set([0, max(0, stat.st_size // 2 - SAMPLE_SIZE // 2), max(0, stat.st_size - SAMPLE_SIZE)])):
+                data.seek(offset)
+                digest.update(data.read(SAMPLE_SIZE))
+        identity.append(digest.hexdigest())
+    return identity
+
+
+def atomicWrite(path, write):
+    """
+    Writes a file through a temporary file beside it that is renamed into place,
+    so a crashed or concurrent run never leaves a half-written file behind.
+
+    Args:
+        path: The file to write, its directory created if missing.
+        write: Function writing the contents to the temporary path it is given.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmpPath = tempfile.mkstemp(prefix=".%s-" % os.path.basename(path), dir=directory)
+    os.close(fd)
+    try:
+        write(tmpPath)
+        os.rename(tmpPath, path)
+    except Exception:
+        os.remove(tmpPath)
+        raise
+
+
+def userCachePath(path, kind, cacheDir=None):
+    """
+    Names the file or directory kept for an input in the per-user cache, for
+    when it can't be kept beside the input.
+
+    Args:
+        path: The input being cached.
+        kind: What is cached, which starts the name.
+        cacheDir: Cache directory to use, defaults to ~/.cache/sidr.
+    Returns:
+        cachePath: A path unique to the input's absolute path, which may not exist yet.
+    """
+    key = hashlib.md5(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(cacheDir or DEFAULT_CACHE, "%s-%s" % (kind, key))
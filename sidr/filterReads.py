@@ -0,0 +1,199 @@
+import click
+import contextlib
+import io
+import os
+import pysam
+import shutil
+import subprocess
+import tempfile
+
+from sidr import files
+from sidr import writers
+
+SKIP_FLAGS = 0x100 | 0x800  # secondary and supplementary alignments, which repeat a primary read
+
+
+def readContigList(tokeep):
+    """
+    Reads a list of contigIDs, one per line, as written by --tokeep.
+
+    Args:
+        tokeep: Path to the list, optionally gzipped.
+    Returns:
+        contigs: A set of contigIDs.
+    """
+    with files.openText(tokeep) as data:
+        return set(line.strip() for line in data if line.strip())
+
+
+def keptReferences(alignment, contigs):
+    """
+    Hashes the kept contigs to the reference ids of a BAM file, so each read is
+    tested with an integer lookup.
+
+    Args:
+        alignment: An open pysam.AlignmentFile.
+        contigs: A set of contigIDs to keep.
+    Returns:
+        kept: A frozenset of reference ids.
+    """
+    kept = frozenset(tid for tid in (alignment.get_tid(contig) for contig in contigs) if tid >= 0)
+    if len(kept) < len(contigs):
+        click.echo("%d contigs to keep are not in the BAM header" % (len(contigs) - len(kept)))
+    return kept
+
+
+def isGrouped(alignment):
+    """
+    Checks whether mates are next to each other in a BAM file. Only a header
+    that declares it can be trusted, as unsorted or unknown orders needn't keep
+    mates together.
+
+    Args:
+        alignment: An open pysam.AlignmentFile.
+    Returns:
+        grouped: True if the header declares SO:queryname or GO:query.
+    """
+    header = alignment.header.to_dict().get("HD", {})
+    return header.get("SO") == "queryname" or header.get("GO") == "query"
+
+
+def fastqRecord(read, mate):
+    """
+    Formats a read as FASTQ in its original orientation.
+
+    Args:
+        read: A pysam.AlignedSegment.
+        mate: "1" or "2" to append /1 or /2 to the read name, or "" for single reads.
+    Returns:
+        record: The FASTQ record as a string.
+    """
+    qualities = read.get_forward_qualities()
+    sequence = read.get_forward_sequence()
+    quality = pysam.qualities_to_qualitystring(qualities) if qualities is not None else "I" * len(sequence)
+    return "@%s%s\n%s\n+\n%s\n" % (read.query_name, "/" + mate if mate else "", sequence, quality)
+
+
+def keptPairs(reads, kept):
+    """
+    Pairs up mates from a stream of reads where mates are close together, keeping
+    pairs where either mate is aligned to a kept contig.
+
+    Only reads whose mate has not been seen yet are held, so memory stays small
+    when mates are adjacent, as in collated or aligner-ordered BAM files.
+
+    Args:
+        reads: An iterable of pysam.AlignedSegment objects.
+        kept: A set of reference ids to keep, from keptReferences().
+    Yields:
+        pair: A tuple of (read 1, read 2) for a kept pair, or (read, None) for a
+            kept read without a mate.
+    """
+    pending = {}
+    for read in reads:
+        if read.flag & SKIP_FLAGS:
+            continue
+        keep = read.reference_id in kept or (read.is_paired and read.next_reference_id in kept)
+        if not read.is_paired:
+            if keep:
+                yield read, None
+            continue
+        mate = pending.pop(read.query_name, None)
+        if mate is None:
+            pending[read.query_name] = read
+        elif keep or mate.reference_id in kept or mate.next_reference_id in kept:
+            yield (read, mate) if read.is_read1 else (mate, read)
+    for read in pending.values():  # mates missing from the BAM
+        if read.reference_id in kept or read.next_reference_id in kept:
+            yield read, None
+
+
+@contextlib.contextmanager
+def openFastq(path, threads=1):
+    """
+    Opens a FASTQ file for writing, BGZF compressed by a multi-threaded bgzip
+    for .gz paths when one is installed.
+
+    Args:
+        path: The path to write.
+        threads: Number of compression threads to allow.
+    Yields:
+        handle: A writable text file object.
+    """
+    if not path.lower().endswith(".gz") or not files.which("bgzip"):
+        with writers.openText(path) as handle:
+            yield handle
+        return
+    with open(path, "wb") as out:
+        proc = subprocess.Popen([files.which("bgzip"), "-c", "-@", str(threads)], stdin=subprocess.PIPE, stdout=out, bufsize=writers.BUFFER_SIZE)
+        handle = io.TextIOWrapper(proc.stdin, encoding="utf-8")
+        try:
+            yield handle
+        finally:
+            handle.close()
+            if proc.wait() != 0:
+                raise IOError("bgzip failed to compress %s" % path)
+
+
+@contextlib.contextmanager
+def groupedBAM(BAMFile, threads=1):
+    """
+    Opens a BAM file with mates next to each other, collating a coordinate-sorted
+    BAM into a temporary file first. Collation works through temporary files on
+    disk, so memory use does not depend on the size of the BAM.
+
+    Args:
+        BAMFile: The BAM file to open.
+        threads: Number of BGZF decompression and compression threads.
+    Yields:
+        alignment: An open pysam.AlignmentFile with mates grouped.
+    """
+    with pysam.AlignmentFile(BAMFile, "rb", threads=threads) as alignment:
+        if isGrouped(alignment):
+            yield alignment
+            return
+    click.echo("Collating %s so mates are together" % BAMFile)
+    tmpDir = tempfile.mkdtemp(prefix="sidr-filter-", dir=os.path.dirname(os.path.abspath(BAMFile)) if os.access(os.path.dirname(os.path.abspath(BAMFile)), os.W_OK) else None)
+    try:
+        collated = os.path.join(tmpDir, "collated.bam")
+        pysam.collate("-@", str(threads), "-T", os.path.join(tmpDir, "collate"), "-o", collated, BAMFile, catch_stdout=False)
+        with pysam.AlignmentFile(collated, "rb", threads=threads) as alignment:
+            yield alignment
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+
+
+def runFilter(tokeep, BAMFile, output1, output2, singletons=None, threads=1):
+    """
+    Writes the reads aligned to the kept contigs as paired FASTQ files. A pair is
+    kept when either mate is aligned to a kept contig, and mates are always
+    written together.
+
+    Args:
+        tokeep: Path to the list of contigIDs to keep.
+        BAMFile: The BAM file of reads aligned to the assembly.
+        output1: Path to write the first mates to.
+        output2: Path to write the second mates to.
+        singletons: Path to write kept reads without a mate to, or None to drop them.
+        threads: Number of BGZF compression and decompression threads.
+    """
+    contigs = readContigList(tokeep)
+    click.echo("%d contigs to keep" % len(contigs))
+    pairs = 0
+    single = 0
+    with contextlib.ExitStack() as handles:
+        alignment = handles.enter_context(groupedBAM(BAMFile, threads))
+        kept = keptReferences(alignment, contigs)
+        out1 = handles.enter_context(openFastq(output1, threads))
+        out2 = handles.enter_context(openFastq(output2, threads))
+        out0 = handles.enter_context(openFastq(singletons, threads)) if singletons else None
+        for read1, read2 in keptPairs(alignment.fetch(until_eof=True), kept):
+            if read2 is not None:
+                out1.write(fastqRecord(read1, "1"))
+                out2.write(fastqRecord(read2, "2"))
+                pairs += 1
+            else:
+                single += 1
+                if out0:
+                    out0.write(fastqRecord(read1, ""))
+    click.echo("%d read pairs and %d unpaired reads kept" % (pairs, single))
@@ -0,0 +1,209 @@
+import cProfile
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+STATUS = "/proc/self/status"
+CLEAR_REFS = "/proc/self/clear_refs"
+STAGES = ["taxdump", "fasta", "bam", "blast", "classify", "corpus", "train", "predict", "output"]  # stages of default mode, in order
+TRACEMALLOC_TOP = 50  # allocation sites listed in a tracemalloc dump
+
+
+def resetPeak():
+    """
+    Resets the kernel's record of this process's peak RSS so the next stage is
+    measured on its own. Only possible on Linux.
+
+    Returns:
+        reset: True if the peak was reset.
+    """
+    try:
+        with open(CLEAR_REFS, "w") as refs:
+            refs.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def peakRSS():
+    """
+    Reads the peak resident set size of this process.
+
+    Returns:
+        peak: Peak RSS in bytes, since the last resetPeak() where supported,
+            otherwise since the process started.
+    """
+    try:
+        with open(STATUS) as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # kilobytes everywhere but macOS
+
+
+def finish(record, startWall, startTimes):
+    """
+    Adds the time since the start of a stage to its record, and its peak memory.
+
+    Args:
+        record: The stage's metrics dictionary.
+        startWall: time.perf_counter() at the start of the stage.
+        startTimes: os.times() at the start of the stage.
+    """
+    endTimes = os.times()
+    record["wall"] = record.get("wall", 0.0) + time.perf_counter() - startWall
+    record["cpu"] = record.get("cpu", 0.0) + sum(endTimes[:4]) - sum(startTimes[:4])  # user and system time, including finished worker processes
+    record["peakRSS"] = peakRSS()
+
+
+def formatTable(rows, columns):
+    """
+    Lays out rows of cells as a plain text table with left-aligned columns.
+
+    Args:
+        rows: A list of rows, each a list of cell strings.
+        columns: The column headings.
+    Returns:
+        table: The table as a string.
+    """
+    rows = [list(columns)] + [list(row) for row in rows]
+    widths = [max(len(row[col]) for row in rows) for col in range(len(columns))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows)
+
+
+class Recorder(object):  # collects wall time, CPU time, peak memory and throughput for each stage of a run
+    def __init__(self, profileStage=None, profileDir="."):
+        """
+        Args:
+            profileStage: Name of a stage to run under cProfile and tracemalloc, or None.
+            profileDir: Directory to write the profile of that stage to.
+        """
+        self.stages = []
+        self.profileStage = profileStage
+        self.profileDir = profileDir
+        self._nested = []  # records timed inside the open stage, see timed()
+
+    @contextlib.contextmanager
+    def stage(self, name, items=None):
+        """
+        Measures one stage of a run. Time spent in iterators wrapped by timed()
+        during the stage is recorded against them rather than this stage.
+
+        Args:
+            name: The stage name.
+            items: Number of items (contigs, lines, taxids) the stage handles, if
+                known up front. It can also be set on the yielded record.
+        Yields:
+            record: The dictionary the stage's metrics are recorded in.
+        """
+        record = {"stage": name, "items": items, "started": time.time()}
+        self._nested = []
+        profiler = self.startProfile(name)
+        resetPeak()
+        startTimes = os.times()
+        startWall = time.perf_counter()
+        try:
+            yield record
+        finally:
+            finish(record, startWall, startTimes)
+            record["finished"] = time.time()
+            for nested in self._nested:
+                record["wall"] -= nested["wall"]
+                record["cpu"] -= nested["cpu"]
+            self.throughput(record)
+            self.stopProfile(name, profiler)
+            self.stages.append(record)
+
+    def timed(self, name, iterable, count=len):
+        """
+        Measures the time spent producing the items of an iterator, such as the
+        batches of a prediction streamed into the output stage, as its own stage.
+
+        Args:
+            name: The stage name.
+            iterable: The iterable to measure.
+            count: Function giving the number of items in each thing produced.
+        Yields:
+            item: Each item of iterable.
+        """
+        record = {"stage": name, "items": 0, "wall": 0.0, "cpu": 0.0, "started": time.time()}  # from the first item asked for
+        self._nested.append(record)
+        profiler = self.startProfile(name)
+        iterator = iter(iterable)
+        try:
+            while True:
+                startTimes = os.times()
+                startWall = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    finish(record, startWall, startTimes)
+                record["items"] += count(item)
+                yield item
+        finally:
+            record["finished"] = time.time()
+            self.throughput(record)
+            self.stopProfile(name, profiler)
+            self.stages.append(record)
+
+    @staticmethod
+    def throughput(record):
+        record["throughput"] = record["items"] / record["wall"] if record["items"] and record["wall"] > 0 else None
+
+    def startProfile(self, name):
+        if name != self.profileStage:
+            return None
+        tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stopProfile(self, name, profiler):
+        """
+        Writes the cProfile statistics of a profiled stage to sidr-<stage>.prof,
+        readable with pstats or snakeviz, and its largest allocation sites to
+        sidr-<stage>.tracemalloc.txt.
+        """
+        if profiler is None:
+            return
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        if not os.path.isdir(self.profileDir):
+            os.makedirs(self.profileDir)
+        profiler.dump_stats(os.path.join(self.profileDir, "sidr-%s.prof" % name))
+        with open(os.path.join(self.profileDir, "sidr-%s.tracemalloc.txt" % name), "w") as out:
+            out.write("".join("%s\n" % stat for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]))
+
+    def toJSON(self):
+        return json.dumps(self.stages, indent=2)
+
+    def writeJSON(self, path):
+        with open(path, "w") as out:
+            out.write(self.toJSON() + "\n")
+
+    def table(self):
+        """
+        Lays out the recorded stages as a plain text table.
+
+        Returns:
+            table: The table as a string.
+        """
+        rows = []
+        for record in self.stages:
+            rows.append([record["stage"],
+                         "" if record["items"] is None else "%d" % record["items"],
+                         "%.3f" % record["wall"],
+                         "%.3f" % record["cpu"],
+                         "" if record["throughput"] is None else "%.0f" % record["throughput"],
+                         "%.1f" % (record["peakRSS"] / 1048576.0)])
+        return formatTable(rows, ["Stage", "Items", "Wall (s)", "CPU (s)", "Items/s", "Peak RSS (MB)"])
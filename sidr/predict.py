@@ -0,0 +1,69 @@
+import click
+import gc
+
+from sidr import common
+from sidr import default
+from sidr import runfile
+from sidr import writers
+
+
+def readContigs(model, fastaFile=None, bam=None, infile=None, threads=1, cacheDir=None, useCache=True, idColumn="ID"):
+    """
+    Computes only the variables a saved model was trained on. No taxdump or BLAST
+    results are read, as every contig is classified by the model.
+
+    Args:
+        model: A sidr.common.Model.
+        fastaFile: The assembly FASTA, for models trained in default mode.
+        bam: The BAM file of reads aligned to the assembly, needed if the model uses coverage.
+        infile: A runfile of pre-computed variables, for models trained in runfile mode.
+        threads: Number of worker processes to use.
+        cacheDir: Directory for the coverage cache, defaults to beside the BAM.
+        useCache: Set False to ignore and leave alone any cached coverage.
+        idColumn: The runfile column holding the contigIDs.
+    Returns:
+        contigs: A sidr.common.ContigStore with no classified contigs.
+    """
+    if infile:
+        return runfile.readRunfile(infile, schema=runfile.Schema(idColumn, None, model.features))
+    useCoverage = "Coverage" in model.features
+    if useCoverage and not bam:
+        raise ValueError("The model uses coverage, a BAM file is needed to classify new contigs")
+    contigs = default.readFasta(fastaFile, threads, model.kmer, ("Coverage",) if useCoverage else ())
+    gc.collect()
+    click.echo("FASTA loaded, %d contigs returned" % len(contigs))
+    if useCoverage:
+        contigs = default.readBAM(bam, contigs, threads, cacheDir, useCache)
+        gc.collect()
+        click.echo("BAM loaded")
+    return contigs
+
+
+def testData(model, contigs):
+    """
+    Lays out every contig as data for the model, with the variables in the order
+    the model was trained on.
+
+    Args:
+        model: A sidr.common.Model.
+        contigs: A sidr.common.ContigStore.
+    Returns:
+        testdata: A sidr.common.TestData of every contig.
+    """
+    missing = [feature for feature in model.features if feature not in contigs.features]
+    if missing:
+        raise ValueError("Input is missing variables the model was trained on: %s" % ", ".join(missing))
+    contigs.partition()
+    if contigs.features == list(model.features):
+        return common.TestData(contigs.contigids, contigs.X)
+    columns = [contigs.features.index(feature) for feature in model.features]
+    return common.TestData(contigs.contigids, contigs.X[:, columns])
+
+
+def runAnalysis(modelFile, output, tokeep, toremove, fastaFile=None, bam=None, infile=None, target=None, threads=1, cacheDir=None, useCache=True, idColumn="ID"):
+    model = common.loadModel(modelFile)
+    click.echo("Model loaded, %s classifying %s at the %s level" % (type(model.classifier).__name__, ", ".join(model.classNames), model.level))
+    contigs = readContigs(model, fastaFile, bam, infile, threads, cacheDir, useCache, idColumn)
+    testdata = testData(model, contigs)
+    result = common.classifyData(model.classifier, testdata, model.classNames, threads=threads, probabilities=writers.outputFormat(output) != "text")
+    common.generateOutput(tokeep, toremove, result, contigs, target or model.target, output, model.classNames)
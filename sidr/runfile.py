@@ -1,45 +1,154 @@
 import click
+import numpy
+import os
 import pandas
 
+from collections import namedtuple
 from sidr import common
+from sidr import writers
 
+CHUNK_SIZE = 1000000  # runfile rows parsed at a time
+COLUMNAR_FORMATS = {".parquet": pandas.read_parquet, ".pq": pandas.read_parquet, ".feather": pandas.read_feather}  # need pyarrow
+EXCLUDED_COLUMNS = ["Covered_bases", "Plus_reads", "Minus_reads"]  # in BBMap default output, but not useful variables
+Schema = namedtuple("Schema", ["idColumn", "originColumn", "features"])  # runfile columns to read, features None for all
+DEFAULT_SCHEMA = Schema("ID", "Origin", None)
 
-def readRunfile(runfile, taxidDict, taxDump, classificationLevel):
-    unnecessaryColumns = ["Covered_bases", "Plus_reads", "Minus_reads"] # TODO: different formatting?
-    contigs = []
-    classList = []
-    classMap = {}
-    with open(runfile) as rf:
-        runfile = pandas.read_csv(rf, index_col=False)
-    for column in unnecessaryColumns:
-        runfile.drop(column, axis=1, inplace=True)  # https://stackoverflow.com/questions/13411544/delete-column-from-pandas-dataframe for inplace
-    runfile = runfile.fillna(value=False) # replace all non-existent values with False for later processing
-    for row in runfile.iterrows():
-        row = row[1] # iterrows returns a tuple of (index, Series)
-        contigid = row["ID"]
-        row.drop("ID", inplace=True)
-        if not "0" == row["Origin"]:
-            taxid = taxidDict[row["Origin"]] # text to taxid, should give options here
-            classification = common.taxidToLineage(taxid, taxDump, classificationLevel)
-            if classification not in classList:
-                classList.append(classification)
-        else:
-            classification = False
-        row.drop("Origin", inplace=True)
-        variables = row.to_dict()
-        contigs.append(common.Contig(contigid, variables, classification))
-        for idx, className in enumerate(classList):
-            classMap[className] = idx
-    if len(contigs) != len(set([x.contigid for x in contigs])): # exit if duplicate contigs, https://stackoverflow.com/questions/5278122/checking-if-all-elements-in-a-list-are-unique
+
+def readColumns(runfile):
+    """
+    Reads the column names of a runfile without reading any rows.
+
+    Args:
+        runfile: Path to the runfile.
+    Returns:
+        columns: A list of column names.
+    """
+    extension = os.path.splitext(runfile)[1].lower()
+    if extension in (".parquet", ".pq"):
+        import pyarrow.parquet
+        return list(pyarrow.parquet.read_schema(runfile).names)
+    if extension == ".feather":
+        import pyarrow.ipc
+        with pyarrow.ipc.open_file(runfile) as reader:
+            return list(reader.schema.names)
+    return list(pandas.read_csv(runfile, index_col=False, nrows=0).columns)
+
+
+def resolveSchema(runfile, schema=DEFAULT_SCHEMA):
+    """
+    Works out which columns of a runfile to read.
+
+    Args:
+        runfile: Path to the runfile.
+        schema: A sidr.runfile.Schema naming the ID and Origin columns and the
+            variables to use. With no variables named, every other column is used
+            except those in EXCLUDED_COLUMNS.
+    Returns:
+        features: A list of the variable columns.
+        originColumn: The Origin column, or None if the runfile has none.
+    """
+    columns = readColumns(runfile)
+    if schema.idColumn not in columns:
+        raise ValueError("Runfile has no %s column for contigIDs" % schema.idColumn)
+    originColumn = schema.originColumn if schema.originColumn in columns else None
+    if schema.features:
+        missing = [feature for feature in schema.features if feature not in columns]
+        if missing:
+            raise ValueError("Runfile has no column for variables %s" % ", ".join(missing))
+        return list(schema.features), originColumn
+    return [column for column in columns if column not in (schema.idColumn, schema.originColumn) and column not in EXCLUDED_COLUMNS], originColumn
+
+
+def readTable(runfile, columns, dtypes, chunkSize=CHUNK_SIZE):
+    """
+    Reads the chosen columns of a runfile in chunks of rows. Parquet and Feather
+    files, recognized by their extension, are read whole as they are already
+    columnar and compact; anything else is read as (optionally compressed)
+    comma-delimited text, parsing only the chosen columns.
+
+    Args:
+        runfile: Path to the runfile.
+        columns: A list of the columns to read.
+        dtypes: A dictionary mapping columns to the dtype to parse them as.
+        chunkSize: Number of rows of delimited text to parse at a time.
+    Yields:
+        chunk: A pandas.DataFrame of consecutive rows.
+    """
+    extension = os.path.splitext(runfile)[1].lower()
+    if extension in COLUMNAR_FORMATS:
+        yield COLUMNAR_FORMATS[extension](runfile, columns=columns)
+        return
+    for chunk in pandas.read_csv(runfile, index_col=False, usecols=columns, dtype=dtypes, chunksize=chunkSize):
+        yield chunk
+
+
+def readRunfile(runfile, loadTaxdump=None, classificationLevel=None, chunkSize=CHUNK_SIZE, schema=DEFAULT_SCHEMA):
+    """
+    Reads a runfile of pre-computed variables.
+
+    Only the columns in the schema are parsed, with variables read straight into
+    float32. The variable matrix is built from each chunk's numeric columns, and
+    the taxonomy is resolved once per distinct Origin rather than per row.
+
+    Args:
+        runfile: Path to a comma-delimited, Parquet or Feather file with an ID column,
+            an Origin column and one column per variable.
+        loadTaxdump: A function taking the list of distinct Origins and returning
+            the NCBI taxdump as processed by parseTaxdump(), so a lazy taxonomy
+            need only load the taxa they name, or None to leave every contig
+            unclassified.
+        classificationLevel: The level of classification to save into the corpus.
+        chunkSize: Number of rows of delimited text to parse at a time.
+        schema: A sidr.runfile.Schema of the columns to read, see resolveSchema().
+    Returns:
+        contigs: A sidr.common.ContigStore holding the runfile's variables and the
+            classification of each contig with a known Origin.
+    """
+    features, originColumn = resolveSchema(runfile, schema)
+    columns = [schema.idColumn] + ([originColumn] if originColumn else []) + features
+    dtypes = dict((feature, numpy.float32) for feature in features)
+    dtypes.update((column, str) for column in columns[:len(columns) - len(features)])
+    contigids = []
+    origins = []
+    blocks = []
+    for chunk in readTable(runfile, columns, dtypes, chunkSize):
+        contigids.extend(chunk[schema.idColumn].astype(str))
+        if originColumn:
+            origins.append(chunk[originColumn].fillna("0").astype(str).to_numpy(dtype=object))
+        blocks.append(chunk[features].fillna(0).to_numpy(dtype=numpy.float32))  # non-existent values count as 0
+    if len(contigids) != len(set(contigids)): # exit if duplicate contigs, https://stackoverflow.com/questions/5278122/checking-if-all-elements-in-a-list-are-unique
         raise ValueError("Input runfile contains duplicate contigIDs, exiting")
-    return contigs, classMap, classList
+    if len(blocks) == 1:
+        X = blocks[0]
+    else:
+        X = numpy.concatenate(blocks) if blocks else numpy.zeros((0, len(features)), dtype=numpy.float32)
+    del blocks
+    contigs = common.ContigStore(contigids, features, numpy.ascontiguousarray(X))
+    if loadTaxdump is None or not origins:
+        return contigs
+    codes, uniqueOrigins = pandas.factorize(numpy.concatenate(origins))
+    known = [origin for origin in uniqueOrigins if origin != "0"]
+    taxDump = loadTaxdump(known)
+    taxidDict = taxDump.taxidsForNames(known)  # text to taxid, should give options here
+    for origin in known:
+        if origin not in taxidDict:
+            raise Exception("Origin %s was not found in the NCBI DB.\nPlease update your DB and try again." % origin)
+    classifications = numpy.full(len(uniqueOrigins), None, dtype=object)
+    if known:
+        classifications[numpy.asarray(uniqueOrigins) != "0"] = taxDump.lineages([taxidDict[origin] for origin in known], classificationLevel)
+    classifications = classifications[codes]
+    rows = numpy.flatnonzero(classifications != None)
+    contigs.classify(contigs.contigids[rows], classifications[rows])
+    return contigs
 
 
-def runAnalysis(blastdb, runfile, classificationLevel, modelOutput, output, tokeep, toremove, binary, target):
-    taxDump, taxidDict = common.parseTaxdump(blastdb, True)
-    contigs, classMap, classList = readRunfile(runfile, taxidDict, taxDump, classificationLevel)
-    corpus, testdata, features = common.constructCorpus(contigs, classMap, binary, target)
-    click.echo("Corpus constucted, %d contigs in corpus and %d contigs in test data" % (len(corpus), len(testdata)))
-    classifier = common.constructModel(corpus, classList, features, modelOutput)
-    result = common.classifyData(classifier, testdata, classMap)
-    common.generateOutput(tokeep, toremove, result, contigs, target, output)
+def runAnalysis(blastdb, runfile, classificationLevel, modelOutput, output, tokeep, toremove, binary, target, modelOptions=None, modelFile=None, schema=DEFAULT_SCHEMA, lazyTaxonomy=False):
+    contigs = readRunfile(runfile, lambda origins: common.parseTaxdump(blastdb, names=origins if lazyTaxonomy else None), classificationLevel, schema=schema)
+    corpus, testdata, features = common.constructCorpus(contigs, binary, target)
+    click.echo("Corpus constucted, %d contigs in corpus and %d contigs in test data" % (len(corpus.Y), len(testdata.contigids)))
+    classifier = common.constructModel(corpus, features, modelOutput, **(modelOptions or {}))
+    if modelFile:
+        common.saveModel(modelFile, common.Model(classifier, features, corpus.classNames, classificationLevel, target, binary, None))
+        click.echo("Model saved to %s" % modelFile)
+    result = common.classifyData(classifier, testdata, corpus.classNames, probabilities=writers.outputFormat(output) != "text")
+    common.generateOutput(tokeep, toremove, result, contigs, target, output, corpus.classNames)
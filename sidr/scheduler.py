@@ -0,0 +1,121 @@
+import multiprocessing
+import multiprocessing.connection
+
+from collections import namedtuple
+
+from sidr import metrics
+
+Stage = namedtuple("Stage", ["name", "function", "args", "requires", "items"])  # see runStages()
+Stage.__new__.__defaults__ = (None, len)
+
+
+def stageWorker(connection, name, function, args, profileStage, profileDir):
+    """
+    Runs one stage in its own process, sending back whether it succeeded, its
+    result or exception, and the metrics recorded while it ran. The process has
+    its own peak RSS, so the stage's memory is measured apart from the others.
+
+    Args:
+        connection: The child end of a multiprocessing.Pipe.
+        name: The stage name.
+        function: The function to run.
+        args: A dictionary of keyword arguments to call it with.
+        profileStage, profileDir: See sidr.metrics.Recorder.
+    """
+    recorder = metrics.Recorder(profileStage, profileDir)
+    try:
+        with recorder.stage(name):
+            result = function(**args)
+        connection.send((True, result, recorder.stages))
+    except Exception as e:
+        connection.send((False, e, recorder.stages))
+    finally:
+        connection.close()
+
+
+def readyStages(pending, results):
+    return [stage for stage in pending if all(name in results for name in (stage.requires or {}).values())]
+
+
+def stageArgs(stage, results):
+    args = dict(stage.args)
+    args.update((keyword, results[name]) for keyword, name in (stage.requires or {}).items())
+    return args
+
+
+def runStages(stages, recorder=None, done=None, concurrent=True, onResult=None):
+    """
+    Runs stages that depend on each other's results, each as soon as the stages
+    it requires have finished. Stages that are ready at the same time run side by
+    side in their own processes, so the wall time of independent stages is close
+    to that of the slowest rather than their sum. A stage can still split its own
+    work across a pool of worker processes.
+
+    Args:
+        stages: A list of sidr.scheduler.Stage tuples of (name, function, args,
+            requires, items). function is a module-level function called with the
+            keyword arguments in the args dictionary, plus one for each entry of
+            requires, a dictionary mapping keywords to the names of the stages
+            whose results to pass. items counts the items in a stage's result for
+            its metrics, by default len.
+        recorder: A sidr.metrics.Recorder to add each stage's metrics to, or None.
+        done: A dictionary of results of stages that need not run, such as those
+            resumed from a checkpoint.
+        concurrent: Set False to run the stages one after another in this process,
+            in list order.
+        onResult: Function called with each stage's name and result as it finishes.
+    Returns:
+        results: A dictionary mapping each stage name to its result.
+    """
+    recorder = recorder or metrics.Recorder()
+    results = dict(done or {})
+    pending = [stage for stage in stages if stage.name not in results]
+    running = {}  # {connection: (stage, process)}
+    try:
+        while pending or running:
+            ready = readyStages(pending, results)
+            if not ready and not running:
+                raise ValueError("Stages %s require stages that never run" % ", ".join(stage.name for stage in pending))
+            if not concurrent:
+                stage = ready[0]
+                pending.remove(stage)
+                with recorder.stage(stage.name) as record:
+                    result = stage.function(**stageArgs(stage, results))
+                    record["items"] = stage.items(result) if stage.items else None
+                finished = [(stage, result)]
+            else:
+                for stage in ready:
+                    pending.remove(stage)
+                    parent, child = multiprocessing.Pipe(duplex=False)
+                    process = multiprocessing.Process(target=stageWorker, name="sidr-%s" % stage.name,
+                                                      args=(child, stage.name, stage.function, stageArgs(stage, results), recorder.profileStage, recorder.profileDir))
+                    process.start()
+                    child.close()
+                    running[parent] = (stage, process)
+                finished = []
+                for connection in multiprocessing.connection.wait(list(running)):
+                    stage, process = running.pop(connection)
+                    try:
+                        succeeded, result, records = connection.recv()
+                    except EOFError:  # the process died without reporting back
+                        process.join()
+                        raise RuntimeError("Stage %s exited with code %s" % (stage.name, process.exitcode))
+                    process.join()
+                    connection.close()
+                    if not succeeded:
+                        raise result
+                    for record in records:
+                        record["items"] = stage.items(result) if stage.items else None
+                        recorder.throughput(record)
+                    recorder.stages.extend(records)
+                    finished.append((stage, result))
+            for stage, result in finished:
+                results[stage.name] = result
+                if onResult:
+                    onResult(stage.name, result)
+    finally:
+        for connection, (stage, process) in running.items():  # stop the other stages if one failed
+            process.terminate()
+            process.join()
+            connection.close()
+    return results
@@ -0,0 +1,197 @@
+import numpy
+import os
+import pysam
+
+from collections import namedtuple
+
+from sidr import taxonomy
+
+Dataset = namedtuple("Dataset", ["taxdump", "fasta", "bam", "blast", "runfile", "target"])  # paths of a generated dataset
+ROOT = 1
+KINGDOM = 2
+PHYLUM_BASE = 10  # taxid of the first phylum
+SPECIES_BASE = 1000  # taxid of the first species, each phylum gets SPECIES_BASE ids
+MERGED_BASE = 1000000  # added to each species taxid to give an old taxid merged into it
+DELETED = 2000000
+BASES = numpy.frombuffer(b"ACGT", dtype=numpy.uint8)
+
+
+def phylumName(phylum):
+    return "Phylum%d" % phylum
+
+
+def speciesName(phylum, species):
+    return "Phylum%d species%d" % (phylum, species)
+
+
+def speciesTaxid(phylum, species):
+    return SPECIES_BASE * (phylum + 1) + species
+
+
+def writeTaxdump(taxdump, phyla, species):
+    """
+    Writes a small NCBI taxdump: a root, one superkingdom, the phyla and their
+    species, an old taxid merged into each species and one deleted taxid.
+
+    Args:
+        taxdump: Directory to write names.dmp, nodes.dmp, merged.dmp and delnodes.dmp to.
+        phyla: Number of phyla.
+        species: Number of species in each phylum.
+    """
+    nodes = [(ROOT, ROOT, "no rank", "root"), (KINGDOM, ROOT, "superkingdom", "Synthetica")]
+    for phylum in range(phyla):
+        nodes.append((PHYLUM_BASE + phylum, KINGDOM, "phylum", phylumName(phylum)))
+        for sp in range(species):
+            nodes.append((speciesTaxid(phylum, sp), PHYLUM_BASE + phylum, "species", speciesName(phylum, sp)))
+    with open(os.path.join(taxdump, "nodes.dmp"), "w") as out:
+        out.write("".join("%d\t|\t%d\t|\t%s\t|\t\t|\n" % (taxid, parent, rank) for taxid, parent, rank, name in nodes))
+    with open(os.path.join(taxdump, "names.dmp"), "w") as out:
+        out.write("".join("%d\t|\t%s\t|\t\t|\tscientific name\t|\n" % (taxid, name) for taxid, parent, rank, name in nodes))
+    with open(os.path.join(taxdump, "merged.dmp"), "w") as out:
+        out.write("".join("%d\t|\t%d\t|\n" % (MERGED_BASE + taxid, taxid) for taxid, parent, rank, name in nodes if rank == "species"))
+    with open(os.path.join(taxdump, "delnodes.dmp"), "w") as out:
+        out.write("%d\t|\n" % DELETED)
+
+
+def datasetPaths(outdir):
+    """
+    Names the files of a dataset generated into outdir.
+
+    Args:
+        outdir: The dataset directory.
+    Returns:
+        dataset: A sidr.synthetic.Dataset of the paths, which may not exist yet.
+    """
+    return Dataset(outdir, os.path.join(outdir, "assembly.fasta"), os.path.join(outdir, "alignment.bam"),
+                   os.path.join(outdir, "blast.tsv"), os.path.join(outdir, "runfile.csv"), phylumName(0))
+
+
+def datasetFiles(dataset):
+    """
+    Lists every file a dataset is made of, including its taxdump and BAM index.
+
+    Args:
+        dataset: A sidr.synthetic.Dataset.
+    Returns:
+        paths: The path of each file.
+    """
+    return ([os.path.join(dataset.taxdump, name) for name in taxonomy.TAXDUMP_FILES] +
+            [dataset.fasta, dataset.bam, dataset.bam + ".bai", dataset.blast, dataset.runfile])
+
+
+def randomSequence(random, length, gc):
+    """
+    Draws a random sequence with the given GC fraction.
+
+    Args:
+        random: A numpy.random.RandomState.
+        length: Sequence length.
+        gc: Probability of each base being G or C.
+    Returns:
+        sequence: The sequence as a string.
+    """
+    codes = random.choice(4, size=length, p=[(1 - gc) / 2, gc / 2, gc / 2, (1 - gc) / 2])  # A, C, G, T
+    return BASES[codes].tobytes().decode("ascii")
+
+
+def generate(outdir, contigs=1000, phyla=4, species=5, meanLength=5000, coverage=10, readLength=100,
+             classified=0.7, hits=3, seed=0):
+    """
+    Generates a synthetic dataset for every stage of SIDR: a taxdump, an assembly,
+    a coordinate-sorted and indexed BAM of paired reads, BLAST results and a
+    runfile. Each phylum has its own GC content and coverage, so the phyla can be
+    told apart, and phylum 0 is the target.
+
+    Args:
+        outdir: Directory to write the dataset to, created if needed.
+        contigs: Number of contigs.
+        phyla: Number of phyla.
+        species: Number of species in each phylum.
+        meanLength: Mean contig length, lengths are drawn from a lognormal distribution.
+        coverage: Mean read depth, scaled differently for each phylum.
+        readLength: Length of each read.
+        classified: Fraction of contigs with BLAST hits.
+        hits: BLAST hits written for each classified contig.
+        seed: Random seed, the same seed always gives the same dataset.
+    Returns:
+        dataset: A sidr.synthetic.Dataset of the generated paths.
+    """
+    random = numpy.random.RandomState(seed)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    dataset = datasetPaths(outdir)
+    writeTaxdump(outdir, phyla, species)
+    contigids = ["contig%d" % idx for idx in range(contigs)]
+    lengths = numpy.maximum(random.lognormal(numpy.log(meanLength), 0.5, contigs).astype(int), readLength * 3)
+    contigPhyla = random.randint(phyla, size=contigs)
+    contigSpecies = random.randint(species, size=contigs)
+    phylumGC = numpy.linspace(0.3, 0.7, phyla) if phyla > 1 else numpy.array([0.5])
+    phylumDepth = coverage * numpy.linspace(0.5, 2.0, phyla) if phyla > 1 else numpy.array([float(coverage)])
+    gcs = []
+    with open(dataset.fasta, "w") as out:
+        for contigid, length, phylum in zip(contigids, lengths, contigPhyla):
+            sequence = randomSequence(random, length, phylumGC[phylum])
+            gcs.append((sequence.count("G") + sequence.count("C")) / float(length))
+            out.write(">%s\n" % contigid)
+            out.write("".join(sequence[start:start + 80] + "\n" for start in range(0, length, 80)))
+    depths = writeBAM(dataset.bam, random, contigids, lengths, phylumDepth[contigPhyla], readLength)
+    isClassified = random.random_sample(contigs) < classified
+    with open(dataset.blast, "w") as out:
+        for contigid, phylum, sp, hit in zip(contigids, contigPhyla, contigSpecies, isClassified):
+            if hit:
+                taxid = speciesTaxid(phylum, sp)
+                if random.random_sample() < 0.05:  # some hits against merged taxids
+                    taxid += MERGED_BASE
+                out.write("".join("%s\t%d\t%.1f\n" % (contigid, taxid, 1000.0 / (rank + 1)) for rank in range(hits)))
+    with open(dataset.runfile, "w") as out:
+        out.write("ID,Avg_fold,Length,Ref_GC,Covered_percent,Covered_bases,Plus_reads,Minus_reads,Read_GC,Origin\n")
+        for contigid, length, gc, depth, phylum, sp, hit in zip(contigids, lengths, gcs, depths, contigPhyla, contigSpecies, isClassified):
+            out.write("%s,%.4f,%d,%.4f,100.0,%d,%d,%d,%.4f,%s\n" % (contigid, depth, length, gc, length, 1, 1, gc,
+                                                                    speciesName(phylum, sp) if hit else "0"))
+    return dataset
+
+
+def writeBAM(path, random, contigids, lengths, depths, readLength, insert=300):
+    """
+    Writes a coordinate-sorted, indexed BAM of paired reads placed uniformly on
+    each contig, both mates on the same contig.
+
+    Args:
+        path: Path of the BAM file.
+        random: A numpy.random.RandomState.
+        contigids: A list of contigIDs.
+        lengths: Contig lengths.
+        depths: Target read depth of each contig.
+        readLength: Length of each read.
+        insert: Mean insert size.
+    Returns:
+        depths: The mean depth actually placed on each contig.
+    """
+    header = pysam.AlignmentHeader.from_dict({"HD": {"VN": "1.6", "SO": "coordinate"},
+                                              "SQ": [{"SN": contigid, "LN": int(length)} for contigid, length in zip(contigids, lengths)]})
+    quality = pysam.qualitystring_to_array("I" * readLength)
+    sequence = "A" * readLength
+    placed = []
+    with pysam.AlignmentFile(path, "wb", header=header) as bam:
+        for tid, (length, depth) in enumerate(zip(lengths, depths)):
+            pairs = int(length * depth / (2 * readLength))
+            inserts = numpy.clip(random.normal(insert, insert / 10.0, pairs).astype(int), readLength, length)
+            starts = random.randint(0, length - inserts + 1)
+            reads = sorted([(start, start + size - readLength, idx, True) for idx, (start, size) in enumerate(zip(starts, inserts))] +
+                           [(start + size - readLength, start, idx, False) for idx, (start, size) in enumerate(zip(starts, inserts))])
+            for start, mateStart, idx, first in reads:
+                read = pysam.AlignedSegment(header)
+                read.query_name = "%s_%d" % (contigids[tid], idx)
+                read.flag = 0x1 | 0x2 | (0x40 | 0x20 if first else 0x80 | 0x10)
+                read.reference_id = tid
+                read.reference_start = int(start)
+                read.next_reference_id = tid
+                read.next_reference_start = int(mateStart)
+                read.mapping_quality = 60
+                read.cigarstring = "%dM" % readLength
+                read.query_sequence = sequence
+                read.query_qualities = quality
+                bam.write(read)
+            placed.append(2.0 * pairs * readLength / length)
+    pysam.index(path)
+    return placed
@@ -0,0 +1,721 @@
+import click
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import numpy
+
+from array import array
+from sidr import files
+
+TAXDUMP_FILES = ["names.dmp", "nodes.dmp", "merged.dmp", "delnodes.dmp"]
+ARCHIVE_SUFFIXES = (".tar.gz", ".tgz", ".tar")  # names of taxdump archives, such as NCBI's taxdump.tar.gz
+INDEX_VERSION = 2
+INDEX_NAME = "sidr.index"
+INDEX_ARRAYS = ["parent", "rank", "flags", "nameIndex", "nameOffsets", "nameBlob", "nameTaxid", "nameHash", "nameOrder"]
+
+FLAG_PRESENT = 1  # taxid exists in nodes.dmp, merged.dmp or delnodes.dmp
+FLAG_MERGED = 2  # parent holds the taxid this one was merged into
+FLAG_DELETED = 4
+
+
+def readDmp(handle):
+    """
+    Streams the fields of an NCBI taxdump .dmp file one line at a time.
+
+    Args:
+        handle: An open .dmp file, or any iterable of its lines.
+    Yields:
+        fields: A list of whitespace-stripped fields from a single line.
+    """
+    for line in handle:
+        if line.strip():
+            yield [field.strip() for field in line.split("|")]
+
+
+def isArchive(blastdb):
+    """
+    Checks whether a taxdump is a tar archive, such as NCBI's taxdump.tar.gz,
+    rather than a directory of extracted files.
+
+    Args:
+        blastdb: Path to the taxdump directory or archive.
+    Returns:
+        archive: True if the taxdump is a file.
+    """
+    return os.path.isfile(blastdb)
+
+
+def taxdumpFiles(blastdb, names=TAXDUMP_FILES):
+    """
+    Opens the .dmp files of a taxdump one after another. An archive is streamed
+    in a single pass, each file parsed straight out of it without extraction,
+    so the files come in the order they were archived.
+
+    Args:
+        blastdb: Path to the taxdump directory or archive.
+        names: The names of the .dmp files to open.
+    Yields:
+        file: A tuple of (name, lines), lines an iterable of the file's lines
+            as text, only valid until the next file is opened.
+    """
+    if not isArchive(blastdb):
+        for name in names:
+            with open(os.path.join(blastdb, name)) as lines:
+                yield name, lines
+        return
+    found = set()
+    with tarfile.open(blastdb, "r|*") as archive:
+        for member in archive:
+            name = os.path.basename(member.name)
+            if member.isfile() and name in names and name not in found:
+                found.add(name)
+                with archive.extractfile(member) as data:  # a stream member can't be wrapped in io.TextIOWrapper, it isn't seekable
+                    yield name, (line.decode("utf-8") for line in data)
+                if len(found) == len(names):  # the rest of the archive isn't needed
+                    return
+    raise IOError("%s is missing %s" % (blastdb, ", ".join(name for name in names if name not in found)))
+
+
+def fingerprint(blastdb):
+    """
+    Records the sidr.files.fileIdentity() of each taxdump file, or of the
+    archive, used to decide whether a compiled index is still current.
+
+    Args:
+        blastdb: A string containing the root directory for the NCBI taxdump, or
+            the path to a taxdump archive.
+    Returns:
+        files: A dictionary mapping each taxdump file name to [size, mtime].
+    """
+    paths = [blastdb] if isArchive(blastdb) else [os.path.join(blastdb, name) for name in TAXDUMP_FILES]
+    return dict((os.path.basename(path), files.fileIdentity(path)) for path in paths)
+
+
+def readManifest(indexDir):
+    """
+    Reads the manifest of a compiled index.
+
+    Args:
+        indexDir: Directory containing a compiled index.
+    Returns:
+        manifest: The parsed manifest, or None if the index is missing or unreadable.
+    """
+    try:
+        with open(os.path.join(indexDir, "manifest.json")) as m:
+            return json.load(m)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def isCurrent(indexDir, blastdb):
+    """
+    Checks whether a compiled index matches the taxdump it was built from.
+
+    Args:
+        indexDir: Directory containing a compiled index.
+        blastdb: A string containing the root directory for the NCBI taxdump.
+    Returns:
+        current: True if the index exists and the taxdump has not changed since.
+    """
+    manifest = readManifest(indexDir)
+    if not manifest or manifest.get("version") != INDEX_VERSION:
+        return False
+    return manifest.get("files") == fingerprint(blastdb)
+
+
+def localIndex(blastdb):
+    """
+    Names the index kept next to a taxdump: a sidr.index directory inside a
+    taxdump directory, or beside an archive, taxdump.sidr.index for taxdump.tar.gz.
+
+    Args:
+        blastdb: Path to the taxdump directory or archive.
+    Returns:
+        indexDir: Path of the index directory.
+    """
+    if not isArchive(blastdb):
+        return os.path.join(blastdb, INDEX_NAME)
+    name = os.path.basename(blastdb)
+    for suffix in ARCHIVE_SUFFIXES:
+        if name.lower().endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return os.path.join(os.path.dirname(os.path.abspath(blastdb)), "%s.%s" % (name, INDEX_NAME))
+
+
+def indexPath(blastdb, cacheDir=None):
+    """
+    Chooses where the compiled index for a taxdump lives. The index is kept next
+    to the taxdump, see localIndex(), when that directory is writable (or already holds a current
+    index), otherwise under a per-user cache directory keyed by the taxdump path.
+
+    Args:
+        blastdb: A string containing the root directory for the NCBI taxdump.
+        cacheDir: Cache directory to fall back on, defaults to ~/.cache/sidr.
+    Returns:
+        indexDir: Path of the index directory, which may not exist yet.
+    """
+    local = localIndex(blastdb)
+    if isCurrent(local, blastdb) or os.access(os.path.dirname(local), os.W_OK):
+        return local
+    return files.userCachePath(blastdb, "taxdump", cacheDir)
+
+
+def nameHash(encoded):
+    """
+    Hashes a UTF-8 encoded name to 64 bits, the same in every process.
+
+    Args:
+        encoded: The name as bytes.
+    Returns:
+        hash: An integer below 2**63.
+    """
+    return int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), "little") >> 1
+
+
+def nameLookup(nameBlob, nameOffsets):
+    """
+    Builds the lookup from names to name table slots, a sorted array of name
+    hashes that Taxonomy.taxidsForNames() searches with numpy.searchsorted.
+
+    Args:
+        nameBlob: The UTF-8 encoded names, concatenated.
+        nameOffsets: Start of each name in nameBlob, plus a final end offset.
+    Returns:
+        nameHash: An int64 array of each name's nameHash(), sorted.
+        nameOrder: An int32 array of the slot of each hash in nameHash, in
+            ascending order where names share a hash.
+    """
+    blob = bytes(nameBlob)
+    hashes = numpy.fromiter((nameHash(blob[start:end]) for start, end in zip(nameOffsets[:-1], nameOffsets[1:])),
+                            dtype=numpy.int64, count=len(nameOffsets) - 1)
+    order = numpy.argsort(hashes, kind="stable")
+    return hashes[order], order.astype(numpy.int32)
+
+
+def compileTaxdump(blastdb, indexDir):
+    """
+    Parses the NCBI taxdump once and writes it out as a set of flat arrays that
+    later runs can memory-map instead of re-parsing. An archive is parsed in a
+    single streaming pass, without extracting it.
+
+    Every array except the name table is indexed directly by taxid:
+        parent: Parent taxid, or the surviving taxid for merged entries.
+        rank: Rank code, an index into the manifest's list of rank names.
+        flags: FLAG_PRESENT, FLAG_MERGED and FLAG_DELETED bits.
+        nameIndex: Slot of the scientific name in the name table, or -1.
+    The name table holds every name in names.dmp:
+        nameBlob: UTF-8 encoded names, concatenated.
+        nameOffsets: Start of each slot in nameBlob, plus a final end offset.
+        nameTaxid: The taxid each name belongs to.
+        nameHash, nameOrder: See nameLookup().
+
+    Args:
+        blastdb: A string containing the root directory for the NCBI taxdump, or
+            the path to a taxdump archive.
+        indexDir: Directory to write the index to, replaced if it exists.
+    Returns:
+        indexDir: The directory the index was written to.
+    """
+    fingerprints = fingerprint(blastdb)
+    nameTaxid = array("l")
+    nameOffsets = array("l", [0])
+    nameBlob = bytearray()
+    sciTaxid = array("l")
+    sciSlot = array("l")
+    ranks = []
+    rankCodes = {}
+    nodeTaxid = array("l")
+    nodeParent = array("l")
+    nodeRank = array("l")
+    mergedOld = array("l")
+    mergedNew = array("l")
+    deleted = array("l")
+    for name, lines in taxdumpFiles(blastdb):
+        click.echo("Reading %s" % name)
+        if name == "names.dmp":
+            for line in readDmp(lines):
+                taxid = int(line[0])
+                if "scientific name" in line[3]:
+                    sciTaxid.append(taxid)
+                    sciSlot.append(len(nameTaxid))
+                nameTaxid.append(taxid)
+                nameBlob.extend(line[1].encode("utf-8"))
+                nameOffsets.append(len(nameBlob))
+        elif name == "nodes.dmp":
+            for line in readDmp(lines):
+                rank = line[2]
+                if rank not in rankCodes:
+                    rankCodes[rank] = len(ranks)
+                    ranks.append(rank)
+                nodeTaxid.append(int(line[0]))
+                nodeParent.append(int(line[1]))
+                nodeRank.append(rankCodes[rank])
+        elif name == "merged.dmp":
+            for line in readDmp(lines):
+                mergedOld.append(int(line[0]))
+                mergedNew.append(int(line[1]))
+        else:
+            for line in readDmp(lines):
+                deleted.append(int(line[0]))
+    if len(ranks) > 255:
+        raise ValueError("Taxdump contains more than 255 distinct ranks")
+    maxTaxid = max([max(ids) if len(ids) else 0 for ids in (nameTaxid, nodeTaxid, nodeParent, mergedOld, deleted)])
+    arrays = dict(zip(["nameHash", "nameOrder"], nameLookup(nameBlob, nameOffsets)))
+    arrays.update({
+        "parent": numpy.zeros(maxTaxid + 1, dtype=numpy.int32),
+        "rank": numpy.zeros(maxTaxid + 1, dtype=numpy.uint8),
+        "flags": numpy.zeros(maxTaxid + 1, dtype=numpy.uint8),
+        "nameIndex": numpy.full(maxTaxid + 1, -1, dtype=numpy.int32),
+        "nameOffsets": numpy.frombuffer(nameOffsets, dtype=numpy.dtype("l")).astype(numpy.int64),
+        "nameBlob": numpy.frombuffer(bytes(nameBlob), dtype=numpy.uint8),
+        "nameTaxid": numpy.frombuffer(nameTaxid, dtype=numpy.dtype("l")).astype(numpy.int32),
+    })
+    arrays["nameIndex"][numpy.asarray(sciTaxid, dtype=numpy.int64)] = numpy.asarray(sciSlot, dtype=numpy.int32)
+    nodeTaxid = numpy.asarray(nodeTaxid, dtype=numpy.int64)
+    arrays["parent"][nodeTaxid] = numpy.asarray(nodeParent, dtype=numpy.int32)
+    arrays["rank"][nodeTaxid] = numpy.asarray(nodeRank, dtype=numpy.uint8)
+    arrays["flags"][nodeTaxid] = FLAG_PRESENT
+    mergedOld = numpy.asarray(mergedOld, dtype=numpy.int64)
+    arrays["parent"][mergedOld] = numpy.asarray(mergedNew, dtype=numpy.int32)
+    arrays["flags"][mergedOld] = FLAG_PRESENT | FLAG_MERGED
+    arrays["flags"][numpy.asarray(deleted, dtype=numpy.int64)] = FLAG_PRESENT | FLAG_DELETED
+    parentDir = os.path.dirname(os.path.abspath(indexDir))
+    if not os.path.isdir(parentDir):
+        os.makedirs(parentDir)
+    tmpDir = tempfile.mkdtemp(prefix=".sidr-index-", dir=parentDir)  # build beside the target so the final rename is atomic
+    try:
+        for name in INDEX_ARRAYS:
+            numpy.save(os.path.join(tmpDir, "%s.npy" % name), arrays[name])
+        with open(os.path.join(tmpDir, "manifest.json"), "w") as m:  # written last, an index without one is never trusted
+            json.dump({"version": INDEX_VERSION, "files": fingerprints, "ranks": ranks}, m)
+        if os.path.isdir(indexDir):
+            shutil.rmtree(indexDir)
+        os.rename(tmpDir, indexDir)
+    except Exception:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+        raise
+    return indexDir
+
+
+def loadIndex(blastdb, cacheDir=None):
+    """
+    Loads the compiled index for a taxdump, compiling it first if it is missing
+    or older than the taxdump files.
+
+    Args:
+        blastdb: A string containing the root directory for the NCBI taxdump.
+        cacheDir: Cache directory to use when the taxdump directory is read-only.
+    Returns:
+        index: A dictionary of read-only memory-mapped arrays as described in
+            compileTaxdump(), plus "ranks", the list of rank names.
+    """
+    indexDir = indexPath(blastdb, cacheDir)
+    if not isCurrent(indexDir, blastdb):
+        click.echo("Compiling taxdump index in %s" % indexDir)
+        compileTaxdump(blastdb, indexDir)
+    index = {"ranks": readManifest(indexDir)["ranks"]}
+    for name in INDEX_ARRAYS:
+        index[name] = numpy.load(os.path.join(indexDir, "%s.npy" % name), mmap_mode="r")
+    return index
+
+
+def observedIndex(blastdb, taxids=(), names=()):
+    """
+    Builds an index of only the lineages of the taxa seen in the input, in a
+    single filtered streaming pass over the taxdump. Parents and ranks are read
+    for every node, as a lineage isn't known until it has been walked, while the
+    scientific names and the names seen in the input are spilled to a temporary
+    file and filtered down to the taxa on those lineages once they have been,
+    as names are where most of a taxdump's memory goes.
+
+    Args:
+        blastdb: A string containing the root directory for the NCBI taxdump, or
+            the path to a taxdump archive.
+        taxids: Integer taxids seen in the input.
+        names: Names of any name class seen in the input.
+    Returns:
+        index: A dictionary of arrays as described in compileTaxdump(), plus
+            "ranks", the list of rank names. Only the taxa on these lineages are
+            present, so rather than by taxid the arrays are indexed by position
+            in "taxids", their sorted taxids, and parent holds positions too.
+            Taxids that aren't in the taxdump are left out.
+    """
+    wanted = set(names)
+    merged = {}
+    deleted = set()
+    named = {}
+    ranks = []
+    rankCodes = {}
+    nodeTaxid = array("l")
+    nodeParent = array("l")
+    nodeRank = array("l")
+    spill = tempfile.TemporaryFile("w+", encoding="utf-8")  # names.dmp rows that may be kept, as "taxid<TAB>scientific<TAB>name"
+    for name, lines in taxdumpFiles(blastdb, ["nodes.dmp", "merged.dmp", "delnodes.dmp", "names.dmp"]):
+        if name == "names.dmp":
+            for line in readDmp(lines):
+                scientific = "scientific name" in line[3]
+                if line[1] in wanted:
+                    named[line[1]] = int(line[0])  # the last entry wins, as in Taxonomy.taxidsForNames()
+                elif not scientific:
+                    continue
+                spill.write("%s\t%d\t%s\n" % (line[0], scientific, line[1]))
+        elif name == "nodes.dmp":
+            for line in readDmp(lines):
+                rank = line[2]
+                if rank not in rankCodes:
+                    rankCodes[rank] = len(ranks)
+                    ranks.append(rank)
+                nodeTaxid.append(int(line[0]))
+                nodeParent.append(int(line[1]))
+                nodeRank.append(rankCodes[rank])
+        elif name == "merged.dmp":
+            for line in readDmp(lines):
+                merged[int(line[0])] = int(line[1])
+        else:
+            deleted.update(int(line[0]) for line in readDmp(lines))
+    if len(ranks) > 255:
+        raise ValueError("Taxdump contains more than 255 distinct ranks")
+    nodeTaxid = numpy.frombuffer(nodeTaxid, dtype=numpy.dtype("l"))
+    size = int(nodeTaxid.max()) + 1 if len(nodeTaxid) else 1
+    parent = numpy.zeros(size, dtype=numpy.int32)
+    parent[nodeTaxid] = numpy.frombuffer(nodeParent, dtype=numpy.dtype("l"))
+    rank = numpy.zeros(size, dtype=numpy.uint8)
+    rank[nodeTaxid] = numpy.frombuffer(nodeRank, dtype=numpy.dtype("l"))
+    isNode = numpy.zeros(size, dtype=bool)
+    isNode[nodeTaxid] = True
+    del nodeTaxid, nodeParent, nodeRank
+    def known(taxid):  # only taxids in the taxdump take up room in the index
+        return taxid in merged or taxid in deleted or 0 <= taxid < size and isNode[taxid]
+    lineage = set()
+    frontier = set(taxid for taxid in list(taxids) + list(named.values()) if known(taxid))
+    while frontier:  # one level of every lineage per pass
+        lineage |= frontier
+        following = set()
+        for taxid in frontier:
+            if taxid in merged:
+                following.add(merged[taxid])
+            elif taxid not in deleted and parent[taxid] != taxid:
+                following.add(int(parent[taxid]))
+        frontier = set(taxid for taxid in following if known(taxid)) - lineage
+    nameTaxid = array("l")
+    nameOffsets = array("l", [0])
+    nameBlob = bytearray()
+    sciTaxid = array("l")
+    sciSlot = array("l")
+    with spill:
+        spill.seek(0)
+        for line in spill:
+            taxid, scientific, name = line.rstrip("\n").split("\t", 2)
+            taxid = int(taxid)
+            scientific = scientific == "1" and taxid in lineage
+            if not scientific and name not in wanted:
+                continue
+            if scientific:
+                sciTaxid.append(taxid)
+                sciSlot.append(len(nameTaxid))
+            nameTaxid.append(taxid)
+            nameBlob.extend(name.encode("utf-8"))
+            nameOffsets.append(len(nameBlob))
+    compact = numpy.array([-1] + sorted(lineage), dtype=numpy.int64)  # position 0 stands for every taxid outside the lineages
+    index = dict(zip(["nameHash", "nameOrder"], nameLookup(nameBlob, nameOffsets)))
+    index.update({
+        "ranks": ranks,
+        "taxids": compact,
+        "parent": numpy.zeros(len(compact), dtype=numpy.int32),
+        "rank": numpy.zeros(len(compact), dtype=numpy.uint8),
+        "flags": numpy.zeros(len(compact), dtype=numpy.uint8),
+        "nameIndex": numpy.full(len(compact), -1, dtype=numpy.int32),
+        "nameOffsets": numpy.frombuffer(nameOffsets, dtype=numpy.dtype("l")).astype(numpy.int64),
+        "nameBlob": numpy.frombuffer(bytes(nameBlob), dtype=numpy.uint8),
+        "nameTaxid": numpy.frombuffer(nameTaxid, dtype=numpy.dtype("l")).astype(numpy.int32),
+    })
+    nodes = numpy.array([taxid for taxid in compact[1:] if taxid not in merged and taxid not in deleted], dtype=numpy.int64)
+    positions = compactPositions(compact, nodes)
+    index["parent"][positions] = compactPositions(compact, parent[nodes])
+    index["rank"][positions] = rank[nodes]
+    index["flags"][positions] = FLAG_PRESENT
+    for taxid in lineage:
+        position = compactPositions(compact, [taxid])[0]
+        if taxid in merged:
+            index["parent"][position] = compactPositions(compact, [merged[taxid]])[0]
+            index["flags"][position] = FLAG_PRESENT | FLAG_MERGED
+        elif taxid in deleted:
+            index["flags"][position] = FLAG_PRESENT | FLAG_DELETED
+    index["nameIndex"][compactPositions(compact, sciTaxid)] = numpy.asarray(sciSlot, dtype=numpy.int32)
+    return index
+
+
+def compactPositions(compact, taxids):
+    """
+    Finds taxids in the sorted taxid list of a compact index.
+
+    Args:
+        compact: The index's sorted "taxids" array, starting with -1.
+        taxids: An array-like of integer taxids.
+    Returns:
+        positions: An int64 array of the position of each taxid, 0 where it isn't
+            in the index.
+    """
+    taxids = numpy.asarray(taxids, dtype=numpy.int64).reshape(-1)
+    positions = numpy.minimum(numpy.searchsorted(compact, taxids), len(compact) - 1)
+    return numpy.where(compact[positions] == taxids, positions, 0)
+
+
+class Taxonomy(object):  # array-backed NCBI taxonomy, indexed by integer taxid or by position in a compact index
+    def __init__(self, index, lazy=False):
+        """
+        Wraps a compiled taxdump index.
+
+        Args:
+            index: A compiled index as returned by loadIndex() or observedIndex().
+            lazy: Set True to walk only the lineages asked for in lineages(),
+                rather than building the ancestor table of every taxid.
+        """
+        self.lazy = lazy
+        self.taxids = index.get("taxids")  # sorted taxids of a compact index, None when the arrays are indexed by taxid
+        self.parent = index["parent"]
+        self.rank = index["rank"]
+        self.flags = index["flags"]
+        self.nameIndex = index["nameIndex"]
+        self.ranks = index["ranks"]
+        self.rankCodes = dict((rank.lower(), code) for code, rank in enumerate(self.ranks))
+        self._nameBlob = index["nameBlob"]
+        self._nameOffsets = index["nameOffsets"]
+        self._nameTaxid = index["nameTaxid"]
+        self._nameHash = index["nameHash"]
+        self._nameOrder = index["nameOrder"]
+        self._names = {}  # interned names, {slot: name}
+        self._rankTables = {}  # ancestor tables, {rank code: table}
+
+    def __len__(self):
+        return int(numpy.count_nonzero(self.flags))
+
+    def __contains__(self, taxid):
+        return bool(self.flags[self.positions([taxid])[0]])
+
+    def positions(self, taxids):
+        """
+        Finds where taxids are held in the index's arrays.
+
+        Args:
+            taxids: An array-like of integer taxids.
+        Returns:
+            positions: An int64 array of positions, 0 for taxids outside the index,
+                which is never a taxon.
+        """
+        taxids = numpy.asarray(taxids, dtype=numpy.int64).reshape(-1)
+        if self.taxids is not None:
+            return compactPositions(self.taxids, taxids)
+        return numpy.where((taxids >= 0) & (taxids < len(self.flags)), taxids, 0)
+
+    def taxidAt(self, position):
+        return int(position if self.taxids is None else self.taxids[position])
+
+    def _slotName(self, slot):
+        try:
+            return self._names[slot]
+        except KeyError:
+            name = bytes(self._nameBlob[self._nameOffsets[slot]:self._nameOffsets[slot + 1]]).decode("utf-8")
+            return self._names.setdefault(slot, name)
+
+    def _positionName(self, position):
+        slot = self.nameIndex[position]
+        if slot < 0:
+            return None
+        return self._slotName(slot)
+
+    def name(self, taxid):
+        """
+        Looks up the scientific name of a taxon.
+
+        Args:
+            taxid: An integer taxid.
+        Returns:
+            name: The scientific name, or None if the taxon has none.
+        """
+        return self._positionName(self.positions([taxid])[0])
+
+    def resolve(self, taxid):
+        """
+        Follows merged taxids to the taxon that replaced them.
+
+        Args:
+            taxid: An integer taxid.
+        Returns:
+            taxid: The current taxid for the taxon.
+        """
+        position = self.positions([taxid])[0]
+        if not self.flags[position]:
+            raise Exception("Taxon id %s was not found in the NCBI DB.\nPlease update your DB and try again." % taxid)
+        if self.flags[position] & FLAG_DELETED:  # taxid has been removed from NCBI db, indicates that taxdump and blastdb are out of sync
+            raise Exception("ERROR: Taxon id %s has been deleted from the NCBI DB.\nPlease update your databases and re-run BLAST." % taxid)
+        if self.flags[position] & FLAG_MERGED:  # merged taxids are the same organism, effectively
+            return self.resolve(self.taxidAt(self.parent[position]))
+        return taxid
+
+    def ancestors(self, taxids, code):
+        """
+        Walks the lineages of a set of taxa up one level per pass until each
+        reaches the rank, so the cost is bounded by the depth of the tree.
+
+        Args:
+            taxids: An array of positions in the index, see positions().
+            code: The rank code to resolve to, or None if no taxon has that rank.
+        Returns:
+            ancestors: An int32 array holding the position of each one's ancestor
+                at that rank, 0 if the lineage reaches the root without passing
+                through it, or -1 if the taxon cannot be resolved.
+        """
+        flags = self.flags
+        rootPosition = self.positions([1])[0]
+        current = numpy.array(taxids, dtype=numpy.int32)
+        for _ in range(len(flags)):  # merged taxids may point at other merged taxids
+            merged = numpy.flatnonzero(flags[current] & FLAG_MERGED)
+            if not len(merged):
+                break
+            current[merged] = self.parent[current[merged]]
+        table = numpy.full(len(current), -1, dtype=numpy.int32)
+        valid = (flags[current] & (FLAG_PRESENT | FLAG_DELETED)) == FLAG_PRESENT
+        active = numpy.flatnonzero(valid)
+        current = current[active]
+        while len(active):
+            found = self.rank[current] == code
+            table[active[found]] = current[found]
+            parent = self.parent[current]
+            root = ~found & ((current == rootPosition) | (parent == current))
+            table[active[root]] = 0
+            walking = ~(found | root)
+            active = active[walking]
+            current = parent[walking]
+            lost = (flags[current] & (FLAG_PRESENT | FLAG_MERGED | FLAG_DELETED)) != FLAG_PRESENT
+            active = active[~lost]  # parents outside the tree stay unresolved
+            current = current[~lost]
+        return table
+
+    def rankTable(self, classificationLevel):
+        """
+        Builds, or returns the memoized copy of, the ancestor table for a rank,
+        walking the lineages of every taxid at once with ancestors().
+
+        Args:
+            classificationLevel: The level of classification to resolve to.
+        Returns:
+            table: An int32 array indexed by position, see positions(), holding
+                the position of the ancestor at that rank, 0 if the lineage reaches the root without
+                passing through it, or -1 if the taxid cannot be resolved.
+        """
+        code = self.rankCodes.get(classificationLevel.lower())
+        if code in self._rankTables:
+            return self._rankTables[code]
+        table = self.ancestors(numpy.arange(len(self.flags), dtype=numpy.int32), code)
+        self._rankTables[code] = table
+        return table
+
+    def lineages(self, taxids, classificationLevel):
+        """
+        Resolves a batch of taxids to their names at the chosen classification
+        level using the memoized ancestor table for that rank, or in lazy mode by
+        walking just their lineages.
+
+        Args:
+            taxids: An array-like of integer taxids.
+            classificationLevel: The level of classification to look up.
+        Returns:
+            classifications: An object array of names, "nohit" where the lineage
+                reaches the root without passing through the chosen level.
+        """
+        taxids = numpy.asarray(taxids, dtype=numpy.int64).reshape(-1)
+        positions = self.positions(taxids)  # taxids outside the index land on position 0, which never resolves
+        if self.lazy:  # only the lineages of these taxids are walked
+            unique, inverse = numpy.unique(positions, return_inverse=True)
+            ancestors = self.ancestors(unique, self.rankCodes.get(classificationLevel.lower()))[inverse.reshape(-1)]
+        else:
+            ancestors = self.rankTable(classificationLevel)[positions]
+        if len(ancestors) and ancestors.min() < 0:
+            bad = int(taxids[numpy.argmax(ancestors < 0)])
+            self.resolve(bad)  # raises with the reason the taxid is unusable
+            raise Exception("Taxid %s has failed to resolve." % bad)
+        unique, inverse = numpy.unique(ancestors, return_inverse=True)
+        names = numpy.array([self._positionName(ancestor) if ancestor else "nohit" for ancestor in unique], dtype=object)
+        for ancestor, name in zip(unique, names):
+            if name is None:  # a taxon at the chosen level without a scientific name in names.dmp
+                bad = int(taxids[numpy.argmax(ancestors == ancestor)])
+                raise Exception("Taxon id %s, the %s of taxid %s, has no scientific name in the NCBI DB.\nPlease update your DB and try again." % (self.taxidAt(ancestor), classificationLevel, bad))
+        return names[inverse.reshape(-1)]
+
+    def lineage(self, taxid, classificationLevel):
+        """
+        Resolves a single taxid to its ancestor at the chosen classification level.
+
+        Args:
+            taxid: An integer taxid.
+            classificationLevel: The level of classification to look up.
+        Returns:
+            classification: The name of the ancestor at that level, or "nohit"
+                if the lineage reaches the root without passing through it.
+        """
+        return self.lineages([taxid], classificationLevel)[0]
+
+    def taxidsForNames(self, names):
+        """
+        Looks up the taxids for a set of human readable names, using any name
+        class in names.dmp. Where a name is shared, the last entry wins.
+
+        Args:
+            names: An iterable of names.
+        Returns:
+            taxids: A dictionary mapping each name that was found to its taxid.
+        """
+        taxids = {}
+        for name in set(names):
+            encoded = name.encode("utf-8")
+            if not encoded:
+                continue
+            key = nameHash(encoded)
+            first, last = numpy.searchsorted(self._nameHash, [key, key + 1])
+            for slot in self._nameOrder[first:last][::-1]:  # usually a single slot
+                if bytes(self._nameBlob[self._nameOffsets[slot]:self._nameOffsets[slot + 1]]) == encoded:
+                    taxids[name] = int(self._nameTaxid[slot])
+                    break
+        return taxids
+
+
+def load(blastdb, cacheDir=None):
+    """
+    Loads the NCBI taxonomy, compiling its index first if needed.
+
+    Args:
+        blastdb: A string containing the root directory for the NCBI taxdump, or
+            the path to a taxdump archive such as taxdump.tar.gz.
+        cacheDir: Cache directory to use when the taxdump directory is read-only.
+    Returns:
+        taxonomy: A sidr.taxonomy.Taxonomy object.
+    """
+    return Taxonomy(loadIndex(blastdb, cacheDir))
+
+
+def loadLazy(blastdb, taxids=(), names=(), cacheDir=None):
+    """
+    Loads the NCBI taxonomy in lazy mode, for only the taxa seen in the input and
+    their ancestors. A current compiled index is memory-mapped, so only the pages
+    holding those lineages are read. Otherwise the taxdump is read in a filtered
+    streaming pass, without compiling an index.
+
+    Args:
+        blastdb: A string containing the root directory for the NCBI taxdump, or
+            the path to a taxdump archive such as taxdump.tar.gz.
+        taxids: Integer taxids seen in the input.
+        names: Names of any name class seen in the input.
+        cacheDir: Cache directory to look for the compiled index in when the
+            taxdump directory is read-only.
+    Returns:
+        taxonomy: A sidr.taxonomy.Taxonomy object in lazy mode.
+    """
+    if isCurrent(indexPath(blastdb, cacheDir), blastdb):
+        return Taxonomy(loadIndex(blastdb, cacheDir), lazy=True)
+    click.echo("Reading the lineages of %d taxa from %s" % (len(set(taxids)) + len(set(names)), blastdb))
+    return Taxonomy(observedIndex(blastdb, taxids, names), lazy=True)
@@ -0,0 +1,145 @@
+import gzip
+import io
+import numpy
+import os
+
+BUFFER_SIZE = 8 * 1024 * 1024  # bytes buffered before each write to disk
+GZIP_LEVEL = 6  # as gzip's own default, much faster than Python's level 9
+COMPRESSED = (".gz", ".zst")
+
+
+def splitExtension(path):
+    """
+    Splits the format and compression extensions off a path.
+
+    Args:
+        path: An output path, e.g. classifications.tsv.gz.
+    Returns:
+        extension: The format extension, e.g. ".tsv".
+        compression: The compression extension, e.g. ".gz", or "".
+    """
+    root, extension = os.path.splitext(path.lower())
+    if extension in COMPRESSED:
+        return os.path.splitext(root)[1], extension
+    return extension, ""
+
+
+def outputFormat(path):
+    """
+    Chooses the output format from the path's extension.
+
+    Args:
+        path: The output path.
+    Returns:
+        format: "parquet" for .parquet or .pq, "tsv" for .tsv (optionally
+            compressed), otherwise "text", SIDR's comma-plus-space format.
+    """
+    extension, compression = splitExtension(path)
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    if extension == ".tsv":
+        return "tsv"
+    return "text"
+
+
+def openText(path):
+    """
+    Opens a text file for writing through a large buffer, compressing it with
+    gzip or zstd if the path ends in .gz or .zst.
+
+    Args:
+        path: The path to write.
+    Returns:
+        handle: A writable text file object.
+    """
+    extension, compression = splitExtension(path)
+    if compression == ".gz":
+        binary = gzip.GzipFile(path, "wb", compresslevel=GZIP_LEVEL)
+    elif compression == ".zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Writing %s needs the zstandard package, install it with 'pip install zstandard'" % path)
+        binary = zstandard.ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+    else:
+        binary = io.FileIO(path, "w")
+    return io.TextIOWrapper(io.BufferedWriter(binary, BUFFER_SIZE), encoding="utf-8")
+
+
+class TextWriter(object):  # SIDR's original "contigid, classification, source" output
+    def __init__(self, path, classNames):
+        self.handle = openText(path)
+        self.handle.write("contigid, classification, source\n")
+
+    def write(self, contigids, classes, source, probabilities=None):
+        """
+        Writes a batch of classified contigs.
+
+        Args:
+            contigids: An array of contigIDs.
+            classes: An array of class names, one per contig.
+            source: "input" for contigs classified by BLAST, "dt" for the model.
+            probabilities: A float matrix of class probabilities, one row per
+                contig, or None. Ignored by this format.
+        """
+        self.handle.write("".join("%s, %s, %s\n" % row for row in zip(contigids, classes, [source] * len(contigids))))
+
+    def close(self):
+        self.handle.close()
+
+
+class TSVWriter(TextWriter):  # tab-delimited output with one probability column per class
+    def __init__(self, path, classNames):
+        self.handle = openText(path)
+        self.handle.write("\t".join(["contigid", "classification", "source"] + ["p_%s" % name for name in classNames]) + "\n")
+        self.blank = "\t" * len(classNames)
+
+    def write(self, contigids, classes, source, probabilities=None):
+        if probabilities is None:
+            rows = ("%s\t%s\t%s%s\n" % (contigid, className, source, self.blank) for contigid, className in zip(contigids, classes))
+        else:
+            rows = ("%s\t%s\t%s\t%s\n" % (contigid, className, source, "\t".join("%.4g" % p for p in row))
+                    for contigid, className, row in zip(contigids, classes, probabilities))
+        self.handle.write("".join(rows))
+
+
+class ParquetWriter(object):  # columnar output with one probability column per class, needs pyarrow
+    def __init__(self, path, classNames):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.columns = ["p_%s" % name for name in classNames]
+        self.schema = pyarrow.schema([("contigid", pyarrow.string()), ("classification", pyarrow.string()), ("source", pyarrow.string())] +
+                                     [(column, pyarrow.float32()) for column in self.columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, contigids, classes, source, probabilities=None):
+        if not len(contigids):
+            return
+        if probabilities is None:
+            probabilities = numpy.full((len(contigids), len(self.columns)), numpy.nan, dtype=numpy.float32)
+        arrays = [self.pyarrow.array(list(contigids), self.pyarrow.string()),
+                  self.pyarrow.array(list(classes), self.pyarrow.string()),
+                  self.pyarrow.array([source] * len(contigids), self.pyarrow.string())]
+        arrays.extend(self.pyarrow.array(numpy.ascontiguousarray(probabilities[:, col], dtype=numpy.float32)) for col in range(len(self.columns)))
+        self.writer.write_table(self.pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {"text": TextWriter, "tsv": TSVWriter, "parquet": ParquetWriter}
+
+
+def openWriter(path, classNames):
+    """
+    Opens the writer for the format chosen by the path's extension.
+
+    Args:
+        path: The output path.
+        classNames: The class names the model predicts, for probability columns.
+    Returns:
+        writer: An object with write(contigids, classes, source, probabilities)
+            and close() methods.
+    """
+    return WRITERS[outputFormat(path)](path, classNames)
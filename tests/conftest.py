@@ -0,0 +1,79 @@
+import pysam
+import pytest
+
+from sidr import taxonomy
+
+test_references = [("1", 200), ("2", 100), ("3", 150)]
+test_reads = [  # (contig, start, cigar, flag)
+    ("1", 0, "50M", 0),
+    ("1", 10, "20M5D25M", 16),
+    ("1", 30, "10S40M", 0),
+    ("1", 40, "20M30N20M", 0),
+    ("1", 45, "50M", 1024),  # duplicate, skipped
+    ("1", 120, "30M", 0),
+    ("1", 125, "10M", 256),  # secondary, skipped
+    ("1", 170, "30M", 0),
+    ("3", 0, "20M", 0),
+    ("3", 0, "20M", 0),
+    ("3", 5, "10M2I10M", 0),
+]
+
+# TODO: handle initial newline in csv
+test_names = """1 |   root    |       |   scientific name |
+2 |   phy    |       |   scientific name |
+2 |   phylum synonym    |       |   synonym |
+3 |   mergephy    |       |   scientific name |
+"""
+test_nodes = """1 |   1   |   no rank |       |   0   |   0   |   0   |   0   |   0   |   0   |   0   |   0   |
+2 |   1   |   phylum |       |   0   |   0   |   0   |   0   |   0   |   0   |   0   |   0   |
+3 |   1   |   phylum |       |   0   |   0   |   0   |   0   |   0   |   0   |   0   |   0   |
+"""
+test_deleted = "4 |"
+test_merged = "5   |   3   |"
+test_taxfiles = [test_names, test_nodes, test_merged, test_deleted]
+
+
+test_paired_reads = [  # (contig, start, cigar, flag), pileup() ignores paired reads not in a proper pair
+    ("1", 0, "50M", 0x1 | 0x2 | 0x40),  # proper pair
+    ("1", 20, "50M", 0x1 | 0x20 | 0x40),  # paired, mate not properly placed: skipped
+    ("1", 30, "40M", 0x1 | 0x2 | 0x10 | 0x80),
+    ("1", 60, "70M", 0x1 | 0x8 | 0x40),  # mate unmapped: skipped
+    ("1", 100, "30M", 0),
+]
+
+
+def writeBam(path, reads):
+    header = {"HD": {"VN": "1.0", "SO": "coordinate"}, "SQ": [{"SN": name, "LN": length} for name, length in test_references]}
+    with pysam.AlignmentFile(path, "wb", header=header) as bam:
+        for idx, (contig, start, cigar, flag) in enumerate(reads):
+            read = pysam.AlignedSegment(bam.header)
+            read.query_name = "read%d" % idx
+            read.reference_name = contig
+            read.reference_start = start
+            read.cigarstring = cigar
+            read.flag = flag
+            read.mapping_quality = 60
+            length = read.infer_query_length()
+            read.query_sequence = "A" * length
+            read.query_qualities = pysam.qualitystring_to_array("I" * length)
+            bam.write(read)
+    pysam.index(path)
+    return path
+
+
+@pytest.fixture
+def taxdump(tmpdir):
+    for name, contents in zip(taxonomy.TAXDUMP_FILES, test_taxfiles):
+        tmpdir.join(name).write(contents)
+    tmpdir.join("readme.txt").write("not a taxdump file")
+    return str(tmpdir)
+
+
+@pytest.fixture
+def bamfile(tmpdir):
+    return writeBam(str(tmpdir.join("test.bam")), test_reads)
+
+
+@pytest.fixture
+def pairedbamfile(tmpdir):
+    return writeBam(str(tmpdir.join("paired.bam")), test_paired_reads)
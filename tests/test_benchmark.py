@@ -0,0 +1,37 @@
+import sidr
+import sidr.benchmark
+import sidr.common
+import json
+import numpy
+import pytest
+
+
+@pytest.fixture
+def contigs():
+    contigids = ["c%d" % i for i in range(60)]
+    store = sidr.common.ContigStore(contigids, ["GC", "Coverage"])
+    store.column("GC")[:] = [10] * 30 + [90] * 30
+    store.column("Coverage")[:] = list(range(30)) * 2
+    store.classify(contigids[:25], ["low"] * 25)
+    store.classify(contigids[30:55], ["high"] * 25)
+    return store
+
+
+@pytest.mark.parametrize("threads", [1, 2])
+def test_benchmarkClassifiers(contigs, threads):
+    corpus, testdata, features = sidr.common.constructCorpus(contigs, False, "low")
+    results = sidr.benchmark.benchmarkClassifiers(corpus, ["tree", "forest"], folds=3, threads=threads, nEstimators=5)
+    assert [r["classifier"] for r in results] == ["tree", "forest"]
+    for result in results:
+        assert 0.5 < result["accuracy"] <= 1.0
+        assert result["fitTime"] > 0 and result["predictTime"] > 0
+        assert result["peakRSS"] > 0
+
+
+def test_runBenchmark(contigs, tmpdir):
+    sidr.benchmark.runBenchmark(contigs, True, "low", ["tree"], 2, 1, None, None, str(tmpdir.join("report.json")), True)
+    results = json.loads(tmpdir.join("report.json").read())
+    assert [r["name"] for r in results] == ["Decision tree"]
+    table = sidr.benchmark.formatResults(results).splitlines()
+    assert table[0].startswith("Classifier")
+    assert table[1].startswith("Decision tree")
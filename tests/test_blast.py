@@ -0,0 +1,56 @@
+import gzip
+
+from sidr import blast
+from sidr import files
+
+test_blast = """# comment lines are skipped
+1\t2\t99.0
+1\t3\t98.0
+x\t2\t97.0
+2\t5;2\t96.0
+
+x\t3\t95.0
+"""
+
+
+def test_firstHits():
+    hits, unmatched = blast.firstHits(test_blast.splitlines(True), {"1": None, "2": None, "3": None})
+    assert list(hits.items()) == [("1", "2"), ("2", "5;2")]
+    assert unmatched == {"x": 2}
+    hits, unmatched = blast.firstHits(test_blast.splitlines(True))
+    assert list(hits) == ["1", "x", "2"] and unmatched == {}
+
+
+def test_firstHits_columns():
+    lines = ["2\t99.0\t1\n", "5\t98.0\t1\n", "3\t97.0\t2\n"]
+    hits, unmatched = blast.firstHits(lines, set(["1", "2"]), idColumn=2, taxidColumn=0)
+    assert list(hits.items()) == [("1", "2"), ("2", "3")]
+
+
+def test_openText(tmpdir):
+    path = str(tmpdir.join("blast.tsv.gz"))
+    with gzip.open(path, "wt") as f:
+        f.write(test_blast)
+    with files.openText(path) as data:
+        assert data.read() == test_blast
+
+
+def test_shardOffsets(tmpdir):
+    path = str(tmpdir.join("blast.tsv"))
+    with open(path, "w") as f:
+        f.write(test_blast)
+    ranges = blast.shardOffsets(path, 4)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(test_blast)
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    assert all(test_blast[start - 1] == "\n" for start, _ in ranges[1:])
+    assert "".join(line for start, end in ranges for line in blast.readRange(path, start, end)) == test_blast
+
+
+def test_shardedFirstHits(tmpdir):
+    path = str(tmpdir.join("blast.tsv"))
+    with open(path, "w") as f:
+        f.write(test_blast * 3)
+    contigs = {"1": None, "2": None, "3": None}
+    serial = blast.firstHits((test_blast * 3).splitlines(True), contigs)
+    assert blast.shardedFirstHits(path, contigs, 2) == serial
+    assert blast.shardedFirstHits(path, None, 2) == blast.firstHits((test_blast * 3).splitlines(True))
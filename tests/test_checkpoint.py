@@ -0,0 +1,49 @@
+import sidr
+import sidr.checkpoint
+import sidr.default
+import sidr.files
+import sidr.synthetic
+import os
+import pytest
+
+
+def runDefault(dataset, tmpdir, workdir, target, binary=False, useCache=True, jobs=1):
+    return sidr.default.runAnalysis(dataset.bam, dataset.fasta, dataset.blast, dataset.taxdump, False, str(tmpdir.join("out.txt")),
+                                    str(tmpdir.join("tokeep")), str(tmpdir.join("toremove")), binary, target, "phylum",
+                                    useCache=useCache, modelOptions=dict(nEstimators=5, jobs=jobs), workdir=workdir)
+
+
+def test_stageKey(tmpdir):
+    path = tmpdir.join("data.txt")
+    path.write("ACGT" * 1000)
+    digest = sidr.files.fileIdentity(str(path), sample=True)
+    assert sidr.checkpoint.stageKey("fasta", digest, 4) == sidr.checkpoint.stageKey("fasta", digest, 4)
+    assert sidr.checkpoint.stageKey("fasta", digest, 4) != sidr.checkpoint.stageKey("fasta", digest, None)
+
+
+def test_runAnalysis_resume(tmpdir, monkeypatch):
+    dataset = sidr.synthetic.generate(str(tmpdir.join("data")), contigs=60, phyla=2, meanLength=1000, coverage=2)
+    workdir = str(tmpdir.join("work"))
+    stages = [record["stage"] for record in runDefault(dataset, tmpdir, workdir, "Phylum0").stages]
+    assert sorted(stages[:4]) == ["bam", "blast", "fasta", "taxdump"] and stages[4:7] == ["classify", "corpus", "train"]
+    assert sorted(name.split("-")[0] for name in os.listdir(workdir)) == ["bam", "blast", "fasta", "model"]
+    first = tmpdir.join("tokeep").read()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("stage should have been resumed")
+    monkeypatch.setattr(sidr.default, "readFasta", fail)
+    monkeypatch.setattr(sidr.default, "readBAM", fail)
+    monkeypatch.setattr(sidr.common, "parseTaxdump", fail)
+    stages = [record["stage"] for record in runDefault(dataset, tmpdir, workdir, "Phylum0").stages]
+    assert stages == ["corpus", "predict", "output"]
+    assert tmpdir.join("tokeep").read() == first
+    stages = [record["stage"] for record in runDefault(dataset, tmpdir, workdir, "Phylum0", jobs=2).stages]
+    assert stages == ["corpus", "predict", "output"]  # the number of jobs doesn't change the fitted model
+
+    model = [name for name in os.listdir(workdir) if name.startswith("model-")]
+    stages = [record["stage"] for record in runDefault(dataset, tmpdir, workdir, "Phylum1").stages]
+    assert "train" in stages and "blast" not in stages
+    assert [name for name in os.listdir(workdir) if name.startswith("model-")] != model  # replaced, not added
+
+    with pytest.raises(AssertionError):  # --no-cache recomputes every stage
+        runDefault(dataset, tmpdir, workdir, "Phylum1", useCache=False)
@@ -1,9 +1,26 @@
 import sidr
+import sidr.cli
+import click
 import pytest
 import mock
 
+from click.testing import CliRunner
 from contextlib import closing
 try:  # https://stackoverflow.com/questions/11914472/stringio-in-python3
     from StringIO import StringIO
 except ImportError:
     from io import StringIO
+
+
+@pytest.mark.parametrize("jobs", [-1, 1, 2])
+def test_validate_jobs(jobs):
+    assert sidr.cli.validate_jobs(None, None, jobs) == jobs
+
+
+@pytest.mark.parametrize("jobs", ["0", "-2"])
+def test_validate_jobs_invalid(jobs):
+    with pytest.raises(click.BadParameter):
+        sidr.cli.validate_jobs(None, None, int(jobs))
+    result = CliRunner().invoke(sidr.cli.cli, ["runfile", "--jobs", jobs])
+    assert result.exit_code == 2
+    assert "must be -1, for every core, or at least 1" in result.output
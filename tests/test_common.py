@@ -1,4 +1,7 @@
 import sidr
+import sidr.common
+import numpy
+import pickle
 import pytest
 import mock
 
@@ -9,19 +12,6 @@ except ImportError:
     from io import StringIO
 
 
-# TODO: handle initial newline in csv
-test_names = """1 |   root    |       |   scientific name |
-2 |   phy    |       |   scientific name |
-3 |   mergephy    |       |   scientific name |
-"""
-test_nodes = """1 |   1   |   no rank |       |   0   |   0   |   0   |   0   |   0   |   0   |   0   |   0   |
-2 |   1   |   phylum |       |   0   |   0   |   0   |   0   |   0   |   0   |   0   |   0   |
-3 |   1   |   phylum |       |   0   |   0   |   0   |   0   |   0   |   0   |   0   |   0   |
-"""
-test_deleted = "4 |"
-test_merged = "5   |   3   |"
-test_taxfiles = [test_names, test_nodes, test_merged, test_deleted]
-test_taxdump = {'3': ['mergephy', '1', 'phylum'], '2': ['phy', '1', 'phylum'], '4': ['deleted'], '5': ['merged', '3'], '1': ['root', '1', 'no rank']}
 test_gc = {"1": 50.0}
 
 # some helpful sites
@@ -36,18 +26,117 @@ def filegenerator(filestrings):
         yield closing(StringIO(f))
 
 
-def test_parseTaxdump():
-    with mock.patch('sidr.common.open', mock.mock_open()) as m:
-        m.side_effect = filegenerator(test_taxfiles)
-        assert sidr.common.parseTaxdump("test", False)[0] == test_taxdump
+def test_parseTaxdump(taxdump):
+    test_taxdump = sidr.common.parseTaxdump(taxdump)
+    assert len(test_taxdump) == 5
+    assert [test_taxdump.name(taxid) for taxid in [1, 2, 3]] == ["root", "phy", "mergephy"]
+    assert list(test_taxdump.parent[1:6]) == [1, 1, 1, 0, 3]
 
 
-def test_taxidToLineage():
+def test_taxidToLineage(taxdump):
+    test_taxdump = sidr.common.parseTaxdump(taxdump)
     assert sidr.common.taxidToLineage("2", test_taxdump, "phylum") == "phy"
+    assert sidr.common.taxidToLineage("2;3", test_taxdump, "phylum") == "phy"
+    assert sidr.common.taxidToLineage("1", test_taxdump, "phylum") == "nohit"
     assert sidr.common.taxidToLineage("5", test_taxdump, "phylum") == "mergephy"
     with pytest.raises(Exception) as excinfo:
         sidr.common.taxidToLineage("4", test_taxdump, "phylum")
     assert "ERROR: Taxon id 4 has been deleted from the NCBI DB." in str(excinfo.value)
 
+
+def test_taxidsToLineages(taxdump):
+    test_taxdump = sidr.common.parseTaxdump(taxdump)
+    assert list(sidr.common.taxidsToLineages(["2", "5;2", "1"], test_taxdump, "phylum")) == ["phy", "mergephy", "nohit"]
+
+def test_ContigStore():
+    store = sidr.common.ContigStore(["c", "a", "b", "d"], ["GC", "Coverage"])
+    store.column("GC")[:] = [1, 2, 3, 4]
+    store.classify(["d", "c"], ["phy", "other"])
+    store.classify(["b"], ["phy"])
+    assert store.classList == ["phy", "other"]
+    assert [store.classification(x) for x in ["a", "b", "c", "d"]] == [False, "phy", "other", "phy"]
+    assert store.partition() == 3
+    assert list(store.contigids[3:]) == ["a"]
+    assert sorted(store.contigids[:3]) == ["b", "c", "d"]
+    assert [store.X[store.index[x], 0] for x in ["a", "b", "c", "d"]] == [2, 3, 1, 4]
+    assert [store.classification(x) for x in ["a", "b", "c", "d"]] == [False, "phy", "other", "phy"]
+
+
 def test_constructCorpus():
-    return
\ No newline at end of file
+    store = sidr.common.ContigStore(["1", "2", "3"], ["GC"])
+    store.classify(["1", "3"], ["phy", "Other"])
+    corpus, testdata, features = sidr.common.constructCorpus(store, False, "phy")
+    assert features == ["GC"]
+    assert corpus.X.base is not None and testdata.X.base is not None  # views, not copies
+    assert sorted(corpus.classNames[y] for y in corpus.Y) == ["Other", "phy"]
+    assert list(testdata.contigids) == ["2"]
+    corpus, testdata, features = sidr.common.constructCorpus(store, True, "Phy")
+    assert corpus.classNames == ["nontarget", "target"]
+    assert sorted(corpus.Y) == [0, 1]
+
+
+@pytest.mark.parametrize("batchSize,threads", [(100, 1), (2, 1), (2, 2)])
+def test_classifyData(tmpdir, batchSize, threads):
+    contigids = ["c%d" % i for i in range(40)]
+    store = sidr.common.ContigStore(contigids, ["GC", "Coverage"])
+    store.column("GC")[:] = [10] * 20 + [90] * 20
+    store.column("Coverage")[:] = list(range(20)) * 2  # only GC separates the classes
+    store.classify(contigids[:15], ["low"] * 15)
+    store.classify(contigids[20:35], ["high"] * 15)
+    corpus, testdata, features = sidr.common.constructCorpus(store, False, "low")
+    classifier = sidr.common.constructModel(corpus, features, False)
+    result = list(sidr.common.classifyData(classifier, testdata, corpus.classNames, batchSize, threads))
+    assert len(result) == -(-10 // batchSize)
+    assert [len(contigids) for contigids, Y, proba in result[:-1]] == [batchSize] * (len(result) - 1)
+    assert all(proba is None for contigids, Y, proba in result)
+    classes = dict((x, corpus.classNames[y]) for contigids, Y, proba in result for x, y in zip(contigids, Y))
+    assert classes == dict([(x, "low") for x in contigids[15:20]] + [(x, "high") for x in contigids[35:]])
+    sidr.common.generateOutput(str(tmpdir.join("keep")), str(tmpdir.join("remove")), iter(result), store, "low", str(tmpdir.join("out")), corpus.classNames)
+    output = tmpdir.join("out").read().splitlines()
+    assert output[0] == "contigid, classification, source"
+    assert output[1:16] == ["%s, low, input" % x for x in contigids[:15]]
+    assert sorted(tmpdir.join("keep").read().split()) == sorted(contigids[:20])
+
+def test_initClassifier():
+    classifier = sidr.common.buildClassifier("forest", nEstimators=5, maxDepth=3, jobs=-1)
+    sidr.common.initClassifier(classifier, 2, False)
+    assert sidr.common._classifier[0].get_params()["n_jobs"] == 1
+
+
+@pytest.mark.parametrize("estimator", sorted(sidr.common.CLASSIFIERS))
+def test_buildClassifier(estimator):
+    classifier = sidr.common.buildClassifier(estimator, nEstimators=5, maxDepth=3, jobs=1)
+    params = classifier.get_params()
+    if estimator != "tree":
+        assert params.get("n_estimators", params.get("max_iter")) == 5
+    assert 3 in [value for key, value in params.items() if key.endswith("max_depth")]
+    X = numpy.array([[0, 0], [0, 1], [1, 0], [1, 1]] * 50, dtype=numpy.float32)
+    Y = numpy.array([0, 0, 1, 1] * 50)
+    assert list(classifier.fit(X, Y).predict(X[:4])) == [0, 0, 1, 1]
+    with pytest.raises(ValueError):
+        sidr.common.buildClassifier("svm")
+
+
+def test_ContigStore_save(tmpdir):
+    store = sidr.common.ContigStore(["1", "2", "3"], ["GC", "Coverage"])
+    store.column("GC")[:] = [0.25, 0.5, 0.75]
+    store.classify(["3", "1"], ["b", "a"])
+    store.save(str(tmpdir.join("features.npz")))
+    loaded = sidr.common.ContigStore.load(str(tmpdir.join("features.npz")))
+    assert list(loaded.contigids) == ["1", "2", "3"]
+    assert loaded.features == ["GC", "Coverage"]
+    assert numpy.array_equal(loaded.X, store.X)
+    assert [loaded.classification(c) for c in ["1", "2", "3"]] == ["a", False, "b"]
+
+
+def test_saveModel(tmpdir):
+    X = numpy.array([[0.1], [0.9]] * 5, dtype=numpy.float32)
+    classifier = sidr.common.buildClassifier("tree").fit(X, [0, 1] * 5)
+    model = sidr.common.Model(classifier, ["GC"], ["a", "b"], "phylum", "a", False, 4)
+    sidr.common.saveModel(str(tmpdir.join("model")), model)
+    loaded = sidr.common.loadModel(str(tmpdir.join("model")))
+    assert loaded[1:] == model[1:]
+    assert list(loaded.classifier.predict(X[:2])) == [0, 1]
+    tmpdir.join("bad").write_binary(pickle.dumps({"version": 0}))
+    with pytest.raises(ValueError):
+        sidr.common.loadModel(str(tmpdir.join("bad")))
@@ -0,0 +1,64 @@
+import mock
+import numpy
+import os
+import pysam
+
+from sidr import files
+from sidr import coverage
+
+
+def pileupCoverage(bamfile, contig):  # the per-base calculation readBAM used to do
+    covArray = [pile.nsegments for pile in pysam.AlignmentFile(bamfile, "rb").pileup(contig=contig)]
+    return sum(covArray) / len(covArray) if covArray else 0
+
+
+def test_foldIntervals():
+    assert coverage.foldIntervals(numpy.array([0, 5, 20]), numpy.array([10, 8, 30]), 0) == (23, 20, 30)
+    assert coverage.foldIntervals(numpy.array([25]), numpy.array([40]), 30) == (15, 10, 40)
+
+
+def test_contigCoverage(bamfile):
+    alignment = pysam.AlignmentFile(bamfile, "rb")
+    for contig in ["1", "2", "3"]:
+        assert abs(coverage.contigCoverage(alignment, contig) - pileupCoverage(bamfile, contig)) < 1e-9
+        assert abs(coverage.contigCoverage(alignment, contig, chunkSize=2) - pileupCoverage(bamfile, contig)) < 1e-9
+    assert coverage.contigCoverage(alignment, "2") == 0
+
+
+def test_contigCoverage_paired(pairedbamfile):
+    alignment = pysam.AlignmentFile(pairedbamfile, "rb")
+    assert abs(coverage.contigCoverage(alignment, "1") - pileupCoverage(pairedbamfile, "1")) < 1e-9
+    assert coverage.contigCoverage(alignment, "1") == (50 + 40 + 30) / 100.0  # the orphans are left out
+
+
+def test_balanceContigs():
+    shards = coverage.balanceContigs({"a": 100, "b": 60, "c": 50, "d": 10}, 2)
+    assert sorted(sorted(shard) for shard in shards) == [["a", "d"], ["b", "c"]]
+    assert len(coverage.balanceContigs({"a": 100}, 4)) == 1
+
+
+def test_bamCoverage(bamfile):
+    serial = coverage.bamCoverage(bamfile, ["1", "2", "3"])
+    assert coverage.bamCoverage(bamfile, ["1", "2", "3"], threads=2) == serial
+    assert serial["2"] == 0
+
+
+def test_cachedCoverage(bamfile, tmpdir):
+    cacheDir = str(tmpdir.join("cache"))
+    first = coverage.cachedCoverage(bamfile, ["1", "3"], cacheDir=cacheDir)
+    path = coverage.cachePath(bamfile, cacheDir)
+    assert coverage.readCache(path, coverage.bamIdentity(bamfile)) == first
+    with mock.patch("sidr.coverage.bamCoverage") as bc:
+        bc.return_value = {"2": 0}
+        assert coverage.cachedCoverage(bamfile, ["1", "2", "3"], cacheDir=cacheDir) == dict(first, **{"2": 0})
+        bc.assert_called_once_with(bamfile, ["2"], 1)
+    identity = coverage.bamIdentity(bamfile)
+    identity["bam"][0] += 1  # BAM changed since the cache was written
+    assert coverage.readCache(path, identity) == {}
+
+
+def test_cachePath(bamfile, tmpdir, monkeypatch):
+    assert coverage.cachePath(bamfile) == bamfile + ".sidr-coverage.json"
+    assert os.path.dirname(coverage.cachePath(bamfile, str(tmpdir))) == str(tmpdir)
+    monkeypatch.setattr(os, "access", lambda path, mode: False)  # a read-only BAM directory
+    assert os.path.dirname(coverage.cachePath(bamfile)) == files.DEFAULT_CACHE
@@ -1,4 +1,6 @@
 import sidr
+import sidr.common
+import sidr.default
 import pytest
 import mock
 
@@ -14,21 +16,43 @@ GCGCATATGCGCATATGCGCATATGCGCATATGCGCATATGCGCATATGCGCATATGCGCATATGCGCATAT
 GCGCATATGCGCATATGCGCATATGCGCATATGCGCATATGCGCATATGCGCATATGCGCATATGCGCATAT
 """
 
+test_blast = """1\t2\t99.0
+1\t4\t98.0
+x\t2\t97.0
+2\t5\t96.0
+"""
+
 def filegenerator(filestrings):
     for f in filestrings:
         yield closing(StringIO(f))
 
-def test_readFasta():
-    with mock.patch('sidr.default.open', mock.mock_open()) as m:
-        m.side_effect = filegenerator([test_fasta])
-        fastaCheck = sidr.default.readFasta("test")
-        assert list(fastaCheck.keys()) == ['1']
-        assert list(fastaCheck.values())[0].variables["GC"] == 50
+def test_readFasta(tmpdir):
+    tmpdir.join("test.fa").write(test_fasta)
+    fastaCheck = sidr.default.readFasta(str(tmpdir.join("test.fa")))
+    assert list(fastaCheck.contigids) == ['1']
+    assert fastaCheck.features == ["GC", "Coverage"]
+    assert fastaCheck.column("GC")[0] == 50
+
+def test_readBAM(bamfile):
+    contigs = sidr.common.ContigStore(["1", "2", "3"], ["Coverage"])
+    contigs = sidr.default.readBAM(bamfile, contigs, useCache=False)
+    assert [round(float(x), 3) for x in contigs.column("Coverage")] == [1.588, 0, 2.4]
+
 
-def test_readBAM():
-    return
+def test_readBLAST(tmpdir, taxdump):
+    tmpdir.join("blast.tsv").write(test_blast)
+    tax = sidr.common.parseTaxdump(taxdump)
+    contigs = sidr.common.ContigStore(["1", "2", "3"], ["GC"])
+    contigs = sidr.default.readBLAST(str(tmpdir.join("blast.tsv")), tax, "phylum", contigs)
+    assert [contigs.classification(x) for x in ["1", "2", "3"]] == ["phy", "mergephy", False]
+    assert contigs.classList == ["phy", "mergephy"]
+    assert contigs.classMap == {"phy": 0, "mergephy": 1}
 
 
-def test_readBLAST():
-    return
 
+def test_matchHits(tmpdir):
+    tmpdir.join("blast.tsv").write(test_blast)
+    hits = sidr.default.readHits(str(tmpdir.join("blast.tsv")))
+    assert hits == {"1": "2", "x": "2", "2": "5"}
+    contigs = sidr.common.ContigStore(["1", "2", "3"], ["GC"])
+    assert sidr.default.matchHits(hits, contigs) == sidr.default.readHits(str(tmpdir.join("blast.tsv")), contigs)
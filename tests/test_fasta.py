@@ -0,0 +1,103 @@
+import gzip
+import io
+import mock
+import numpy
+import pysam
+import pytest
+
+from sidr import files
+from sidr import fasta
+
+test_fasta = b"""leading text is ignored
+>1 first contig
+GCGCATATGCGCATAT
+GCGCATAT
+>2
+ggccSSAT\r
+ATAT
+>3
+>4 no trailing newline
+GGGC"""
+test_gc = [("1", 50.0), ("2", 50.0), ("3", 0), ("4", 100.0)]
+
+
+def gcOnly(records):
+    return [(contigid, float(variables[0])) for contigid, variables in records]
+
+
+def asLists(records):
+    return [(contigid, list(variables)) for contigid, variables in records]
+
+
+def test_countGC():
+    assert fasta.countGC(b"GCAT\nsgNN\r\n") == (8, 4)
+
+
+def test_streamFeatures():
+    assert gcOnly(fasta.streamFeatures(io.BytesIO(test_fasta))) == test_gc
+    with mock.patch("sidr.fasta.BLOCK_SIZE", 3):  # records and headers split across blocks
+        assert gcOnly(fasta.streamFeatures(io.BytesIO(test_fasta))) == test_gc
+
+
+def test_fastaFeatures_gzip(tmpdir):
+    path = str(tmpdir.join("test.fa.gz"))
+    with gzip.open(path, "wb") as f:
+        f.write(test_fasta)
+    assert files.isGzip(path) and not files.isBGZF(path)
+    assert gcOnly(fasta.fastaFeatures(path)) == test_gc
+
+
+def test_fastaFeatures_faidx(tmpdir):
+    path = str(tmpdir.join("test.fa"))
+    with open(path, "wb") as f:
+        f.write(b">1\nGCGCATAT\nGCAT\n>2\nGGGG\n>3\nATAT\n")
+    pysam.tabix_compress(path, path + ".gz")
+    pysam.faidx(path + ".gz")
+    assert files.isBGZF(path + ".gz")
+    expected = [("1", 50.0), ("2", 100.0), ("3", 0)]
+    assert gcOnly(fasta.fastaFeatures(path + ".gz")) == expected
+    assert gcOnly(fasta.fastaFeatures(path + ".gz", threads=2)) == expected
+    with mock.patch("sidr.fasta.WINDOW_SIZE", 5):
+        assert asLists(fasta.faidxWorker((path + ".gz", ["1"], 4))) == asLists(fasta.streamFeatures(io.BytesIO(b">1\nGCGCATATGCAT\n"), 4))
+
+
+def test_canonicalKmers():
+    canonical, names = fasta.canonicalKmers(4)
+    assert len(names) == 136
+    assert names[0] == "AAAA" and "TTTT" not in names
+    assert canonical[0] == canonical[255]  # AAAA and TTTT
+    assert len(fasta.kmerNames(2)) == 10
+
+
+def test_kmerCounts():
+    counts = fasta.kmerCounts(b"ACGTNACG", 3)
+    assert counts.sum() == 3  # ACG, CGT and ACG; windows with N are skipped
+    assert counts[int("012", 4)] == 2
+
+
+def test_kmerProfile():
+    chunked = asLists(fasta.streamFeatures(io.BytesIO(b">a\nAAAAC\nCCGT\n>b\nNNNN\n"), 2))
+    with mock.patch("sidr.fasta.BLOCK_SIZE", 2):  # k-mers spanning chunk boundaries are still counted
+        assert asLists(fasta.streamFeatures(io.BytesIO(b">a\nAAAAC\nCCGT\n>b\nNNNN\n"), 2)) == chunked
+    profile = dict(zip(fasta.featureNames(2), chunked[0][1]))
+    assert abs(sum(v for k, v in profile.items() if k.startswith("kmer_")) - 1) < 1e-6
+    assert profile["kmer_AA"] == 3.0 / 8  # AAAA contributes three AA
+    assert profile["kmer_CC"] == 2.0 / 8 and "kmer_GG" not in profile  # GG folds onto CC
+    assert all(v == 0 for v in chunked[1][1][1:])
+
+
+def test_fastaFeatures_pool(tmpdir):
+    path = str(tmpdir.join("test.fa"))
+    with open(path, "wb") as f:
+        f.write(test_fasta)
+    assert asLists(fasta.fastaFeatures(path, threads=2, kmer=4)) == asLists(fasta.fastaFeatures(path, kmer=4))
+
+
+def test_streamFeaturesFile_bounded(tmpdir, monkeypatch):
+    monkeypatch.setattr(fasta, "SEQUENCE_BATCH", 1)  # more batches than may be in flight
+    path = str(tmpdir.join("many.fa.gz"))
+    with gzip.open(path, "wb") as f:
+        f.write(b"".join(b">c%d\nACGTGGCC%s\n" % (idx, b"A" * idx) for idx in range(20)))
+    records = asLists(fasta.streamFeaturesFile(path, threads=2, kmer=2))
+    assert records == asLists(fasta.streamFeaturesFile(path, kmer=2))
+    assert [contigid for contigid, values in records] == ["c%d" % idx for idx in range(20)]
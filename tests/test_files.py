@@ -0,0 +1,31 @@
+import os
+import pytest
+import sidr
+import sidr.files
+
+
+def test_fileIdentity(tmpdir):
+    path = tmpdir.join("data.txt")
+    path.write("ACGT" * 1000)
+    identity = sidr.files.fileIdentity(str(path), sample=True)
+    assert sidr.files.fileIdentity(str(path), sample=True) == identity
+    assert sidr.files.fileIdentity(str(path)) == identity[:2]
+    path.write("ACGT" * 1001)
+    assert sidr.files.fileIdentity(str(path), sample=True) != identity
+    assert sidr.files.fileIdentity(None) is None
+
+
+def test_atomicWrite(tmpdir):
+    path = str(tmpdir.join("cache", "out.txt"))
+    def write(tmpPath):
+        with open(tmpPath, "w") as out:
+            out.write("done")
+    sidr.files.atomicWrite(path, write)
+    assert open(path).read() == "done"
+
+    def fail(tmpPath):
+        raise IOError("disk full")
+    with pytest.raises(IOError):
+        sidr.files.atomicWrite(path, fail)
+    assert open(path).read() == "done" and os.listdir(str(tmpdir.join("cache"))) == ["out.txt"]
+    assert sidr.files.userCachePath(path, "coverage", str(tmpdir)) != sidr.files.userCachePath(path + "2", "coverage", str(tmpdir))
@@ -0,0 +1,95 @@
+import sidr
+import sidr.filterReads
+import gzip
+import pysam
+import pytest
+
+test_references = [("1", 200), ("2", 200), ("3", 200)]
+test_pairs = [  # (name, read 1 contig and start, read 2 contig and start), None for unmapped
+    ("both1", ("1", 0), ("1", 100)),
+    ("split", ("1", 50), ("2", 10)),
+    ("both2", ("2", 20), ("2", 120)),
+    ("half", ("3", 5), None),
+    ("none", None, None),
+]
+
+
+def makeRead(header, name, position, matePosition, read1):
+    read = pysam.AlignedSegment(header)
+    read.query_name = name
+    read.flag = 0x1 | (0x40 if read1 else 0x80) | (0 if position else 0x4) | (0 if matePosition else 0x8) | (0 if read1 else 0x10)
+    placed = position or matePosition or ("*", -1)
+    mate = matePosition or position or ("*", -1)
+    read.reference_id = header.get_tid(placed[0]) if placed[0] != "*" else -1
+    read.reference_start = placed[1]
+    read.next_reference_id = header.get_tid(mate[0]) if mate[0] != "*" else -1
+    read.next_reference_start = mate[1]
+    read.query_sequence = ("ACGT" * 5) if read1 else ("AACC" * 5)
+    read.query_qualities = pysam.qualitystring_to_array("I" * 19 + "5")
+    if position:
+        read.cigarstring = "20M"
+        read.mapping_quality = 60
+    return read
+
+
+@pytest.fixture(params=["coordinate", "queryname", "unsorted"])
+def pairedbam(tmpdir, request):
+    path = str(tmpdir.join("paired.bam"))
+    header = pysam.AlignmentHeader.from_dict({"HD": {"VN": "1.6", "SO": request.param},
+                                              "SQ": [{"SN": name, "LN": length} for name, length in test_references]})
+    reads = []
+    for name, first, second in test_pairs:
+        reads.append(makeRead(header, name, first, second, True))
+        reads.append(makeRead(header, name, second, first, False))
+    if request.param == "coordinate":
+        reads.sort(key=lambda r: (r.reference_id if r.reference_id >= 0 else 99, r.reference_start))
+    with pysam.AlignmentFile(path, "wb", header=header) as bam:
+        for read in reads:
+            bam.write(read)
+    return path
+
+
+def names(path):
+    with (gzip.open(path, "rt") if path.endswith(".gz") else open(path)) as fastq:
+        return [line.split()[0] for line in fastq.read().splitlines()[::4]]
+
+
+def test_runFilter(tmpdir, pairedbam):
+    tmpdir.join("keep").write("1\n4\n")
+    out = dict((key, str(tmpdir.join(key))) for key in ["r1.fq", "r2.fq.gz", "single.fq"])
+    sidr.filterReads.runFilter(str(tmpdir.join("keep")), pairedbam, out["r1.fq"], out["r2.fq.gz"], out["single.fq"])
+    assert sorted(names(out["r1.fq"])) == ["@both1/1", "@split/1"]
+    assert names(out["r2.fq.gz"]) == [name.replace("/1", "/2") for name in names(out["r1.fq"])]
+    assert names(out["single.fq"]) == []
+    with open(out["r1.fq"]) as fastq:
+        assert fastq.read().splitlines()[1:4] == ["ACGT" * 5, "+", "I" * 19 + "5"]
+    with gzip.open(out["r2.fq.gz"], "rt") as fastq:
+        assert fastq.read().splitlines()[1:4] == ["GGTT" * 5, "+", "5" + "I" * 19]  # reverse strand read, back in its original orientation
+    tmpdir.join("keep").write("3\n")
+    sidr.filterReads.runFilter(str(tmpdir.join("keep")), pairedbam, out["r1.fq"], out["r2.fq.gz"])
+    assert names(out["r1.fq"]) == ["@half/1"]
+    assert names(out["r2.fq.gz"]) == ["@half/2"]
+
+
+def test_keptPairs():
+    header = pysam.AlignmentHeader.from_dict({"SQ": [{"SN": name, "LN": length} for name, length in test_references]})
+    reads = [makeRead(header, "orphan", ("2", 0), ("1", 0), True)]
+    assert [(r1.query_name, r2) for r1, r2 in sidr.filterReads.keptPairs(reads, {0})] == [("orphan", None)]
+    assert list(sidr.filterReads.keptPairs(reads, {2})) == []
+
+
+@pytest.mark.parametrize("HD,grouped", [({"SO": "queryname"}, True), ({"SO": "unsorted", "GO": "query"}, True),
+                                        ({"SO": "unsorted"}, False), ({"SO": "unknown"}, False), ({}, False), ({"SO": "coordinate"}, False)])
+def test_isGrouped(tmpdir, HD, grouped):
+    path = str(tmpdir.join("header.bam"))
+    header = dict({"HD": dict(HD, VN="1.6")} if HD else {}, SQ=[{"SN": name, "LN": length} for name, length in test_references])
+    with pysam.AlignmentFile(path, "wb", header=header):
+        pass
+    with pysam.AlignmentFile(path, "rb") as alignment:
+        assert sidr.filterReads.isGrouped(alignment) == grouped
+
+
+def test_readContigList(tmpdir):
+    with gzip.open(str(tmpdir.join("keep.gz")), "wt") as keep:
+        keep.write("1\n\n4\n")
+    assert sidr.filterReads.readContigList(str(tmpdir.join("keep.gz"))) == {"1", "4"}
@@ -0,0 +1,37 @@
+import sidr
+import sidr.metrics
+import json
+import time
+
+
+def slowBatches():
+    for size in [3, 4]:
+        time.sleep(0.05)
+        yield list(range(size))
+
+
+def test_Recorder(tmpdir):
+    recorder = sidr.metrics.Recorder(profileStage="predict", profileDir=str(tmpdir))
+    with recorder.stage("fasta") as record:
+        record["items"] = 10
+    with recorder.stage("output", 7):
+        batches = list(recorder.timed("predict", slowBatches()))
+    assert [len(batch) for batch in batches] == [3, 4]
+    stages = json.loads(recorder.toJSON())
+    assert [stage["stage"] for stage in stages] == ["fasta", "predict", "output"]
+    fasta, predict, output = stages
+    assert fasta["items"] == 10 and fasta["throughput"] > 0
+    assert predict["items"] == 7 and predict["wall"] >= 0.1
+    assert output["wall"] < 0.05  # time spent predicting is not counted twice
+    assert all(stage["peakRSS"] > 0 for stage in stages)
+    assert all(sorted(stage) == sorted(output) for stage in stages)  # timed stages have the same fields
+    assert output["started"] <= predict["started"] <= predict["finished"] <= output["finished"]
+    assert tmpdir.join("sidr-predict.prof").check()
+    assert tmpdir.join("sidr-predict.tracemalloc.txt").check()
+    assert not tmpdir.join("sidr-fasta.prof").check()
+    assert recorder.table().splitlines()[0].split()[:3] == ["Stage", "Items", "Wall"]
+
+
+def test_formatTable():
+    table = sidr.metrics.formatTable([["tree", "1.0"], ["forest", ""]], ["Classifier", "Accuracy"])
+    assert table.splitlines() == ["Classifier  Accuracy", "tree        1.0", "forest"]
@@ -0,0 +1,33 @@
+import sidr
+import sidr.common
+import sidr.predict
+import numpy
+import pytest
+
+
+@pytest.fixture
+def model():
+    X = numpy.array([[0.1, 5], [0.9, 5]] * 5, dtype=numpy.float32)
+    classifier = sidr.common.buildClassifier("tree").fit(X, [0, 1] * 5)
+    return sidr.common.Model(classifier, ["GC", "Coverage"], ["low", "high"], "phylum", "low", False, None)
+
+
+def test_testData(model):
+    contigs = sidr.common.ContigStore(["b", "a"], ["Coverage", "Length", "GC"])
+    contigs.X[:] = [[5, 100, 0.9], [5, 200, 0.1]]
+    testdata = sidr.predict.testData(model, contigs)
+    assert list(testdata.contigids) == ["a", "b"]
+    assert numpy.allclose(testdata.X, [[0.1, 5], [0.9, 5]])
+    with pytest.raises(ValueError):
+        sidr.predict.testData(model, sidr.common.ContigStore(["a"], ["GC"]))
+
+
+def test_runAnalysis(model, tmpdir):
+    sidr.common.saveModel(str(tmpdir.join("model")), model)
+    tmpdir.join("run.csv").write("ID,GC,Coverage,Covered_bases,Plus_reads,Minus_reads\nc1,0.1,5,0,0,0\nc2,0.9,5,0,0,0\n")
+    with pytest.raises(ValueError):
+        sidr.predict.readContigs(model, tmpdir.join("missing.fa"))
+    sidr.predict.runAnalysis(str(tmpdir.join("model")), str(tmpdir.join("out")), str(tmpdir.join("keep")), "",
+                             infile=str(tmpdir.join("run.csv")))
+    assert tmpdir.join("out").read().splitlines() == ["contigid, classification, source", "c1, low, dt", "c2, high, dt"]
+    assert tmpdir.join("keep").read().split() == ["c1"]
@@ -1,4 +1,8 @@
 import sidr
+import sidr.common
+import sidr.runfile
+import numpy
+import pandas
 import pytest
 import mock
 
@@ -6,4 +10,67 @@ from contextlib import closing
 try:  # https://stackoverflow.com/questions/11914472/stringio-in-python3
     from StringIO import StringIO
 except ImportError:
-    from io import StringIO
\ No newline at end of file
+    from io import StringIO
+
+test_runfile = """ID,Avg_fold,Length,Ref_GC,Covered_percent,Covered_bases,Plus_reads,Minus_reads,Read_GC,Origin
+1,20,575,0.600,99,575,1,1,0.5,phy
+2,10,400,0.400,,400,1,1,0.4,0
+3,30,300,0.300,98,300,1,1,0.3,mergephy
+4,30,300,0.300,98,300,1,1,0.3,
+5,20,575,0.600,99,575,1,1,0.5,phy
+"""
+
+
+@pytest.mark.parametrize("chunkSize", [2, 1000])
+def test_readRunfile(tmpdir, taxdump, chunkSize):
+    tmpdir.join("run.csv").write(test_runfile)
+    tax = sidr.common.parseTaxdump(taxdump)
+    contigs = sidr.runfile.readRunfile(str(tmpdir.join("run.csv")), lambda origins: tax, "phylum", chunkSize)
+    assert list(contigs.contigids) == ["1", "2", "3", "4", "5"]
+    assert contigs.features == ["Avg_fold", "Length", "Ref_GC", "Covered_percent", "Read_GC"]
+    assert contigs.X.dtype == numpy.float32
+    assert list(contigs.column("Covered_percent")) == [99, 0, 98, 98, 99]
+    assert [contigs.classification(x) for x in ["1", "2", "3", "4", "5"]] == ["phy", False, "mergephy", False, "phy"]
+    unclassified = sidr.runfile.readRunfile(str(tmpdir.join("run.csv")), chunkSize=chunkSize)
+    assert numpy.array_equal(unclassified.X, contigs.X) and not unclassified.classList
+    tmpdir.join("bad.csv").write(test_runfile.replace("mergephy", "unknown"))
+    with pytest.raises(Exception):
+        sidr.runfile.readRunfile(str(tmpdir.join("bad.csv")), lambda origins: tax, "phylum", chunkSize)
+
+
+def test_readRunfile_lazy(tmpdir, taxdump):
+    tmpdir.join("run.csv").write(test_runfile)
+    loaded = []
+
+    def loadTaxdump(origins):
+        loaded.append(sorted(origins))
+        return sidr.common.parseTaxdump(taxdump, names=origins)
+    contigs = sidr.runfile.readRunfile(str(tmpdir.join("run.csv")), loadTaxdump, "phylum")
+    assert loaded == [["mergephy", "phy"]]
+    assert [contigs.classification(x) for x in ["1", "2", "3", "4", "5"]] == ["phy", False, "mergephy", False, "phy"]
+
+
+def test_readRunfile_parquet(tmpdir, taxdump):
+    pytest.importorskip("pyarrow")
+    tmpdir.join("run.csv").write(test_runfile)
+    pandas.read_csv(str(tmpdir.join("run.csv")), dtype={"ID": str, "Origin": str}).to_parquet(str(tmpdir.join("run.parquet")))
+    tax = sidr.common.parseTaxdump(taxdump)
+    contigs = sidr.runfile.readRunfile(str(tmpdir.join("run.parquet")), lambda origins: tax, "phylum")
+    assert [contigs.classification(x) for x in ["1", "2", "3", "4", "5"]] == ["phy", False, "mergephy", False, "phy"]
+
+
+def test_readRunfile_schema(tmpdir, taxdump):
+    tmpdir.join("run.csv").write("contig,GC,Depth,Length,Class\n1,0.5,10,100,phy\n2,0.4,20,200,0\n")
+    tax = sidr.common.parseTaxdump(taxdump)
+    schema = sidr.runfile.Schema("contig", "Class", ["Depth", "GC"])
+    assert sidr.runfile.resolveSchema(str(tmpdir.join("run.csv")), schema) == (["Depth", "GC"], "Class")
+    contigs = sidr.runfile.readRunfile(str(tmpdir.join("run.csv")), lambda origins: tax, "phylum", schema=schema)
+    assert contigs.features == ["Depth", "GC"]
+    assert contigs.X.tolist() == [[10, 0.5], [20, 0.4000000059604645]]
+    assert [contigs.classification(x) for x in ["1", "2"]] == ["phy", False]
+    contigs = sidr.runfile.readRunfile(str(tmpdir.join("run.csv")), schema=sidr.runfile.Schema("contig", "Class", None))
+    assert contigs.features == ["GC", "Depth", "Length"]  # no Covered_bases, Plus_reads or Minus_reads to drop
+    with pytest.raises(ValueError):
+        sidr.runfile.readRunfile(str(tmpdir.join("run.csv")), schema=sidr.runfile.Schema("contig", "Class", ["Coverage"]))
+    with pytest.raises(ValueError):
+        sidr.runfile.readRunfile(str(tmpdir.join("run.csv")))
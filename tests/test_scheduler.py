@@ -0,0 +1,51 @@
+import sidr
+import sidr.metrics
+import sidr.scheduler
+import pytest
+import time
+
+
+def slowRange(count, delay):
+    time.sleep(delay)
+    return list(range(count))
+
+
+def total(left, right):
+    return sum(left) + sum(right)
+
+
+def broken(values):
+    raise ValueError("broken stage")
+
+
+def stages(delay):
+    return [sidr.scheduler.Stage("left", slowRange, dict(count=3, delay=delay)),
+            sidr.scheduler.Stage("right", slowRange, dict(count=4, delay=delay)),
+            sidr.scheduler.Stage("total", total, {}, dict(left="left", right="right"), None)]
+
+
+@pytest.mark.parametrize("concurrent", [True, False])
+def test_runStages(concurrent):
+    recorder = sidr.metrics.Recorder()
+    finished = []
+    results = sidr.scheduler.runStages(stages(0.2), recorder, concurrent=concurrent, onResult=lambda name, result: finished.append(name))
+    assert results == {"left": [0, 1, 2], "right": [0, 1, 2, 3], "total": 9}
+    assert finished[-1] == "total" and sorted(finished) == ["left", "right", "total"]
+    assert dict((record["stage"], record["items"]) for record in recorder.stages) == {"left": 3, "right": 4, "total": None}
+    records = dict((record["stage"], record) for record in recorder.stages)
+    left, right, total = records["left"], records["right"], records["total"]
+    assert total["started"] >= max(left["finished"], right["finished"])
+    overlap = left["started"] < right["finished"] and right["started"] < left["finished"]
+    assert overlap == concurrent  # the independent stages run side by side only when concurrent
+
+
+def test_runStages_done():
+    results = sidr.scheduler.runStages(stages(0), done={"left": [10]})
+    assert results["total"] == 16
+
+
+def test_runStages_errors():
+    with pytest.raises(ValueError, match="broken stage"):
+        sidr.scheduler.runStages(stages(0) + [sidr.scheduler.Stage("broken", broken, {}, dict(values="left"))])
+    with pytest.raises(ValueError, match="never run"):
+        sidr.scheduler.runStages([sidr.scheduler.Stage("total", total, {}, dict(left="left", right="missing"))])
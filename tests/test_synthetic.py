@@ -0,0 +1,37 @@
+import sidr
+import sidr.benchmark
+import sidr.common
+import sidr.synthetic
+import json
+import os
+import pysam
+
+
+def test_generate(tmpdir):
+    dataset = sidr.synthetic.generate(str(tmpdir), contigs=30, phyla=2, meanLength=1000, classified=0.5)
+    assert dataset.target == "Phylum0"
+    taxdump = sidr.common.parseTaxdump(dataset.taxdump)
+    assert taxdump.lineage(sidr.synthetic.speciesTaxid(1, 3), "phylum") == "Phylum1"
+    assert taxdump.lineage(sidr.synthetic.speciesTaxid(1, 3) + sidr.synthetic.MERGED_BASE, "phylum") == "Phylum1"
+    with pysam.AlignmentFile(dataset.bam, "rb") as bam:
+        assert bam.nreferences == 30
+        assert bam.mapped > 0
+    with open(dataset.runfile) as runfile:
+        assert len(runfile.read().splitlines()) == 31
+    again = sidr.synthetic.generate(str(tmpdir.join("again")), contigs=30, phyla=2, meanLength=1000, classified=0.5)
+    with open(dataset.fasta) as first, open(again.fasta) as second:
+        assert first.read() == second.read()
+
+
+def test_benchmarkStages(tmpdir):
+    dataset = sidr.synthetic.generate(str(tmpdir), contigs=40, meanLength=1000)
+    assert all(os.path.isfile(path) for path in sidr.synthetic.datasetFiles(dataset))
+    recorder = sidr.benchmark.benchmarkStages(dataset, estimator="tree")
+    assert "classifications.txt" not in os.listdir(str(tmpdir))  # classified into a temporary directory
+    stages = json.loads(recorder.toJSON())
+    assert [stage["stage"] for stage in stages] == ["taxdump", "fasta", "bam", "blast", "corpus", "train", "predict", "output", "runfile"]
+    assert all(stage["wall"] >= 0 and stage["peakRSS"] > 0 for stage in stages)
+    assert stages[1]["items"] == 40
+    assert recorder.table().splitlines()[1].startswith("taxdump")
+    sidr.benchmark.benchmarkStages(dataset, estimator="tree", output=str(tmpdir.join("classifications.txt")))
+    assert tmpdir.join("classifications.txt").check()
@@ -0,0 +1,141 @@
+import os
+import sidr
+import numpy
+import pytest
+import tarfile
+
+from sidr import taxonomy
+
+
+def test_compileTaxdump(taxdump):
+    index = taxonomy.loadIndex(taxdump)
+    assert os.path.isfile(os.path.join(taxdump, taxonomy.INDEX_NAME, "manifest.json"))
+    assert list(index["parent"]) == [0, 1, 1, 1, 0, 3]
+    assert [index["ranks"][code] for code in index["rank"][1:4]] == ["no rank", "phylum", "phylum"]
+    assert index["flags"][4] == taxonomy.FLAG_PRESENT | taxonomy.FLAG_DELETED
+    assert index["flags"][5] == taxonomy.FLAG_PRESENT | taxonomy.FLAG_MERGED
+    assert index["nameIndex"][2] == 1
+    assert list(index["nameTaxid"]) == [1, 2, 2, 3]
+
+
+def test_loadIndex_rebuild(taxdump):
+    taxonomy.loadIndex(taxdump)
+    indexDir = taxonomy.indexPath(taxdump)
+    assert taxonomy.isCurrent(indexDir, taxdump)
+    with open(os.path.join(taxdump, "delnodes.dmp"), "a") as delnodes:
+        delnodes.write("\n6 |\n")
+    assert not taxonomy.isCurrent(indexDir, taxdump)
+    index = taxonomy.loadIndex(taxdump)
+    assert index["flags"][6] == taxonomy.FLAG_PRESENT | taxonomy.FLAG_DELETED
+
+
+def test_Taxonomy(taxdump):
+    tax = taxonomy.load(taxdump)
+    assert len(tax) == 5
+    assert 3 in tax and 6 not in tax and -1 not in tax
+    assert tax.resolve(5) == 3
+    assert tax.lineage(5, "Phylum") == "mergephy"
+    assert tax.lineage(2, "class") == "nohit"
+    assert tax.name(2) is tax.name(2)  # names are interned
+    with pytest.raises(Exception) as excinfo:
+        tax.lineage(6, "phylum")
+    assert "Taxon id 6 was not found in the NCBI DB." in str(excinfo.value)
+
+
+def test_taxidsForNames(taxdump):
+    tax = taxonomy.load(taxdump)
+    assert tax.taxidsForNames(["phy", "phylum synonym", "mergephy", "missing"]) == {"phy": 2, "phylum synonym": 2, "mergephy": 3}
+
+
+def test_lineages(taxdump):
+    tax = taxonomy.load(taxdump)
+    assert list(tax.rankTable("phylum")) == [-1, 0, 2, 3, -1, 3]
+    assert list(tax.lineages([2, 5, 3, 1, 2], "phylum")) == ["phy", "mergephy", "mergephy", "nohit", "phy"]
+    assert tax.rankTable("phylum") is tax.rankTable("PHYLUM")
+    with pytest.raises(Exception) as excinfo:
+        tax.lineages([2, 4], "phylum")
+    assert "ERROR: Taxon id 4 has been deleted from the NCBI DB." in str(excinfo.value)
+
+
+@pytest.mark.parametrize("loader", [taxonomy.load, lambda blastdb: taxonomy.loadLazy(blastdb, taxids=[2, 5])])
+def test_lineages_unnamed(taxdump, loader):
+    with open(os.path.join(taxdump, "names.dmp")) as names:
+        lines = [line for line in names if "mergephy" not in line]
+    with open(os.path.join(taxdump, "names.dmp"), "w") as names:
+        names.writelines(lines)
+    tax = loader(taxdump)
+    assert tax.lineage(2, "phylum") == "phy"
+    with pytest.raises(Exception) as excinfo:
+        tax.lineages([2, 5], "phylum")
+    assert "Taxon id 3, the phylum of taxid 5, has no scientific name in the NCBI DB." in str(excinfo.value)
+
+
+def test_observedIndex(taxdump):
+    index = taxonomy.observedIndex(taxdump, taxids=[5, 6, 10 ** 12], names=["phylum synonym"])
+    assert list(index["taxids"]) == [-1, 1, 2, 3, 5]  # unknown taxids take up no room
+    assert list(index["flags"] != 0) == [False, True, True, True, True]
+    assert list(index["parent"]) == [0, 1, 1, 1, 3]  # positions, not taxids
+    assert list(index["nameTaxid"]) == [1, 2, 2, 3]  # scientific names on the lineages, and the names asked for
+    assert not os.path.isdir(os.path.join(taxdump, taxonomy.INDEX_NAME))
+
+
+def test_loadLazy(taxdump):
+    tax = taxonomy.loadLazy(taxdump, taxids=[2, 5, 4])
+    assert tax.lazy and len(tax) == 5  # 1, 2, 3, 4 and 5
+    assert list(tax.lineages([2, 5, 2], "phylum")) == ["phy", "mergephy", "phy"]
+    assert not tax._rankTables
+    with pytest.raises(Exception) as excinfo:
+        tax.lineages([4], "phylum")
+    assert "ERROR: Taxon id 4 has been deleted from the NCBI DB." in str(excinfo.value)
+    with pytest.raises(Exception) as excinfo:
+        tax.lineages([6], "phylum")
+    assert "Taxon id 6 was not found in the NCBI DB." in str(excinfo.value)
+    tax = taxonomy.loadLazy(taxdump, taxids=[3, 10 ** 12])
+    assert len(tax.flags) == 3 and 10 ** 12 not in tax
+    with pytest.raises(Exception) as excinfo:
+        tax.lineages([10 ** 12], "phylum")
+    assert "was not found in the NCBI DB." in str(excinfo.value)
+    assert taxonomy.loadLazy(taxdump, names=["mergephy"]).taxidsForNames(["mergephy"]) == {"mergephy": 3}
+    taxonomy.loadIndex(taxdump)
+    tax = taxonomy.loadLazy(taxdump, taxids=[5])  # a current index is memory-mapped instead
+    assert len(tax) == 5 and tax.lineage(5, "phylum") == "mergephy"
+
+
+@pytest.fixture
+def archive(taxdump, tmpdir):
+    path = str(tmpdir.join("taxdump.tar.gz"))
+    with tarfile.open(path, "w:gz") as tar:
+        tar.add(os.path.join(taxdump, "readme.txt"), "readme.txt")
+        for name in reversed(taxonomy.TAXDUMP_FILES):
+            tar.add(os.path.join(taxdump, name), name)
+    return path
+
+
+def test_taxdumpFiles(taxdump, archive):
+    assert [name for name, lines in taxonomy.taxdumpFiles(archive)] == list(reversed(taxonomy.TAXDUMP_FILES))
+    assert ["".join(lines) for name, lines in taxonomy.taxdumpFiles(archive, ["merged.dmp"])] == [open(os.path.join(taxdump, "merged.dmp")).read()]
+    with pytest.raises(IOError):
+        list(taxonomy.taxdumpFiles(archive, ["gencode.dmp"]))
+
+
+def test_load_archive(archive, tmpdir):
+    tax = taxonomy.load(archive)
+    assert taxonomy.isCurrent(str(tmpdir.join("taxdump.sidr.index")), archive)
+    assert len(tax) == 5 and tax.lineage(5, "phylum") == "mergephy"
+    assert list(tax.parent[1:6]) == [1, 1, 1, 0, 3]
+    assert taxonomy.observedIndex(archive, taxids=[5])["nameTaxid"].tolist() == [1, 3]
+
+
+def test_observedIndex_archive(taxdump, tmpdir, monkeypatch):
+    path = str(tmpdir.join("names-first.tar.gz"))
+    with tarfile.open(path, "w:gz") as tar:
+        for name in taxonomy.TAXDUMP_FILES:  # names.dmp before the nodes whose lineages pick its names
+            tar.add(os.path.join(taxdump, name), name)
+    passes = []
+    taxdumpFiles = taxonomy.taxdumpFiles
+    monkeypatch.setattr(taxonomy, "taxdumpFiles", lambda *args: passes.append(args) or taxdumpFiles(*args))
+    index = taxonomy.observedIndex(path, taxids=[5, 6], names=["phylum synonym"])
+    expected = taxonomy.observedIndex(taxdump, taxids=[5, 6], names=["phylum synonym"])
+    assert len(passes) == 2  # one each
+    assert index["ranks"] == expected.pop("ranks")
+    assert all(numpy.array_equal(index[key], expected[key]) for key in expected)
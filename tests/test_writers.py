@@ -0,0 +1,39 @@
+import sidr
+import sidr.writers
+import gzip
+import numpy
+import pytest
+
+
+@pytest.mark.parametrize("path,expected", [("out.txt", "text"), ("out", "text"), ("out.tsv", "tsv"), ("out.TSV.gz", "tsv"),
+                                           ("out.tsv.zst", "tsv"), ("out.parquet", "parquet"), ("out.txt.gz", "text")])
+def test_outputFormat(path, expected):
+    assert sidr.writers.outputFormat(path) == expected
+
+
+def writeRows(path):
+    writer = sidr.writers.openWriter(path, ["a", "b"])
+    writer.write(numpy.array(["1", "2"], dtype=object), numpy.array(["a", "b"], dtype=object), "input")
+    writer.write(numpy.array(["3"], dtype=object), numpy.array(["b"], dtype=object), "dt", numpy.array([[0.25, 0.75]], dtype=numpy.float32))
+    writer.close()
+
+
+def test_TextWriter(tmpdir):
+    writeRows(str(tmpdir.join("out.txt.gz")))
+    with gzip.open(str(tmpdir.join("out.txt.gz")), "rt") as out:
+        assert out.read().splitlines() == ["contigid, classification, source", "1, a, input", "2, b, input", "3, b, dt"]
+
+
+def test_TSVWriter(tmpdir):
+    writeRows(str(tmpdir.join("out.tsv")))
+    assert tmpdir.join("out.tsv").read().splitlines() == ["contigid\tclassification\tsource\tp_a\tp_b", "1\ta\tinput\t\t", "2\tb\tinput\t\t", "3\tb\tdt\t0.25\t0.75"]
+
+
+def test_ParquetWriter(tmpdir):
+    pandas = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    writeRows(str(tmpdir.join("out.parquet")))
+    table = pandas.read_parquet(str(tmpdir.join("out.parquet")))
+    assert list(table.columns) == ["contigid", "classification", "source", "p_a", "p_b"]
+    assert list(table["contigid"]) == ["1", "2", "3"]
+    assert table["p_b"].iloc[2] == 0.75 and numpy.isnan(table["p_a"].iloc[0])